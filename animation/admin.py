@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import AnimationProject, Frame
+from .models import AnimationProject, Blob, Frame, Job
 
 
 class FrameInline(admin.TabularInline):
@@ -16,5 +16,17 @@ class AnimationProjectAdmin(admin.ModelAdmin):
 
 @admin.register(Frame)
 class FrameAdmin(admin.ModelAdmin):
-    list_display = ('id', 'project', 'index', 'created_at')
+    list_display = ('id', 'project', 'position', 'created_at')
     list_filter = ('project',)
+
+
+@admin.register(Blob)
+class BlobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'sha256', 'size', 'refcount', 'created_at')
+    search_fields = ('sha256',)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'project', 'status', 'attempts', 'progress_done', 'progress_total', 'created_at')
+    list_filter = ('kind', 'status')
@@ -0,0 +1,73 @@
+import hashlib
+from collections import Counter
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import F
+
+from .jobs import enqueue_job
+from .models import Blob
+
+
+def blob_path(sha256, extension):
+    # два уровня каталогов, чтобы в одной папке не копились сотни тысяч файлов
+    return f'blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}.{extension}'
+
+
+def store_blob(data, extension='png'):
+    """
+    Возвращает блоб с содержимым data, записывая файл только если таких байтов ещё нет.
+    refcount не меняется — ссылки учитывает вызывающий код (retain_blobs / release_blobs).
+    Найденный блоб без ссылок может удалить сборка мусора, пока ссылка не поставлена,
+    поэтому set_frame_preview ставит её условным UPDATE.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    blob = Blob.objects.filter(sha256=digest).first()
+    if blob is not None:
+        return blob
+
+    name = blob_path(digest, extension)
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(data))
+    blob, created = Blob.objects.get_or_create(sha256=digest, defaults={'file': name, 'size': len(data)})
+    if created:
+        # миниатюры для таймлайна строит воркер run_jobs, а не запрос сохранения
+        enqueue_job('thumbnails', {'blob_ids': [blob.pk]})
+    return blob
+
+
+def retain_blobs(blob_ids):
+    """Прибавляет ссылки: один UPDATE на каждый разный блоб, а не на каждый кадр."""
+    for blob_id, count in Counter(blob_id for blob_id in blob_ids if blob_id).items():
+        Blob.objects.filter(pk=blob_id).update(refcount=F('refcount') + count)
+
+
+def release_blobs(blob_ids):
+    """Снимает ссылки. Файлы блобов с нулём ссылок удаляет сборка мусора, а не этот код."""
+    for blob_id, count in Counter(blob_id for blob_id in blob_ids if blob_id).items():
+        Blob.objects.filter(pk=blob_id, refcount__gte=count).update(refcount=F('refcount') - count)
+
+
+def release_frame_previews(frames):
+    """Снимает ссылки превью перед удалением кадров (queryset); вызывать до delete()."""
+    release_blobs(frames.exclude(preview_blob=None).values_list('preview_blob_id', flat=True))
+
+
+def set_frame_preview(frame, data, extension='png'):
+    """
+    Направляет превью кадра на блоб с этими байтами. Кадр не сохраняется;
+    вызывать в той же транзакции, что и frame.save().
+    Возвращает False, если превью не изменилось (те же байты) — тогда можно не писать кадр.
+    """
+    blob = store_blob(data, extension)
+    if frame.preview_blob_id == blob.pk:
+        return False
+    # ссылка ставится условным UPDATE: блоб без ссылок мог удалить gc_media между выборкой
+    # и этой строкой — тогда UPDATE ничего не изменит, и блоб заводится заново
+    if not Blob.objects.filter(pk=blob.pk).update(refcount=F('refcount') + 1):
+        blob = store_blob(data, extension)
+        retain_blobs([blob.pk])
+    release_blobs([frame.preview_blob_id])
+    frame.preview_blob = blob
+    frame.preview_image.name = blob.file.name
+    return True
@@ -0,0 +1,488 @@
+"""
+Кодирование кадров экспорта без Django: этот модуль импортируют процессы пула,
+поэтому здесь только Pillow и стандартная библиотека.
+
+Анимационные писатели Pillow (GIF, APNG, WebP) собирают все кадры в список до записи.
+Поэтому каждый кадр кодируется отдельной картинкой в процессе пула, а писатели ниже
+дописывают его куски в контейнер по мере поступления: в памяти всегда один кадр.
+"""
+import abc
+import io
+import json
+import math
+import os
+import struct
+import subprocess
+import tempfile
+import zipfile
+import zlib
+
+from PIL import Image
+
+# фон, на который кладутся прозрачные пиксели там, где формат не умеет альфу (MP4)
+FLATTEN_BACKGROUND = (255, 255, 255)
+# GIF: пиксель с альфой ниже порога становится прозрачным, остальные — непрозрачными
+GIF_ALPHA_THRESHOLD = 128
+GIF_TRANSPARENT_INDEX = 255
+WEBP_METHOD = 4
+
+
+class ExportError(Exception):
+    pass
+
+
+def duration_ticks(index, fps, ticks_per_second):
+    """
+    Длительность кадра index в тиках формата (сотые доли секунды у GIF, мс у WebP).
+    Округляется накопленное время, а не каждый кадр: 12 fps в GIF — это 8, 8, 9, 8, 8, 9 …,
+    и за секунду набегает ровно секунда, а не 0.96.
+    """
+    return round((index + 1) * ticks_per_second / fps) - round(index * ticks_per_second / fps)
+
+
+def render_frame(data, size, frame_format):
+    """
+    Байты превью (или None — пустой кадр) -> кадр размера size, закодированный для писателя.
+    Выполняется в процессе пула: принимает и возвращает только байты.
+    """
+    if data:
+        with Image.open(io.BytesIO(data)) as source:
+            image = source.convert('RGBA')
+    else:
+        image = Image.new('RGBA', size, (0, 0, 0, 0))
+    if image.size != size:
+        # уменьшение сглаживаем, а увеличение делаем без размытия — рисунок остаётся чётким
+        shrinking = image.width * image.height > size[0] * size[1]
+        image = image.resize(size, Image.Resampling.LANCZOS if shrinking else Image.Resampling.NEAREST)
+    return FRAME_ENCODERS[frame_format](image)
+
+
+def encode_gif(image):
+    alpha = image.getchannel('A')
+    paletted = image.convert('RGB').quantize(colors=GIF_TRANSPARENT_INDEX, method=Image.Quantize.MEDIANCUT)
+    transparent = alpha.point(lambda value: 255 if value < GIF_ALPHA_THRESHOLD else 0)
+    if transparent.getbbox():
+        paletted.paste(GIF_TRANSPARENT_INDEX, mask=transparent)
+    # прозрачный индекс объявляется и у непрозрачных кадров: иначе при disposal 2
+    # часть декодеров (тот же Pillow) стирает кадр не в прозрачность, а в цвет фона из палитры
+    buffer = io.BytesIO()
+    paletted.save(buffer, format='GIF', transparency=GIF_TRANSPARENT_INDEX)
+    return buffer.getvalue()
+
+
+def encode_png(image):
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def encode_webp(image):
+    buffer = io.BytesIO()
+    # рисунки — плоские заливки и линии: без потерь они и чище, и обычно меньше
+    image.save(buffer, format='WEBP', lossless=True, method=WEBP_METHOD)
+    return buffer.getvalue()
+
+
+def encode_rgba(image):
+    return image.tobytes()
+
+
+def encode_rgb(image):
+    background = Image.new('RGB', image.size, FLATTEN_BACKGROUND)
+    background.paste(image, mask=image.getchannel('A'))
+    return background.tobytes()
+
+
+FRAME_ENCODERS = {
+    'gif': encode_gif,
+    'png': encode_png,
+    'webp': encode_webp,
+    'rgba': encode_rgba,
+    'rgb': encode_rgb,
+}
+
+
+class AnimationWriter(abc.ABC):
+    """
+    Общий вид писателей: add_frame(байты от render_frame) по порядку, затем close().
+    abort() закрывает и удаляет недописанный файл.
+    """
+
+    frame_format = None
+
+    def __init__(self, path, size, fps, frame_count):
+        self.path = path
+        self.size = size
+        self.fps = fps
+        self.frame_count = frame_count
+        self.written = 0
+
+    @abc.abstractmethod
+    def add_frame(self, data):
+        """Дописывает очередной кадр."""
+
+    @abc.abstractmethod
+    def close(self):
+        """Завершает файл; после close() писатель больше не используется."""
+
+    def abort(self):
+        try:
+            self.discard()
+        finally:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def discard(self):
+        pass
+
+
+class StreamWriter(AnimationWriter):
+    """Писатель, который пишет контейнер в открытый файл."""
+
+    def __init__(self, path, size, fps, frame_count):
+        super().__init__(path, size, fps, frame_count)
+        self.file = open(path, 'wb')
+
+    def close(self):
+        self.finish()
+        self.file.close()
+
+    def finish(self):
+        pass
+
+    def discard(self):
+        self.file.close()
+
+
+def skip_gif_sub_blocks(data, pos):
+    """Позиция за терминатором цепочки под-блоков GIF, начинающейся с pos."""
+    while True:
+        length = data[pos]
+        pos += 1 + length
+        if not length:
+            return pos
+
+
+def read_gif_frame(data):
+    """
+    Разбирает одиночный GIF от encode_gif.
+    -> (прозрачный индекс или None, дескриптор изображения, палитра, биты размера палитры, данные LZW)
+    """
+    if data[:6] not in (b'GIF87a', b'GIF89a'):
+        raise ExportError('Кадр не является GIF.')
+    pos = 6
+    flags = data[pos + 4]
+    pos += 7
+    table, table_bits = b'', 0
+    if flags & 0x80:
+        table_bits = flags & 0x07
+        table_length = 3 << (table_bits + 1)
+        table = data[pos:pos + table_length]
+        pos += table_length
+
+    transparency = None
+    while pos < len(data):
+        block = data[pos]
+        if block == 0x21:
+            label = data[pos + 1]
+            pos += 2
+            if label == 0xF9 and data[pos + 1] & 0x01:
+                transparency = data[pos + 4]
+            pos = skip_gif_sub_blocks(data, pos)
+        elif block == 0x2C:
+            left, top, width, height, packed = struct.unpack_from('<HHHHB', data, pos + 1)
+            pos += 10
+            if packed & 0x80:
+                table_bits = packed & 0x07
+                table_length = 3 << (table_bits + 1)
+                table = data[pos:pos + table_length]
+                pos += table_length
+            if not table:
+                raise ExportError('В кадре GIF нет палитры.')
+            start = pos
+            # байт минимального размера кода LZW, затем под-блоки данных
+            pos = skip_gif_sub_blocks(data, pos + 1)
+            return transparency, (left, top, width, height, packed & 0x40), table, table_bits, data[start:pos]
+        else:
+            break
+    raise ExportError('В кадре GIF нет изображения.')
+
+
+class GifWriter(StreamWriter):
+    """
+    GIF89a с бесконечным повтором. Глобальная палитра одиночного кадра становится
+    локальной палитрой кадра анимации, так что у каждого кадра свои 256 цветов.
+    """
+
+    frame_format = 'gif'
+
+    def __init__(self, path, size, fps, frame_count):
+        super().__init__(path, size, fps, frame_count)
+        width, height = size
+        self.file.write(b'GIF89a' + struct.pack('<HHBBB', width, height, 0, 0, 0))
+        # NETSCAPE2.0: число повторов 0 — крутить без конца
+        self.file.write(b'\x21\xff\x0bNETSCAPE2.0\x03\x01' + struct.pack('<H', 0) + b'\x00')
+
+    def add_frame(self, data):
+        transparency, descriptor, table, table_bits, image_data = read_gif_frame(data)
+        left, top, width, height, interlace = descriptor
+        # disposal 2: после показа кадр стирается, иначе он просвечивал бы сквозь прозрачные пиксели следующего
+        packed = (2 << 2) | (1 if transparency is not None else 0)
+        delay = duration_ticks(self.written, self.fps, 100)
+        self.file.write(b'\x21\xf9\x04' + struct.pack('<BHB', packed, delay, transparency or 0) + b'\x00')
+        self.file.write(b'\x2c' + struct.pack('<HHHHB', left, top, width, height, 0x80 | interlace | table_bits))
+        self.file.write(table)
+        self.file.write(image_data)
+        self.written += 1
+
+    def finish(self):
+        self.file.write(b'\x3b')
+
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def read_png_chunks(data):
+    if not data.startswith(PNG_SIGNATURE):
+        raise ExportError('Кадр не является PNG.')
+    pos = len(PNG_SIGNATURE)
+    while pos + 8 <= len(data):
+        length, kind = struct.unpack_from('>I4s', data, pos)
+        yield kind, data[pos + 8:pos + 8 + length]
+        pos += 12 + length
+
+
+def png_chunk(kind, body):
+    return struct.pack('>I', len(body)) + kind + body + struct.pack('>I', zlib.crc32(kind + body))
+
+
+class ApngWriter(StreamWriter):
+    """
+    APNG: IDAT первого кадра остаются как есть (его покажут и программы без APNG),
+    IDAT следующих переписываются в fdAT. Задержка — точная дробь 1/fps.
+    """
+
+    frame_format = 'png'
+
+    def __init__(self, path, size, fps, frame_count):
+        super().__init__(path, size, fps, frame_count)
+        self.header = None
+        self.sequence = 0
+
+    def add_frame(self, data):
+        chunks = list(read_png_chunks(data))
+        header = next((body for kind, body in chunks if kind == b'IHDR'), None)
+        if self.header is None:
+            self.header = header
+            self.file.write(PNG_SIGNATURE + png_chunk(b'IHDR', header))
+            self.file.write(png_chunk(b'acTL', struct.pack('>II', self.frame_count, 0)))
+        elif header != self.header:
+            raise ExportError('Кадры APNG отличаются размером или форматом пикселей.')
+
+        width, height = self.size
+        # dispose_op 0, blend_op 0: кадр целиком заменяет холст
+        control = struct.pack('>IIIIIHHBB', self.sequence, width, height, 0, 0, 1, self.fps, 0, 0)
+        self.file.write(png_chunk(b'fcTL', control))
+        self.sequence += 1
+        for kind, body in chunks:
+            if kind != b'IDAT':
+                continue
+            if self.written == 0:
+                self.file.write(png_chunk(b'IDAT', body))
+            else:
+                self.file.write(png_chunk(b'fdAT', struct.pack('>I', self.sequence) + body))
+                self.sequence += 1
+        self.written += 1
+
+    def finish(self):
+        if self.header is None:
+            raise ExportError('В анимации нет кадров.')
+        self.file.write(png_chunk(b'IEND', b''))
+
+
+def riff_chunk(kind, body):
+    return kind + struct.pack('<I', len(body)) + body + (b'\x00' if len(body) & 1 else b'')
+
+
+def read_webp_image_chunks(data):
+    """Чанки изображения (ALPH, VP8, VP8L) одиночного WebP — то, что кладётся в ANMF."""
+    if data[:4] != b'RIFF' or data[8:12] != b'WEBP':
+        raise ExportError('Кадр не является WebP.')
+    pos = 12
+    parts = []
+    while pos + 8 <= len(data):
+        kind, length = struct.unpack_from('<4sI', data, pos)
+        end = pos + 8 + length + (length & 1)
+        if kind in (b'ALPH', b'VP8 ', b'VP8L'):
+            parts.append(data[pos:end])
+        pos = end
+    if not parts:
+        raise ExportError('В кадре WebP нет изображения.')
+    return b''.join(parts)
+
+
+def uint24(value):
+    return value.to_bytes(3, 'little')
+
+
+class WebpWriter(StreamWriter):
+    """
+    Анимированный WebP: VP8X + ANIM, затем по ANMF на кадр.
+    Размер RIFF известен только в конце — он дописывается в заголовок при закрытии.
+    """
+
+    frame_format = 'webp'
+
+    def __init__(self, path, size, fps, frame_count):
+        super().__init__(path, size, fps, frame_count)
+        width, height = size
+        self.file.write(b'RIFF' + struct.pack('<I', 0) + b'WEBP')
+        # флаги VP8X: альфа (0x10) и анимация (0x02)
+        self.file.write(riff_chunk(b'VP8X', bytes([0x12, 0, 0, 0]) + uint24(width - 1) + uint24(height - 1)))
+        # фон прозрачный (BGRA), повтор без конца
+        self.file.write(riff_chunk(b'ANIM', bytes(4) + struct.pack('<H', 0)))
+
+    def add_frame(self, data):
+        width, height = self.size
+        duration = duration_ticks(self.written, self.fps, 1000)
+        # флаги кадра: 0x02 — не смешивать с предыдущим, кадр целиком заменяет холст
+        header = uint24(0) + uint24(0) + uint24(width - 1) + uint24(height - 1) + uint24(duration) + b'\x02'
+        self.file.write(riff_chunk(b'ANMF', header + read_webp_image_chunks(data)))
+        self.written += 1
+
+    def finish(self):
+        size = self.file.tell()
+        self.file.seek(4)
+        self.file.write(struct.pack('<I', size - 8))
+        self.file.seek(size)
+
+
+SPRITE_SHEET_IMAGE = 'sprites.png'
+SPRITE_SHEET_ATLAS = 'sprites.json'
+# лист собирается в памяти целиком (4 байта на пиксель), поэтому он ограничен:
+# 64 Мпикс — 256 МБ на RGBA; длинную анимацию лучше экспортировать в видео
+SPRITE_SHEET_MAX_FRAMES = 1024
+SPRITE_SHEET_MAX_PIXELS = 64 * 1024 * 1024
+
+
+class SpriteSheetWriter(AnimationWriter):
+    """
+    ZIP с листом спрайтов (почти квадратная сетка кадров) и JSON-атласом в формате
+    «hash» TexturePacker. Лист целиком держится в памяти до close(), поэтому число
+    кадров и площадь листа ограничены SPRITE_SHEET_MAX_FRAMES и SPRITE_SHEET_MAX_PIXELS.
+    """
+
+    frame_format = 'rgba'
+
+    def __init__(self, path, size, fps, frame_count):
+        super().__init__(path, size, fps, frame_count)
+        if frame_count < 1:
+            raise ExportError('В анимации нет кадров.')
+        if frame_count > SPRITE_SHEET_MAX_FRAMES:
+            raise ExportError(f'В листе спрайтов может быть не больше {SPRITE_SHEET_MAX_FRAMES} кадров.')
+        self.columns = math.ceil(math.sqrt(frame_count))
+        self.rows = math.ceil(frame_count / self.columns)
+        width, height = size
+        if self.columns * width * self.rows * height > SPRITE_SHEET_MAX_PIXELS:
+            raise ExportError(
+                f'Лист спрайтов {self.columns * width}×{self.rows * height} px слишком велик: '
+                'уменьшите размер экспорта.'
+            )
+        self.sheet = Image.new('RGBA', (self.columns * width, self.rows * height), (0, 0, 0, 0))
+        self.frames = {}
+
+    def add_frame(self, data):
+        width, height = self.size
+        row, column = divmod(self.written, self.columns)
+        x, y = column * width, row * height
+        self.sheet.paste(Image.frombytes('RGBA', self.size, data), (x, y))
+        self.frames[f'frame_{self.written + 1:04d}'] = {
+            'frame': {'x': x, 'y': y, 'w': width, 'h': height},
+            'rotated': False,
+            'trimmed': False,
+            'sourceSize': {'w': width, 'h': height},
+            'duration': duration_ticks(self.written, self.fps, 1000),
+        }
+        self.written += 1
+
+    def close(self):
+        atlas = {
+            'frames': self.frames,
+            'meta': {
+                'image': SPRITE_SHEET_IMAGE,
+                'format': 'RGBA8888',
+                'size': {'w': self.sheet.width, 'h': self.sheet.height},
+                'scale': 1,
+                'fps': self.fps,
+                'columns': self.columns,
+                'rows': self.rows,
+            },
+        }
+        with zipfile.ZipFile(self.path, 'w') as archive:
+            # PNG уже сжат — кладём без deflate
+            with archive.open(SPRITE_SHEET_IMAGE, 'w') as image_file:
+                self.sheet.save(image_file, format='PNG')
+            archive.writestr(
+                SPRITE_SHEET_ATLAS,
+                json.dumps(atlas, ensure_ascii=False, indent=2),
+                compress_type=zipfile.ZIP_DEFLATED,
+            )
+        self.sheet = None
+
+
+class Mp4Writer(AnimationWriter):
+    """
+    H.264 через локальный ffmpeg: сырые RGB-кадры идут в stdin, ffmpeg кодирует их потоком.
+    yuv420p требует чётных сторон — нечётные добиваются белой полосой.
+    """
+
+    frame_format = 'rgb'
+
+    def __init__(self, path, size, fps, frame_count, ffmpeg='ffmpeg'):
+        super().__init__(path, size, fps, frame_count)
+        width, height = size
+        # stderr в файл, а не в PIPE: иначе ffmpeg может встать, заполнив буфер, пока мы пишем stdin
+        self.errors = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(
+            [
+                ffmpeg, '-y', '-loglevel', 'error',
+                '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{width}x{height}', '-r', str(fps), '-i', '-',
+                '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2:color=white',
+                '-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-movflags', '+faststart',
+                '-f', 'mp4', path,
+            ],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.DEVNULL,
+            stderr=self.errors,
+        )
+
+    def add_frame(self, data):
+        try:
+            self.process.stdin.write(data)
+        except BrokenPipeError:
+            raise ExportError(f'ffmpeg завершился раньше времени: {self.read_errors()}')
+        self.written += 1
+
+    def read_errors(self):
+        self.errors.seek(0)
+        return self.errors.read().decode('utf-8', 'replace').strip()
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        returncode = self.process.wait()
+        errors = self.read_errors()
+        self.errors.close()
+        if returncode:
+            raise ExportError(f'ffmpeg завершился с кодом {returncode}: {errors}')
+
+    def discard(self):
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        self.process.kill()
+        self.process.wait()
+        self.errors.close()
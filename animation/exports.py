@@ -0,0 +1,147 @@
+import os
+import shutil
+from collections import OrderedDict, deque
+from contextlib import closing
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from .encoders import (
+    ApngWriter,
+    ExportError,
+    GifWriter,
+    Mp4Writer,
+    SpriteSheetWriter,
+    WebpWriter,
+    render_frame,
+)
+
+# формат -> (писатель, расширение файла, MIME-тип, подпись)
+EXPORT_FORMATS = {
+    'gif': (GifWriter, 'gif', 'image/gif', 'GIF'),
+    'apng': (ApngWriter, 'png', 'image/apng', 'APNG'),
+    'webp': (WebpWriter, 'webp', 'image/webp', 'WebP'),
+    'sprites': (SpriteSheetWriter, 'zip', 'application/zip', 'Лист спрайтов + JSON'),
+    'mp4': (Mp4Writer, 'mp4', 'video/mp4', 'MP4 (H.264)'),
+}
+
+# сколько кадров может быть в работе у пула на одного воркера: больше — лишняя память,
+# меньше — воркеры простаивают, пока главный процесс пишет файл
+EXPORT_FRAMES_PER_WORKER = 2
+# одинаковые подряд превью («держащие» кадры — один блоб) кодируются один раз
+EXPORT_REPEAT_CACHE_SIZE = 32
+EXPORT_MAX_SIDE = 4096
+
+
+def ffmpeg_binary():
+    """Путь к ffmpeg: settings.FFMPEG_BINARY или поиск в PATH; None — MP4 недоступен."""
+    binary = getattr(settings, 'FFMPEG_BINARY', None) or 'ffmpeg'
+    return shutil.which(binary)
+
+
+def available_export_formats():
+    return [name for name in EXPORT_FORMATS if name != 'mp4' or ffmpeg_binary()]
+
+
+def export_size(project, width=None, height=None):
+    """Размер кадра экспорта; если задана одна сторона, вторая считается по пропорциям холста."""
+    if width and not height:
+        height = round(project.height * width / project.width)
+    elif height and not width:
+        width = round(project.width * height / project.height)
+    width, height = width or project.width, height or project.height
+    if not (0 < width <= EXPORT_MAX_SIDE and 0 < height <= EXPORT_MAX_SIDE):
+        raise ExportError(f'Размер экспорта должен быть от 1 до {EXPORT_MAX_SIDE} px по каждой стороне.')
+    return width, height
+
+
+def read_preview(name):
+    """Байты превью из хранилища; None — превью нет (кадр экспортируется пустым)."""
+    if not name:
+        return None
+    try:
+        with default_storage.open(name, 'rb') as preview_file:
+            return preview_file.read()
+    except FileNotFoundError:
+        return None
+
+
+def export_worker_count(workers=None):
+    if workers is None:
+        workers = getattr(settings, 'ANIMATION_EXPORT_WORKERS', None) or os.cpu_count() or 1
+    return max(1, workers)
+
+
+def rendered_frames(preview_names, size, frame_format, workers):
+    """
+    Кадры в порядке preview_names, закодированные render_frame.
+    Файлы читает главный процесс, декодирование, масштаб и кодирование — пул процессов.
+    В работе одновременно не больше workers * EXPORT_FRAMES_PER_WORKER кадров,
+    поэтому память не зависит от длины анимации. При одном воркере пул не создаётся.
+    """
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    window = workers * EXPORT_FRAMES_PER_WORKER
+    pending = deque()
+    recent = OrderedDict()
+    try:
+        for name in preview_names:
+            future = recent.get(name)
+            if future is None:
+                data = read_preview(name)
+                if executor is not None:
+                    future = executor.submit(render_frame, data, size, frame_format)
+                else:
+                    future = Future()
+                    future.set_result(render_frame(data, size, frame_format))
+                recent[name] = future
+                if len(recent) > EXPORT_REPEAT_CACHE_SIZE:
+                    recent.popitem(last=False)
+            else:
+                recent.move_to_end(name)
+            pending.append(future)
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+def export_project(project, export_format, path, width=None, height=None, workers=None, progress=None):
+    """
+    Пишет анимацию проекта в файл path: кадры по порядку index, с частотой project.fps.
+    progress(done, total) вызывается после каждого записанного кадра.
+    При ошибке недописанный файл удаляется. Возвращает число кадров.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ExportError(f'Неизвестный формат экспорта: {export_format}')
+    writer_class = EXPORT_FORMATS[export_format][0]
+    writer_options = {}
+    if export_format == 'mp4':
+        writer_options['ffmpeg'] = ffmpeg_binary()
+        if writer_options['ffmpeg'] is None:
+            raise ExportError('Для экспорта в MP4 нужен ffmpeg.')
+
+    size = export_size(project, width, height)
+    # имена файлов превью — единственное, что держится для всех кадров сразу
+    preview_names = list(project.frames.order_by('position').values_list('preview_image', flat=True))
+    total = len(preview_names)
+    if not total:
+        raise ExportError('В проекте нет кадров.')
+
+    writer = writer_class(path, size, max(1, project.fps), total, **writer_options)
+    try:
+        # closing: при ошибке или отмене пул останавливается сразу, а не когда соберут генератор
+        frames = rendered_frames(preview_names, size, writer.frame_format, export_worker_count(workers))
+        with closing(frames):
+            for done, data in enumerate(frames, start=1):
+                writer.add_frame(data)
+                if progress is not None:
+                    progress(done, total)
+        writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+    return total
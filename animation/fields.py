@@ -0,0 +1,113 @@
+import zlib
+
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
+
+try:
+    import zstandard
+except ImportError:  # zstd необязателен: без него пишем zlib
+    zstandard = None
+
+# первый байт значения в базе — формат остальных байтов
+FORMAT_RAW = 0
+FORMAT_ZLIB = 1
+FORMAT_ZSTD = 2
+
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 10
+# короче этого сжатие почти ничего не даёт, а распаковка всё равно стоит времени
+MIN_COMPRESS_BYTES = 256
+
+
+def preferred_format():
+    return FORMAT_ZSTD if zstandard is not None else FORMAT_ZLIB
+
+
+def compress_text(text, data_format=None):
+    """
+    Строка -> байты для базы: [формат][данные]. Пустая строка хранится пустыми байтами,
+    а если сжатие не уменьшило данные — они пишутся как есть (FORMAT_RAW).
+    """
+    if not text:
+        return b''
+    raw = text.encode('utf-8')
+    if len(raw) < MIN_COMPRESS_BYTES:
+        return bytes([FORMAT_RAW]) + raw
+
+    data_format = preferred_format() if data_format is None else data_format
+    if data_format == FORMAT_ZSTD:
+        if zstandard is None:
+            raise ImproperlyConfigured('Для формата zstd нужен пакет zstandard.')
+        packed = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    elif data_format == FORMAT_ZLIB:
+        packed = zlib.compress(raw, ZLIB_LEVEL)
+    else:
+        packed = raw
+        data_format = FORMAT_RAW
+    if len(packed) >= len(raw):
+        return bytes([FORMAT_RAW]) + raw
+    return bytes([data_format]) + packed
+
+
+def stored_format(value):
+    """Формат байтов из базы; None — пустое значение или старый несжатый текст."""
+    if isinstance(value, memoryview):
+        value = value.tobytes()
+    if not isinstance(value, bytes) or not value:
+        return None
+    return value[0]
+
+
+def decompress_text(value):
+    """Байты из базы -> строка. Текст, записанный до сжатия, возвращается как есть."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return value
+    if isinstance(value, memoryview):
+        value = value.tobytes()
+    if not value:
+        return ''
+
+    data_format, payload = value[0], value[1:]
+    if data_format == FORMAT_RAW:
+        raw = payload
+    elif data_format == FORMAT_ZLIB:
+        raw = zlib.decompress(payload)
+    elif data_format == FORMAT_ZSTD:
+        if zstandard is None:
+            raise ImproperlyConfigured('Содержимое сжато zstd: установите пакет zstandard.')
+        raw = zstandard.ZstdDecompressor().decompress(payload)
+    else:
+        raise ValueError(f'Неизвестный формат сжатого текста: {data_format}')
+    return raw.decode('utf-8')
+
+
+class CompressedTextField(models.BinaryField):
+    """
+    Текстовое поле, которое в базе лежит сжатым (zlib, или zstd при наличии zstandard).
+    Python-код читает и пишет обычные строки; сравнение с '' работает,
+    потому что пустая строка хранится пустыми байтами.
+    """
+
+    description = 'Сжатый текст'
+
+    def _check_str_default_value(self):
+        # строковый default здесь законен: get_prep_value сожмёт его, как любое значение
+        return []
+
+    def from_db_value(self, value, expression, connection):
+        return decompress_text(value)
+
+    def to_python(self, value):
+        if isinstance(value, str) or value is None:
+            return value
+        return decompress_text(value)
+
+    def get_prep_value(self, value):
+        if isinstance(value, str):
+            value = compress_text(value)
+        return super().get_prep_value(value)
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj) or ''
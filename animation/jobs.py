@@ -0,0 +1,272 @@
+import logging
+import os
+import tempfile
+import time
+import traceback
+from contextlib import suppress
+from datetime import timedelta
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.db.models import F
+from django.utils import timezone
+
+from .exports import EXPORT_FORMATS, ExportError, export_project
+from .media_gc import FRAME_TOMBSTONE_RETENTION, MEDIA_GC_BATCH_SIZE, MEDIA_GC_GRACE, collect_media_garbage
+from .models import Blob, Job
+from .thumbnails import build_blob_thumbnails, publish_blob_thumbnails
+
+logger = logging.getLogger(__name__)
+
+# тип задачи -> функция handler(job, context), возвращающая словарь результата
+JOB_HANDLERS = {}
+
+# прогресс пишется в базу не чаще этого (секунды): отчёт на каждый кадр — лишние UPDATE
+JOB_PROGRESS_INTERVAL = 0.5
+# running-задача без сигнала дольше этого считается брошенной (воркер убит) и перезапускается
+JOB_STALE_AFTER = timedelta(minutes=5)
+# повтор после ошибки: 30 с, 1 мин, 2 мин … (но не дольше часа)
+JOB_RETRY_BASE_DELAY = timedelta(seconds=30)
+JOB_RETRY_MAX_DELAY = timedelta(hours=1)
+JOB_CLAIM_CANDIDATES = 10
+
+
+class JobCancelled(Exception):
+    """Отмена выполняющейся задачи: бросается из context.progress, когда выставлен cancel_requested."""
+
+
+class JobError(Exception):
+    """Ошибка, которую бессмысленно повторять (неверные параметры и т. п.): задача сразу failed."""
+
+
+def job_handler(kind):
+    def register(handler):
+        JOB_HANDLERS[kind] = handler
+        return handler
+    return register
+
+
+def enqueue_job(kind, params=None, project=None, owner=None, max_attempts=None, run_after=None):
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f'Неизвестный тип задачи: {kind}')
+    job = Job(kind=kind, params=params or {}, project=project, owner=owner)
+    if max_attempts is not None:
+        job.max_attempts = max_attempts
+    if run_after is not None:
+        job.run_after = run_after
+    job.save()
+    return job
+
+
+def cancel_job(job):
+    """
+    Задача из очереди отменяется сразу; выполняющейся выставляется флаг, и воркер
+    остановит её при следующем отчёте о прогрессе. Возвращает обновлённую задачу.
+    """
+    now = timezone.now()
+    cancelled = Job.objects.filter(pk=job.pk, status=Job.STATUS_QUEUED).update(
+        status=Job.STATUS_CANCELLED,
+        cancel_requested=True,
+        finished_at=now,
+    )
+    if not cancelled:
+        Job.objects.filter(pk=job.pk, status=Job.STATUS_RUNNING).update(cancel_requested=True)
+    job.refresh_from_db()
+    return job
+
+
+def claim_next_job(worker):
+    """
+    Берёт задачу из очереди. Захват — условный UPDATE status=queued -> running:
+    из нескольких процессов его выигрывает ровно один, блокировки строк не нужны
+    (SQLite их и не умеет).
+    """
+    now = timezone.now()
+    candidates = list(
+        Job.objects.filter(status=Job.STATUS_QUEUED, run_after__lte=now, kind__in=list(JOB_HANDLERS))
+        .order_by('run_after', 'pk')
+        .values_list('pk', flat=True)[:JOB_CLAIM_CANDIDATES]
+    )
+    for pk in candidates:
+        claimed = Job.objects.filter(pk=pk, status=Job.STATUS_QUEUED).update(
+            status=Job.STATUS_RUNNING,
+            worker=worker,
+            attempts=F('attempts') + 1,
+            started_at=now,
+            heartbeat_at=now,
+        )
+        if claimed:
+            return Job.objects.select_related('project').get(pk=pk)
+    return None
+
+
+def requeue_stale_jobs():
+    """Возвращает в очередь задачи, чей воркер пропал; исчерпавшие попытки — в failed."""
+    now = timezone.now()
+    stale = Job.objects.filter(status=Job.STATUS_RUNNING, heartbeat_at__lt=now - JOB_STALE_AFTER)
+    message = 'Воркер перестал отвечать.'
+    stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.STATUS_FAILED, error=message, finished_at=now,
+    )
+    return stale.update(status=Job.STATUS_QUEUED, error=message, worker='', run_after=now)
+
+
+def retry_delay(attempts):
+    return min(JOB_RETRY_BASE_DELAY * 2 ** max(0, attempts - 1), JOB_RETRY_MAX_DELAY)
+
+
+class JobContext:
+    """То, что обработчик получает вместе с задачей: отчёт о прогрессе и проверка отмены."""
+
+    def __init__(self, job):
+        self.job = job
+        self.reported_at = 0
+
+    def progress(self, done, total):
+        now = time.monotonic()
+        if done < total and now - self.reported_at < JOB_PROGRESS_INTERVAL:
+            return
+        self.reported_at = now
+        self.heartbeat(progress_done=done, progress_total=total)
+
+    def heartbeat(self, **fields):
+        # один UPDATE и пишет прогресс, и узнаёт об отмене: при cancel_requested строк не найдётся
+        updated = Job.objects.filter(pk=self.job.pk, cancel_requested=False).update(
+            heartbeat_at=timezone.now(), **fields,
+        )
+        if not updated:
+            raise JobCancelled()
+
+
+def finish_job(job, status, **fields):
+    Job.objects.filter(pk=job.pk).update(status=status, finished_at=timezone.now(), **fields)
+
+
+def run_job(job):
+    """Выполняет захваченную задачу и записывает исход: результат, повтор или ошибку."""
+    handler = JOB_HANDLERS[job.kind]
+    try:
+        result = handler(job, JobContext(job))
+    except JobCancelled:
+        finish_job(job, Job.STATUS_CANCELLED)
+    except JobError as error:
+        finish_job(job, Job.STATUS_FAILED, error=str(error))
+    except Exception:
+        logger.exception('Задача %s #%s упала (попытка %s)', job.kind, job.pk, job.attempts)
+        error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.STATUS_QUEUED,
+                error=error,
+                worker='',
+                run_after=timezone.now() + retry_delay(job.attempts),
+            )
+        else:
+            finish_job(job, Job.STATUS_FAILED, error=error)
+    else:
+        finish_job(job, Job.STATUS_SUCCEEDED, result=result or {}, error='')
+
+
+def work(worker, should_stop, once=False, poll_interval=1.0):
+    """
+    Цикл одного воркера: берёт задачи, пока should_stop() ложно.
+    once — выйти, как только очередь опустеет.
+    """
+    while not should_stop():
+        job = claim_next_job(worker)
+        if job is None:
+            if once:
+                return
+            requeue_stale_jobs()
+            time.sleep(poll_interval)
+            continue
+        run_job(job)
+
+
+def export_storage_name(job, extension):
+    return f'exports/{job.project_id}/export-{job.pk}.{extension}'
+
+
+@job_handler('export')
+def run_export_job(job, context):
+    """Экспорт проекта (exports.export_project) во временный файл, затем в хранилище."""
+    params = job.params
+    export_format = params.get('format')
+    if job.project is None or export_format not in EXPORT_FORMATS:
+        raise JobError('Неверные параметры экспорта.')
+    extension = EXPORT_FORMATS[export_format][1]
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, f'export.{extension}')
+        try:
+            frames = export_project(
+                job.project,
+                export_format,
+                path,
+                width=params.get('width'),
+                height=params.get('height'),
+                progress=context.progress,
+            )
+        except ExportError as error:
+            raise JobError(str(error))
+        # повторная попытка перезаписывает файл, а не копит export-<id>_abc123.gif
+        name = export_storage_name(job, extension)
+        with suppress(FileNotFoundError):
+            default_storage.delete(name)
+        with open(path, 'rb') as export_file:
+            name = default_storage.save(name, File(export_file))
+            size = export_file.seek(0, os.SEEK_END)
+
+    return {
+        'file': name,
+        'format': export_format,
+        'frames': frames,
+        'size': size,
+    }
+
+
+@job_handler('thumbnails')
+def run_thumbnails_job(job, context):
+    """Миниатюры блобов превью params.blob_ids (thumbnails.build_blob_thumbnails)."""
+    blobs = list(Blob.objects.filter(pk__in=job.params.get('blob_ids') or []).order_by('pk'))
+    for done, blob in enumerate(blobs, start=1):
+        if build_blob_thumbnails(blob):
+            publish_blob_thumbnails(blob)
+        context.progress(done, len(blobs))
+    return {'blobs': len(blobs)}
+
+
+@job_handler('frame_rasters')
+def run_frame_rasters_job(job, context):
+    """Сборка плиток слоёв и превью кадра params.frame_id (rasters.rebuild_frame_rasters)."""
+    # rasters -> blobs -> jobs: на уровне модуля импорт замкнулся бы в кольцо
+    from .rasters import rebuild_frame_rasters
+
+    frame_id = job.params.get('frame_id')
+    if not frame_id:
+        raise JobError('Не указан кадр.')
+    return rebuild_frame_rasters(frame_id)
+
+
+@job_handler('gc_media')
+def run_gc_media_job(job, context):
+    """
+    Сборка осиротевших файлов (media_gc.collect_media_garbage). С params.every_hours
+    задача ставит в очередь следующий запуск — так сборщик работает по расписанию без cron.
+    """
+    params = job.params
+    grace = params.get('grace_seconds')
+    retention = params.get('tombstone_retention_seconds')
+    report = collect_media_garbage(
+        dry_run=bool(params.get('dry_run')),
+        grace=MEDIA_GC_GRACE if grace is None else timedelta(seconds=grace),
+        batch_size=params.get('batch_size') or MEDIA_GC_BATCH_SIZE,
+        tombstone_retention=FRAME_TOMBSTONE_RETENTION if retention is None else timedelta(seconds=retention),
+        progress=context.progress,
+    )
+    every_hours = params.get('every_hours')
+    if every_hours:
+        # следующий запуск — только если другой ещё не ждёт в очереди
+        if not Job.objects.filter(kind=job.kind, status=Job.STATUS_QUEUED).exclude(pk=job.pk).exists():
+            enqueue_job(job.kind, params=params, run_after=timezone.now() + timedelta(hours=every_hours))
+    return report
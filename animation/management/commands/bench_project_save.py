@@ -0,0 +1,74 @@
+import json
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from animation.models import FRAME_POSITION_STEP, AnimationProject, Frame, FrameContent
+from animation.views import save_project_frames
+
+
+def save_frames_one_by_one(project, frames):
+    """Старый путь project_save: update_or_create на каждый кадр, для сравнения."""
+    for frame_data in frames:
+        frame, _ = Frame.objects.get_or_create(
+            project=project,
+            position=frame_data['index'] * FRAME_POSITION_STEP,
+        )
+        FrameContent.objects.update_or_create(
+            frame=frame,
+            defaults={'content_json': json.dumps(frame_data['content'], ensure_ascii=False)},
+        )
+
+
+class QueryCounter:
+    """Считает запросы через execute_wrapper: в отличие от connection.queries не ограничен 9000 записей."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет число SQL-запросов и время сохранения проекта (project_save) '
+        'для разного числа кадров: по одному кадру и массово. '
+        'Все данные создаются во временной транзакции и откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            nargs='+',
+            type=int,
+            default=[10, 100, 1000],
+            help='Сколько кадров сохранять (по умолчанию 10 100 1000).',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{"кадров":>8} {"способ":>10} {"проход":>8} {"запросов":>9} {"мс":>9}')
+        for size in options['sizes']:
+            frames = [
+                {'index': index, 'content': {'strokes': [], 'index': index}}
+                for index in range(1, size + 1)
+            ]
+            for label, save in (('по одному', save_frames_one_by_one), ('массово', save_project_frames)):
+                with transaction.atomic():
+                    owner = User.objects.create(username=f'bench_project_save_{size}')
+                    project = AnimationProject.objects.create(owner=owner, title='bench')
+                    # первый проход вставляет кадры, второй — перезаписывает существующие
+                    for run in ('вставка', 'обновление'):
+                        counter = QueryCounter()
+                        with connection.execute_wrapper(counter):
+                            started = time.perf_counter()
+                            with transaction.atomic():
+                                save(project, frames)
+                            elapsed = (time.perf_counter() - started) * 1000
+                        self.stdout.write(
+                            f'{size:>8} {label:>10} {run:>8} {counter.count:>9} {elapsed:>9.1f}'
+                        )
+                    transaction.set_rollback(True)
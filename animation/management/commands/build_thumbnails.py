@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from animation.jobs import enqueue_job
+from animation.models import Blob
+from animation.thumbnails import build_blob_thumbnails, publish_blob_thumbnails
+
+
+class Command(BaseCommand):
+    help = (
+        'Миниатюры для блобов превью, у которых их ещё нет (например, сохранённых до появления '
+        'миниатюр). По умолчанию ставит задачи для run_jobs пачками; --now строит сразу.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Сколько блобов в одной задаче (по умолчанию 100).',
+        )
+        parser.add_argument('--now', action='store_true', help='Построить в этом процессе, без очереди задач.')
+        parser.add_argument('--all', action='store_true', help='Перестроить и уже готовые миниатюры.')
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        blobs = Blob.objects.filter(refcount__gt=0).order_by('pk')
+        if not options['all']:
+            blobs = blobs.filter(thumbnail_sizes__isnull=True)
+        blob_ids = list(blobs.values_list('pk', flat=True))
+
+        if options['now']:
+            for blob in Blob.objects.filter(pk__in=blob_ids).order_by('pk').iterator(chunk_size=batch_size):
+                if build_blob_thumbnails(blob):
+                    publish_blob_thumbnails(blob)
+            self.stdout.write(f'Миниатюры построены для блобов: {len(blob_ids)}.')
+            return
+
+        jobs = 0
+        for start in range(0, len(blob_ids), batch_size):
+            enqueue_job('thumbnails', {'blob_ids': blob_ids[start:start + batch_size]})
+            jobs += 1
+        self.stdout.write(f'Блобов без миниатюр: {len(blob_ids)}; поставлено задач: {jobs}.')
@@ -0,0 +1,95 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from animation.fields import (
+    FORMAT_RAW,
+    FORMAT_ZLIB,
+    FORMAT_ZSTD,
+    compress_text,
+    decompress_text,
+    preferred_format,
+    stored_format,
+)
+from animation.models import FrameContent
+
+FORMAT_NAMES = {None: 'пусто/текст', FORMAT_RAW: 'raw', FORMAT_ZLIB: 'zlib', FORMAT_ZSTD: 'zstd'}
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересжимает содержимое кадров (FrameContent.content_json) текущим кодеком '
+        '(zstd, если установлен zstandard, иначе zlib). Строки читаются пачками по frame_id, '
+        'каждая пачка пишется в своей транзакции; уже сжатые нужным кодеком строки не трогаются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько строк читать и писать за раз (по умолчанию 500).',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только посчитать, сколько строк и байтов изменится, ничего не записывая.',
+        )
+
+    def fetch_stored(self, after_pk, limit):
+        """Сырые байты из базы, без распаковки полем: нужен байт формата."""
+        table = connection.ops.quote_name(FrameContent._meta.db_table)
+        pk_column = connection.ops.quote_name(FrameContent._meta.pk.column)
+        value_column = connection.ops.quote_name(FrameContent._meta.get_field('content_json').column)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT {pk_column}, {value_column} FROM {table} '
+                f'WHERE {pk_column} > %s ORDER BY {pk_column} LIMIT %s',
+                [after_pk, limit],
+            )
+            return cursor.fetchall()
+
+    def handle(self, *args, **options):
+        batch_size = max(1, options['batch_size'])
+        dry_run = options['dry_run']
+        target_format = preferred_format()
+
+        scanned = rewritten = bytes_before = bytes_after = 0
+        formats = {}
+        after_pk = 0
+        while True:
+            rows = self.fetch_stored(after_pk, batch_size)
+            if not rows:
+                break
+            after_pk = rows[-1][0]
+
+            updates = []
+            for frame_id, value in rows:
+                scanned += 1
+                current_format = stored_format(value)
+                formats[current_format] = formats.get(current_format, 0) + 1
+                text = decompress_text(value)
+                if isinstance(value, str):
+                    size = len(value.encode('utf-8'))
+                else:
+                    size = len(value) if value is not None else 0
+                if current_format == target_format:
+                    bytes_before += size
+                    bytes_after += size
+                    continue
+                packed = compress_text(text, target_format)
+                bytes_before += size
+                bytes_after += len(packed)
+                # короткие и несжимаемые строки остаются raw — переписывать их незачем
+                if isinstance(value, (bytes, memoryview)) and bytes(value) == packed:
+                    continue
+                updates.append(FrameContent(frame_id=frame_id, content_json=text))
+
+            rewritten += len(updates)
+            if updates and not dry_run:
+                with transaction.atomic():
+                    FrameContent.objects.bulk_update(updates, ['content_json'])
+
+        summary = ', '.join(f'{FORMAT_NAMES.get(key, key)}: {count}' for key, count in formats.items())
+        action = 'будет пересжато' if dry_run else 'пересжато'
+        self.stdout.write(f'Строк: {scanned} ({summary or "нет"}); {action}: {rewritten}.')
+        self.stdout.write(f'Байтов содержимого: {bytes_before} -> {bytes_after}.')
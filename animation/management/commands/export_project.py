@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from animation.exports import EXPORT_FORMATS, ExportError, available_export_formats, export_project
+from animation.models import AnimationProject
+
+
+class Command(BaseCommand):
+    help = (
+        'Экспортирует проект в GIF, APNG, WebP, лист спрайтов с JSON-атласом или MP4 (если есть ffmpeg). '
+        'Кадры идут по порядку и кодируются пулом процессов; в памяти держится лишь несколько кадров.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('project_id', type=int)
+        parser.add_argument('format', choices=sorted(EXPORT_FORMATS))
+        parser.add_argument('--output', help='Куда писать файл (по умолчанию project_<id>.<расширение>).')
+        parser.add_argument('--width', type=int, help='Ширина кадра; без --height высота по пропорциям.')
+        parser.add_argument('--height', type=int, help='Высота кадра; без --width ширина по пропорциям.')
+        parser.add_argument('--workers', type=int, help='Число процессов пула (по умолчанию — по числу ядер).')
+
+    def handle(self, *args, **options):
+        export_format = options['format']
+        if export_format not in available_export_formats():
+            raise CommandError(f'Формат {export_format} недоступен: не найден ffmpeg.')
+        try:
+            project = AnimationProject.objects.get(pk=options['project_id'])
+        except AnimationProject.DoesNotExist:
+            raise CommandError(f'Проект {options["project_id"]} не найден.')
+
+        extension = EXPORT_FORMATS[export_format][1]
+        path = options['output'] or f'project_{project.pk}.{extension}'
+        # прогресс печатается примерно каждые 10%, чтобы не заваливать вывод
+        last_reported = [-1]
+
+        def progress(done, total):
+            percent = done * 100 // total
+            if percent // 10 != last_reported[0] // 10 or done == total:
+                last_reported[0] = percent
+                self.stdout.write(f'{done}/{total} кадров ({percent}%)')
+
+        try:
+            total = export_project(
+                project,
+                export_format,
+                path,
+                width=options['width'],
+                height=options['height'],
+                workers=options['workers'],
+                progress=progress,
+            )
+        except ExportError as error:
+            raise CommandError(str(error))
+        self.stdout.write(self.style.SUCCESS(f'Готово: {total} кадров -> {path}'))
@@ -0,0 +1,97 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from animation.jobs import enqueue_job
+from animation.media_gc import FRAME_TOMBSTONE_RETENTION, MEDIA_GC_BATCH_SIZE, collect_media_garbage
+from animation.models import Job
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет файлы хранилища (blobs/, thumbs/, frames/, layers/, tiles/, exports/), на которые '
+        'не ссылается ни одна строка базы, и блобы превью без ссылок. Файлы моложе --grace-hours '
+        'не трогает; надгробия удалённых кадров хранит --tombstone-days. --enqueue ставит сборку задачей для run_jobs, с --every — по расписанию.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, что и сколько будет удалено.')
+        parser.add_argument(
+            '--grace-hours',
+            type=float,
+            default=1.0,
+            help='Не трогать файлы моложе стольких часов: загрузка могла ещё не закоммититься (по умолчанию 1).',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=MEDIA_GC_BATCH_SIZE,
+            help=f'Сколько имён файлов проверять одним запросом (по умолчанию {MEDIA_GC_BATCH_SIZE}).',
+        )
+        parser.add_argument(
+            '--tombstone-days',
+            type=float,
+            default=FRAME_TOMBSTONE_RETENTION.days,
+            help=(
+                'Сколько дней хранить надгробия удалённых кадров для ленты изменений '
+                f'(по умолчанию {FRAME_TOMBSTONE_RETENTION.days}).'
+            ),
+        )
+        parser.add_argument(
+            '--fix-refcounts',
+            action='store_true',
+            help='Сначала пересчитать счётчики ссылок блобов по кадрам.',
+        )
+        parser.add_argument('--enqueue', action='store_true', help='Не собирать сейчас, а поставить задачу gc_media.')
+        parser.add_argument(
+            '--every',
+            type=float,
+            metavar='HOURS',
+            help='С --enqueue: после каждого запуска ставить следующий через столько часов.',
+        )
+
+    def handle(self, *args, **options):
+        grace = timedelta(hours=max(0.0, options['grace_hours']))
+        batch_size = max(1, options['batch_size'])
+        tombstone_retention = timedelta(days=max(0.0, options['tombstone_days']))
+
+        if options['enqueue']:
+            pending = Job.objects.filter(
+                kind='gc_media', status__in=[Job.STATUS_QUEUED, Job.STATUS_RUNNING],
+            ).exists()
+            if pending and options['every']:
+                self.stdout.write('Сборка по расписанию уже стоит в очереди.')
+                return
+            params = {
+                'dry_run': options['dry_run'],
+                'grace_seconds': grace.total_seconds(),
+                'batch_size': batch_size,
+                'tombstone_retention_seconds': tombstone_retention.total_seconds(),
+            }
+            if options['every']:
+                params['every_hours'] = options['every']
+            job = enqueue_job('gc_media', params)
+            self.stdout.write(f'Поставлена задача #{job.pk}.')
+            return
+
+        report = collect_media_garbage(
+            dry_run=options['dry_run'],
+            grace=grace,
+            batch_size=batch_size,
+            fix_refcounts=options['fix_refcounts'],
+            tombstone_retention=tombstone_retention,
+        )
+        if report['refcounts_fixed']:
+            self.stdout.write(f'Исправлено счётчиков ссылок: {report["refcounts_fixed"]}.')
+        for directory, item in report['directories'].items():
+            self.stdout.write(
+                f'{directory}/: просмотрено {item["scanned"]}, свежих {item["recent"]}, '
+                f'без ссылок {item["orphaned"]} ({filesizeformat(item["bytes"])})'
+            )
+        verb = 'Будет удалено' if report['dry_run'] else 'Удалено'
+        self.stdout.write(
+            f'{verb}: файлов {report["orphaned"]}, {filesizeformat(report["bytes"])} '
+            f'({report["bytes"]} байт); строк блобов {report["blob_rows"]}, '
+            f'надгробий кадров {report["tombstones"]}.'
+        )
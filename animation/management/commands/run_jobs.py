@@ -0,0 +1,78 @@
+import multiprocessing
+import os
+import signal
+import socket
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from animation.jobs import requeue_stale_jobs, work
+
+
+def worker_main(worker, stop_event, once, poll_interval):
+    """Точка входа дочернего процесса: Ctrl+C ловит родитель, SIGTERM — мягкая остановка."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+    try:
+        work(worker, stop_event.is_set, once=once, poll_interval=poll_interval)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = (
+        'Выполняет фоновые задачи (animation.Job) из базы: экспорт и прочую тяжёлую работу. '
+        'Очередь — таблица в той же базе, брокер не нужен. При --workers больше 1 '
+        'задачи берут несколько процессов; SIGTERM/Ctrl+C дают доделать текущие задачи.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Сколько процессов берут задачи (по умолчанию 1).')
+        parser.add_argument('--once', action='store_true', help='Выполнить всё, что есть в очереди, и выйти.')
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Пауза между проверками пустой очереди, секунды (по умолчанию 1).',
+        )
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        once = options['once']
+        poll_interval = max(0.1, options['poll_interval'])
+        prefix = f'{socket.gethostname()}:{os.getpid()}'
+
+        requeued = requeue_stale_jobs()
+        if requeued:
+            self.stdout.write(f'Возвращено в очередь брошенных задач: {requeued}.')
+
+        # fork: дочерним процессам не нужно заново настраивать Django
+        context = multiprocessing.get_context('fork')
+        stop_event = context.Event()
+        previous_handlers = {
+            signum: signal.signal(signum, lambda signum, frame: stop_event.set())
+            for signum in (signal.SIGINT, signal.SIGTERM)
+        }
+        try:
+            if workers == 1:
+                work(prefix, stop_event.is_set, once=once, poll_interval=poll_interval)
+            else:
+                # соединения с базой не должны достаться детям от родителя
+                connections.close_all()
+                processes = [
+                    context.Process(
+                        target=worker_main,
+                        args=(f'{prefix}/{number}', stop_event, once, poll_interval),
+                        name=f'run_jobs-{number}',
+                    )
+                    for number in range(1, workers + 1)
+                ]
+                for process in processes:
+                    process.start()
+                self.stdout.write(f'Запущено воркеров: {workers}.')
+                for process in processes:
+                    process.join()
+        finally:
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+        self.stdout.write('Воркеры остановлены.')
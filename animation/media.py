@@ -0,0 +1,116 @@
+import re
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+
+from .blobs import blob_path
+
+# адрес файла содержит хэш содержимого, поэтому по одному URL всегда одни и те же байты
+IMMUTABLE_CACHE_CONTROL = 'private, max-age=31536000, immutable'
+MEDIA_CHUNK_SIZE = 64 * 1024
+BYTE_RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def blob_url(blob):
+    """Неизменяемый адрес файла блоба: /files/blob/<sha256>.<расширение>."""
+    extension = blob.file.name.rsplit('.', 1)[-1]
+    return reverse('animation:blob_file', args=[blob.sha256, extension])
+
+
+def parse_byte_range(header, size):
+    """
+    Заголовок Range -> (start, end) включительно. None — отдать файл целиком
+    (заголовка нет, в нём несколько диапазонов или он не разобран), False — 416.
+    """
+    match = BYTE_RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # bytes=-N — последние N байт
+        length = int(last)
+        if not length or not size:
+            return False
+        return max(0, size - length), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        return False
+    end = min(int(last), size - 1) if last else size - 1
+    return start, end
+
+
+def iter_file_range(media_file, start, length):
+    try:
+        media_file.seek(start)
+        while length > 0:
+            chunk = media_file.read(min(MEDIA_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        media_file.close()
+
+
+def sendfile_response(name, mode):
+    """Пустой ответ, файл по которому отдаёт фронтовой сервер (вместе с Range)."""
+    response = HttpResponse()
+    if mode == 'x-accel-redirect':
+        prefix = getattr(settings, 'ANIMATION_MEDIA_ACCEL_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + name
+    else:
+        response['X-Sendfile'] = default_storage.path(name)
+    return response
+
+
+def serve_media_file(request, name, content_type, etag):
+    """
+    Отдаёт файл хранилища с неизменяемым адресом: ETag, Cache-Control: immutable,
+    304 по If-None-Match и один диапазон Range (206, 416 — вне файла).
+    Если задан settings.ANIMATION_MEDIA_SENDFILE ('x-sendfile' для Apache/lighttpd
+    или 'x-accel-redirect' для nginx с internal-локацией ANIMATION_MEDIA_ACCEL_PREFIX
+    на MEDIA_ROOT), байты отдаёт фронтовой сервер, а Django только проверяет доступ.
+    """
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        if not default_storage.exists(name):
+            raise Http404('Файл не найден.')
+        mode = getattr(settings, 'ANIMATION_MEDIA_SENDFILE', None)
+        if mode:
+            response = sendfile_response(name, mode)
+        else:
+            response = file_range_response(request, name, etag)
+        response['Content-Type'] = content_type
+    response['ETag'] = etag
+    response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def file_range_response(request, name, etag):
+    size = default_storage.size(name)
+    byte_range = None
+    # If-Range с другим ETag — файл поменялся, кусок не подходит: отдаём целиком
+    if request.META.get('HTTP_IF_RANGE', etag) == etag:
+        byte_range = parse_byte_range(request.META.get('HTTP_RANGE'), size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    if byte_range is None:
+        return FileResponse(default_storage.open(name, 'rb'))
+
+    start, end = byte_range
+    length = end - start + 1
+    response = StreamingHttpResponse(iter_file_range(default_storage.open(name, 'rb'), start, length), status=206)
+    response['Content-Length'] = str(length)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return response
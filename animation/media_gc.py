@@ -0,0 +1,220 @@
+import os
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Count, Exists, F, Max, OuterRef
+from django.utils import timezone
+
+from .models import AnimationProject, Blob, Frame, FrameTombstone, Job, Layer, LayerTile
+
+# файл моложе этого не трогаем: его могли записать, а строку в базе ещё не закоммитить
+MEDIA_GC_GRACE = timedelta(hours=1)
+MEDIA_GC_BATCH_SIZE = 500
+# надгробия удалённых кадров нужны только клиентам, которые давно не обновляли ленту;
+# тем, кто отстал сильнее, frames_list?since= отдаст полный список
+FRAME_TOMBSTONE_RETENTION = timedelta(days=30)
+
+
+def referenced_names(model, field, names):
+    return set(model.objects.filter(**{f'{field}__in': names}).values_list(field, flat=True))
+
+
+def thumbnail_sha(name):
+    # thumbs/ab/cd/<sha256>-<size>.webp
+    return os.path.basename(name).rsplit('-', 1)[0]
+
+
+class MediaReferences:
+    """
+    Для пачки имён файлов одного каталога — какие из них ещё нужны.
+    doomed_* — блобы, которые удалит (или в dry-run удалил бы) этот же проход:
+    их файлы и миниатюры считаются ненужными, хотя строки ещё есть.
+    """
+
+    def __init__(self):
+        self.doomed_blob_files = set()
+        self.doomed_blob_shas = set()
+
+    def blobs(self, names):
+        return referenced_names(Blob, 'file', names) - self.doomed_blob_files
+
+    def thumbs(self, names):
+        shas = {thumbnail_sha(name) for name in names}
+        alive = set(Blob.objects.filter(sha256__in=shas).values_list('sha256', flat=True)) - self.doomed_blob_shas
+        return {name for name in names if thumbnail_sha(name) in alive}
+
+    def frames(self, names):
+        # превью до блобов лежали в frames/ под именами кадров
+        return referenced_names(Frame, 'preview_image', names)
+
+    def layers(self, names):
+        # копии кадров ссылаются на те же PNG слоёв, так что файл жив, пока на него есть хоть одна строка
+        return referenced_names(Layer, 'raster', names)
+
+    def tiles(self, names):
+        return referenced_names(LayerTile, 'image', names)
+
+    def exports(self, names):
+        return set(Job.objects.filter(result__file__in=names).values_list('result__file', flat=True))
+
+
+# каталоги хранилища, которые собирает сборщик, и метод MediaReferences для каждого
+MEDIA_GC_DIRECTORIES = ('blobs', 'thumbs', 'frames', 'layers', 'tiles', 'exports')
+
+
+def iter_storage_files(directory):
+    """Файлы каталога хранилища рекурсивно; в памяти — листинг одного каталога за раз."""
+    try:
+        directories, files = default_storage.listdir(directory)
+    except (FileNotFoundError, NotADirectoryError):
+        return
+    for name in files:
+        yield f'{directory}/{name}'
+    for subdirectory in directories:
+        yield from iter_storage_files(f'{directory}/{subdirectory}')
+
+
+def remove_empty_directories(directory):
+    """Пустые подкаталоги после удаления файлов; только для локального хранилища."""
+    try:
+        root = default_storage.path(directory)
+    except NotImplementedError:
+        return
+    for path, subdirectories, files in os.walk(root, topdown=False):
+        if path != root and not subdirectories and not files:
+            try:
+                os.rmdir(path)
+            except OSError:
+                pass
+
+
+def reconcile_blob_refcounts():
+    """
+    Пересчитывает Blob.refcount по реальным ссылкам кадров. Сборщик и так не удалит
+    блоб, на который ссылается кадр; пересчёт нужен, чтобы неучтённые ссылки не держали
+    мусор вечно (и наоборот). Лучше запускать, когда никто не сохраняет кадры.
+    """
+    wrong = Blob.objects.annotate(actual=Count('frames')).exclude(refcount=F('actual'))
+    fixed = 0
+    for pk, actual in wrong.values_list('pk', 'actual').iterator():
+        fixed += Blob.objects.filter(pk=pk).update(refcount=actual)
+    return fixed
+
+
+def collect_unused_blobs(cutoff, references, dry_run, batch_size):
+    """Строки блобов без ссылок старше cutoff. Их файлы удалит обход каталогов blobs/ и thumbs/."""
+    unused = Blob.objects.filter(refcount=0, created_at__lt=cutoff).filter(
+        ~Exists(Frame.objects.filter(preview_blob=OuterRef('pk')))
+    )
+    deleted = 0
+    batch = []
+    for row in unused.order_by('pk').values_list('pk', 'file', 'sha256').iterator(chunk_size=batch_size):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            deleted += delete_blob_rows(batch, references, dry_run)
+            batch = []
+    if batch:
+        deleted += delete_blob_rows(batch, references, dry_run)
+    return deleted
+
+
+def delete_blob_rows(rows, references, dry_run):
+    if not dry_run:
+        # условие повторяется в DELETE: блоб, получивший ссылку после выборки, остаётся
+        Blob.objects.filter(pk__in=[pk for pk, _, _ in rows], refcount=0).filter(
+            ~Exists(Frame.objects.filter(preview_blob=OuterRef('pk')))
+        ).delete()
+    # в dry-run строки остаются, и без этого их файлы выглядели бы нужными
+    references.doomed_blob_files.update(name for _, name, _ in rows)
+    references.doomed_blob_shas.update(sha256 for _, _, sha256 in rows)
+    return len(rows)
+
+
+def prune_frame_tombstones(cutoff, dry_run):
+    """
+    Удаляет надгробия старше cutoff. Проекту запоминается наибольшая удалённая ревизия
+    (tombstones_pruned_revision): лента сравнивает с ней since клиента.
+    """
+    horizons = (
+        FrameTombstone.objects.filter(created_at__lt=cutoff)
+        .values('project_id').annotate(horizon=Max('revision')).values_list('project_id', 'horizon')
+    )
+    pruned = 0
+    for project_id, horizon in horizons.iterator():
+        tombstones = FrameTombstone.objects.filter(project_id=project_id, revision__lte=horizon)
+        if dry_run:
+            pruned += tombstones.count()
+            continue
+        with transaction.atomic():
+            AnimationProject.objects.filter(
+                pk=project_id, tombstones_pruned_revision__lt=horizon,
+            ).update(tombstones_pruned_revision=horizon)
+            pruned += tombstones.delete()[0]
+    return pruned
+
+
+def collect_directory(directory, check, cutoff, dry_run, batch_size, report):
+    def flush(batch):
+        alive = check(batch)
+        for name in batch:
+            if name in alive:
+                continue
+            try:
+                size = default_storage.size(name)
+                if not dry_run:
+                    default_storage.delete(name)
+            except FileNotFoundError:
+                continue
+            report['orphaned'] += 1
+            report['bytes'] += size
+
+    batch = []
+    for name in iter_storage_files(directory):
+        report['scanned'] += 1
+        try:
+            modified = default_storage.get_modified_time(name)
+        except (FileNotFoundError, NotImplementedError):
+            continue
+        if modified >= cutoff:
+            report['recent'] += 1
+            continue
+        batch.append(name)
+        if len(batch) >= batch_size:
+            flush(batch)
+            batch = []
+    if batch:
+        flush(batch)
+    if not dry_run:
+        remove_empty_directories(directory)
+
+
+def collect_media_garbage(dry_run=False, grace=MEDIA_GC_GRACE, batch_size=MEDIA_GC_BATCH_SIZE,
+                          fix_refcounts=False, tombstone_retention=FRAME_TOMBSTONE_RETENTION, progress=None):
+    """
+    Удаляет файлы хранилища, на которые не ссылается ни одна строка базы, строки
+    блобов без ссылок и надгробия кадров старше tombstone_retention.
+    Файлы моложе grace не трогает: загрузка могла ещё не закоммититься.
+    Каталоги обходятся потоково, ссылки проверяются пачками по batch_size имён.
+    Возвращает отчёт: по каталогу — просмотрено, свежих, удалено (orphaned) и байт.
+    """
+    cutoff = timezone.now() - grace
+    references = MediaReferences()
+    report = {
+        'dry_run': dry_run,
+        'refcounts_fixed': reconcile_blob_refcounts() if fix_refcounts and not dry_run else 0,
+        'blob_rows': collect_unused_blobs(cutoff, references, dry_run, batch_size),
+        'tombstones': prune_frame_tombstones(timezone.now() - tombstone_retention, dry_run),
+        'directories': {},
+    }
+    for number, directory in enumerate(MEDIA_GC_DIRECTORIES, start=1):
+        directory_report = {'scanned': 0, 'recent': 0, 'orphaned': 0, 'bytes': 0}
+        collect_directory(
+            directory, getattr(references, directory), cutoff, dry_run, batch_size, directory_report,
+        )
+        report['directories'][directory] = directory_report
+        if progress is not None:
+            progress(number, len(MEDIA_GC_DIRECTORIES))
+    report['bytes'] = sum(item['bytes'] for item in report['directories'].values())
+    report['orphaned'] = sum(item['orphaned'] for item in report['directories'].values())
+    return report
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('animation', '0002_layer'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='layer',
+            name='raster',
+            field=models.ImageField(blank=True, null=True, upload_to='layers/', verbose_name='Пиксели слоя (PNG)'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def mark_existing_rasters(apps, schema_editor):
+    Layer = apps.get_model('animation', 'Layer')
+    Layer.objects.exclude(raster='').exclude(raster__isnull=True).update(raster_version=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('animation', '0003_layer_raster'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='layer',
+            name='raster_version',
+            field=models.PositiveIntegerField(default=0, verbose_name='Версия пикселей слоя'),
+        ),
+        migrations.CreateModel(
+            name='LayerTile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('col', models.PositiveIntegerField(verbose_name='Столбец плитки')),
+                ('row', models.PositiveIntegerField(verbose_name='Строка плитки')),
+                ('image', models.ImageField(upload_to='tiles/', verbose_name='Пиксели плитки (PNG)')),
+                ('layer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tiles', to='animation.layer')),
+            ],
+            options={
+                'ordering': ['layer', 'row', 'col'],
+                'unique_together': {('layer', 'col', 'row')},
+            },
+        ),
+        migrations.RunPython(mark_existing_rasters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+
+FRAME_POSITION_STEP = 1024
+
+
+def fill_positions(apps, schema_editor):
+    Frame = apps.get_model('animation', 'Frame')
+    frames = list(Frame.objects.order_by('project_id', 'index', 'id'))
+    for frame in frames:
+        frame.position = frame.index * FRAME_POSITION_STEP
+    Frame.objects.bulk_update(frames, ['position'], batch_size=500)
+
+
+def fill_indexes(apps, schema_editor):
+    Frame = apps.get_model('animation', 'Frame')
+    frames = list(Frame.objects.order_by('project_id', 'position', 'id'))
+    project_id = None
+    for frame in frames:
+        if frame.project_id != project_id:
+            project_id = frame.project_id
+            rank = 0
+        rank += 1
+        frame.index = rank
+    Frame.objects.bulk_update(frames, ['index'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('animation', '0004_layer_tiles'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='frame',
+            name='position',
+            field=models.BigIntegerField(default=0, verbose_name='Позиция кадра'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_positions, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='frame',
+            unique_together={('project', 'position')},
+        ),
+        migrations.AlterModelOptions(
+            name='frame',
+            options={'ordering': ['project', 'position']},
+        ),
+        # default нужен только для обратной миграции: колонка index вернётся
+        # и будет заполнена рангом по position
+        migrations.AlterField(
+            model_name='frame',
+            name='index',
+            field=models.PositiveIntegerField(default=0, verbose_name='Номер кадра'),
+        ),
+        migrations.RunPython(migrations.RunPython.noop, fill_indexes),
+        migrations.RemoveField(
+            model_name='frame',
+            name='index',
+        ),
+    ]
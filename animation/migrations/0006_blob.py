@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:19
+
+import hashlib
+
+import django.db.models.deletion
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+
+def link_existing_previews(apps, schema_editor):
+    """
+    Заводит блобы для уже сохранённых превью. Файлы остаются на своих местах:
+    блоб с таким хэшем просто указывает на первый найденный файл.
+    """
+    Blob = apps.get_model('animation', 'Blob')
+    Frame = apps.get_model('animation', 'Frame')
+    blobs = {}
+    for frame in Frame.objects.exclude(preview_image='').exclude(preview_image__isnull=True).iterator():
+        name = frame.preview_image.name
+        try:
+            with default_storage.open(name, 'rb') as image_file:
+                data = image_file.read()
+        except OSError:
+            continue
+        digest = hashlib.sha256(data).hexdigest()
+        blob = blobs.get(digest)
+        if blob is None:
+            blob, _ = Blob.objects.get_or_create(sha256=digest, defaults={'file': name, 'size': len(data)})
+            blobs[digest] = blob
+        Frame.objects.filter(pk=frame.pk).update(preview_blob=blob, preview_image=blob.file.name)
+        Blob.objects.filter(pk=blob.pk).update(refcount=models.F('refcount') + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('animation', '0005_frame_position'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True, verbose_name='SHA-256 содержимого')),
+                ('file', models.FileField(max_length=255, upload_to='blobs/', verbose_name='Файл')),
+                ('size', models.PositiveIntegerField(default=0, verbose_name='Размер (байт)')),
+                ('refcount', models.PositiveIntegerField(default=0, verbose_name='Число ссылок')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='frame',
+            name='preview_blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='frames', to='animation.blob', verbose_name='Блоб превью'),
+        ),
+        migrations.RunPython(link_existing_previews, migrations.RunPython.noop),
+    ]
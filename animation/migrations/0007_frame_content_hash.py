@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('animation', '0006_blob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='frame',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Хэш содержимого'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:26
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('animation', '0007_frame_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FrameTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('frame_id', models.PositiveBigIntegerField(verbose_name='ID удалённого кадра')),
+                ('revision', models.PositiveBigIntegerField(verbose_name='Ревизия удаления')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Удалён')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='animationproject',
+            name='revision',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Ревизия кадров'),
+        ),
+        migrations.AddField(
+            model_name='frame',
+            name='revision',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Ревизия изменения'),
+        ),
+        migrations.AddIndex(
+            model_name='frame',
+            index=models.Index(fields=['project', 'revision'], name='animation_f_project_38baa5_idx'),
+        ),
+        migrations.AddField(
+            model_name='frametombstone',
+            name='project',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='frame_tombstones', to='animation.animationproject'),
+        ),
+        migrations.AddIndex(
+            model_name='frametombstone',
+            index=models.Index(fields=['project', 'revision'], name='animation_f_project_2ae47f_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:28
+
+from django.db import migrations
+
+
+def create_missing_default_layers(apps, schema_editor):
+    """
+    Раньше слой «Фон» досоздавался при чтении кадра (ensure_default_layer в GET).
+    Теперь он появляется вместе с кадром, так что старым кадрам без слоёв добавляем его здесь.
+    """
+    Frame = apps.get_model('animation', 'Frame')
+    Layer = apps.get_model('animation', 'Layer')
+    frame_ids = list(Frame.objects.filter(layers__isnull=True).values_list('pk', flat=True))
+    Layer.objects.bulk_create(
+        [Layer(frame_id=frame_id, order=1, name='Фон', visible=True, opacity=100) for frame_id in frame_ids],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('animation', '0008_frame_revisions'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_missing_default_layers, migrations.RunPython.noop),
+    ]
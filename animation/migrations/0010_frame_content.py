@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+COPY_BATCH_SIZE = 500
+
+
+def move_content_to_table(apps, schema_editor):
+    """Переносит непустой content_json кадров в FrameContent пачками."""
+    Frame = apps.get_model('animation', 'Frame')
+    FrameContent = apps.get_model('animation', 'FrameContent')
+    rows = Frame.objects.exclude(content_json='').values_list('pk', 'content_json')
+    batch = []
+    for frame_id, content_json in rows.iterator(chunk_size=COPY_BATCH_SIZE):
+        batch.append(FrameContent(frame_id=frame_id, content_json=content_json))
+        if len(batch) >= COPY_BATCH_SIZE:
+            FrameContent.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        FrameContent.objects.bulk_create(batch)
+
+
+def move_content_back(apps, schema_editor):
+    Frame = apps.get_model('animation', 'Frame')
+    FrameContent = apps.get_model('animation', 'FrameContent')
+    for content in FrameContent.objects.iterator(chunk_size=COPY_BATCH_SIZE):
+        Frame.objects.filter(pk=content.frame_id).update(content_json=content.content_json)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('animation', '0009_default_layers'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FrameContent',
+            fields=[
+                ('frame', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='content', serialize=False, to='animation.frame')),
+                ('content_json', models.TextField(blank=True, verbose_name='JSON содержимого кадра')),
+            ],
+        ),
+        migrations.RunPython(move_content_to_table, move_content_back),
+        migrations.RemoveField(
+            model_name='frame',
+            name='content_json',
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:31
+
+import animation.fields
+from django.db import migrations, models
+
+COPY_BATCH_SIZE = 500
+
+
+def copy_content(apps, source, target):
+    """Переливает source -> target пачками; сжатие и распаковку делает CompressedTextField."""
+    FrameContent = apps.get_model('animation', 'FrameContent')
+    batch = []
+    for content in FrameContent.objects.only('pk', source).iterator(chunk_size=COPY_BATCH_SIZE):
+        setattr(content, target, getattr(content, source))
+        batch.append(content)
+        if len(batch) >= COPY_BATCH_SIZE:
+            FrameContent.objects.bulk_update(batch, [target])
+            batch = []
+    if batch:
+        FrameContent.objects.bulk_update(batch, [target])
+
+
+def compress_content(apps, schema_editor):
+    copy_content(apps, 'content_json', 'content_data')
+
+
+def decompress_content(apps, schema_editor):
+    copy_content(apps, 'content_data', 'content_json')
+
+
+class Migration(migrations.Migration):
+    """
+    Текст -> сжатые байты через новый столбец, а не AlterField:
+    так не нужно приводить text -> bytea на стороне базы.
+    Пересжать строки другим кодеком позже — manage.py compress_frame_contents.
+    """
+
+    dependencies = [
+        ('animation', '0010_frame_content'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='framecontent',
+            name='content_data',
+            field=animation.fields.CompressedTextField(blank=True, default=''),
+        ),
+        migrations.RunPython(compress_content, decompress_content),
+        migrations.RemoveField(
+            model_name='framecontent',
+            name='content_json',
+        ),
+        migrations.RenameField(
+            model_name='framecontent',
+            old_name='content_data',
+            new_name='content_json',
+        ),
+        migrations.AlterField(
+            model_name='framecontent',
+            name='content_json',
+            field=animation.fields.CompressedTextField(blank=True, default='', verbose_name='JSON содержимого кадра'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('animation', '0012_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blob',
+            name='thumbnail_sizes',
+            field=models.JSONField(blank=True, default=None, null=True, verbose_name='Размеры миниатюр'),
+        ),
+    ]
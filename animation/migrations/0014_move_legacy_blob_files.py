@@ -0,0 +1,44 @@
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import migrations
+
+
+def legacy_blob_path(sha256, extension):
+    # копия blobs.blob_path: миграция не должна зависеть от кода приложения
+    return f'blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}.{extension}'
+
+
+def move_legacy_blob_files(apps, schema_editor):
+    """
+    Блобы, заведённые 0006_blob для старых превью, указывают на файлы frames/...,
+    а /files/blob/<sha256>.<ext> отдаёт blob_path(). Копирует такие файлы на место
+    блоба и перенаправляет на него блоб и кадры. Старые файлы остаются без ссылок —
+    их удалит сборка мусора (gc_media).
+    """
+    Blob = apps.get_model('animation', 'Blob')
+    Frame = apps.get_model('animation', 'Frame')
+    for blob in Blob.objects.exclude(file__startswith='blobs/').iterator():
+        legacy_name = blob.file.name
+        extension = legacy_name.rsplit('.', 1)[-1] if '.' in legacy_name else 'png'
+        name = legacy_blob_path(blob.sha256, extension)
+        if not default_storage.exists(name):
+            try:
+                with default_storage.open(legacy_name, 'rb') as legacy_file:
+                    data = legacy_file.read()
+            except OSError:
+                # файла нет — ссылку на него всё равно не отдать, оставляем как есть
+                continue
+            name = default_storage.save(name, ContentFile(data))
+        Blob.objects.filter(pk=blob.pk).update(file=name)
+        Frame.objects.filter(preview_blob=blob).update(preview_image=name)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('animation', '0013_blob_thumbnails'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_legacy_blob_files, migrations.RunPython.noop),
+    ]
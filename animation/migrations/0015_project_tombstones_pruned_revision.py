@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('animation', '0014_move_legacy_blob_files'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='animationproject',
+            name='tombstones_pruned_revision',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Надгробия удалены до ревизии'),
+        ),
+    ]
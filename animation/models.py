@@ -1,5 +1,11 @@
+from django.core.exceptions import FieldError
 from django.db import models
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+from .fields import CompressedTextField
 
 
 class AnimationProject(models.Model):
@@ -11,26 +17,142 @@ class AnimationProject(models.Model):
     fps = models.PositiveIntegerField(default=12, verbose_name='Кадров в секунду')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создано')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Обновлено')
+    # счётчик изменений кадров: растёт на каждое создание, удаление, перенос
+    # или сохранение кадра; по нему работает лента frames_list?since=
+    revision = models.PositiveBigIntegerField(default=0, verbose_name='Ревизия кадров')
+    # надгробия с ревизией не больше этой удалены сборщиком (gc_media): клиенту,
+    # видевшему более раннюю ревизию, лента отдаёт полный список
+    tombstones_pruned_revision = models.PositiveBigIntegerField(
+        default=0, verbose_name='Надгробия удалены до ревизии',
+    )
     # на будущее можно добавить audio = FileField(...)
 
     def __str__(self):
         return self.title
 
 
+class Blob(models.Model):
+    """
+    Файл в хранилище, адресуемый SHA-256 содержимого.
+    Одинаковые превью (пустые и «держащие» кадры, копии) хранятся один раз;
+    refcount — сколько кадров на него ссылается.
+    """
+    sha256 = models.CharField(max_length=64, unique=True, verbose_name='SHA-256 содержимого')
+    file = models.FileField(upload_to='blobs/', max_length=255, verbose_name='Файл')
+    size = models.PositiveIntegerField(default=0, verbose_name='Размер (байт)')
+    refcount = models.PositiveIntegerField(default=0, verbose_name='Число ссылок')
+    # размеры готовых миниатюр (thumbnails.THUMBNAIL_SIZES); None — ещё не строились,
+    # [] — превью само меньше любой миниатюры
+    thumbnail_sizes = models.JSONField(null=True, blank=True, default=None, verbose_name='Размеры миниатюр')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создано')
+
+    def __str__(self):
+        return self.sha256
+
+
+# шаг между соседними ключами position: вставка между кадрами берёт середину промежутка
+FRAME_POSITION_STEP = 1024
+
+
+class FrameQuerySet(models.QuerySet):
+    def with_index(self):
+        """
+        Добавляет номер кадра index (1..N) — ранг по position внутри проекта.
+        Номер считается оконной функцией до WHERE, поэтому применять к выборке
+        всех кадров проекта, а не к отфильтрованному куску.
+        """
+        return self.annotate(
+            index=Window(
+                expression=RowNumber(),
+                partition_by=[F('project_id')],
+                order_by=[F('position').asc()],
+            ),
+        ).order_by('project', 'position')
+
+    def index_of(self, frame):
+        """Номер одного кадра — COUNT кадров перед ним; with_index() для одной строки не годится."""
+        return self.filter(project_id=frame.project_id, position__lt=frame.position).count() + 1
+
+
 class Frame(models.Model):
     project = models.ForeignKey(AnimationProject, on_delete=models.CASCADE, related_name='frames')
-    index = models.PositiveIntegerField(verbose_name='Номер кадра')
-    content_json = models.TextField(blank=True, verbose_name='JSON содержимого кадра')
+    # разреженный ключ порядка: перестановка или удаление кадра меняет одну строку,
+    # а не перенумеровывает весь проект; публичный номер кадра (index) выводится из него
+    position = models.BigIntegerField(verbose_name='Позиция кадра')
     preview_image = models.ImageField(upload_to='frames/', blank=True, null=True, verbose_name='Превью кадра')
+    # preview_image.name указывает на файл этого блоба; ссылка нужна для подсчёта refcount
+    preview_blob = models.ForeignKey(
+        Blob,
+        on_delete=models.PROTECT,
+        related_name='frames',
+        blank=True,
+        null=True,
+        verbose_name='Блоб превью',
+    )
+    # хэш содержимого, присланный редактором при последнем сохранении пикселей:
+    # повторное сохранение с тем же хэшем (If-None-Match) отклоняется без записи
+    content_hash = models.CharField(max_length=64, blank=True, verbose_name='Хэш содержимого')
+    # ревизия проекта, на которой кадр менялся последний раз
+    revision = models.PositiveBigIntegerField(default=0, verbose_name='Ревизия изменения')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создано')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Обновлено')
 
+    objects = FrameQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['project', 'position']
+        unique_together = ('project', 'position')
+        indexes = [models.Index(fields=['project', 'revision'])]
+
+    @property
+    def index(self):
+        """
+        Номер кадра 1..N. Не хранится: его задаёт with_index(), index_of() или код,
+        который номер уже знает. Без этого — ошибка, а не скрытый запрос на каждый кадр.
+        """
+        try:
+            return self.__dict__['_index']
+        except KeyError:
+            raise FieldError('Номер кадра не загружен: выберите кадры через with_index() или задайте index.') from None
+
+    @index.setter
+    def index(self, value):
+        self._index = value
+
+    def __str__(self):
+        index = self.__dict__.get('_index')
+        return f'{self.project.title} — кадр {index if index is not None else f"#{self.pk}"}'
+
+
+class FrameContent(models.Model):
+    """
+    JSON содержимого кадра отдельно от Frame: таймлайн, перестановки и списки
+    читают только лёгкие строки кадров, а содержимое растёт без ограничений.
+    Загружается явно — в frame_detail и при экспорте.
+    """
+    frame = models.OneToOneField(Frame, on_delete=models.CASCADE, primary_key=True, related_name='content')
+    # в базе — сжатые байты (см. fields.CompressedTextField), в Python — обычная строка
+    content_json = CompressedTextField(blank=True, default='', verbose_name='JSON содержимого кадра')
+
+    def __str__(self):
+        return f'Содержимое: {self.frame}'
+
+
+class FrameTombstone(models.Model):
+    """
+    След удалённого кадра для ленты изменений frames_list?since=:
+    клиент, видевший ревизию раньше revision, убирает кадр frame_id у себя.
+    """
+    project = models.ForeignKey(AnimationProject, on_delete=models.CASCADE, related_name='frame_tombstones')
+    frame_id = models.PositiveBigIntegerField(verbose_name='ID удалённого кадра')
+    revision = models.PositiveBigIntegerField(verbose_name='Ревизия удаления')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Удалён')
+
     class Meta:
-        ordering = ['project', 'index']
-        unique_together = ('project', 'index')
+        indexes = [models.Index(fields=['project', 'revision'])]
 
     def __str__(self):
-        return f'{self.project.title} — кадр {self.index}'
+        return f'{self.project} — удалён кадр #{self.frame_id}'
 
 
 class Layer(models.Model):
@@ -39,9 +161,78 @@ class Layer(models.Model):
     name = models.CharField(max_length=200, verbose_name='Название слоя')
     visible = models.BooleanField(default=True, verbose_name='Видим')
     opacity = models.PositiveSmallIntegerField(default=100, verbose_name='Прозрачность (0-100)')
+    raster = models.ImageField(upload_to='layers/', blank=True, null=True, verbose_name='Пиксели слоя (PNG)')
+    raster_version = models.PositiveIntegerField(default=0, verbose_name='Версия пикселей слоя')
 
     class Meta:
         ordering = ['frame', 'order', 'id']
 
     def __str__(self):
         return f'{self.frame} — {self.name}'
+
+
+class LayerTile(models.Model):
+    """
+    Изменённый квадрат слоя поверх layer.raster (сетка RASTER_TILE_SIZE).
+    Полный PNG слоя собирается из растра и плиток только когда его запрашивают.
+    """
+    layer = models.ForeignKey(Layer, on_delete=models.CASCADE, related_name='tiles')
+    col = models.PositiveIntegerField(verbose_name='Столбец плитки')
+    row = models.PositiveIntegerField(verbose_name='Строка плитки')
+    image = models.ImageField(upload_to='tiles/', verbose_name='Пиксели плитки (PNG)')
+
+    class Meta:
+        ordering = ['layer', 'row', 'col']
+        unique_together = ('layer', 'col', 'row')
+
+    def __str__(self):
+        return f'{self.layer} — плитка {self.col}:{self.row}'
+
+
+class Job(models.Model):
+    """
+    Фоновая задача (экспорт, миниатюры, чистка медиа). Очередь — сама эта таблица,
+    выполняет её manage.py run_jobs. Путь задачи: queued -> running -> succeeded,
+    failed или cancelled; упавшая задача возвращается в queued, пока есть попытки.
+    """
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CANCELLED = 'cancelled'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'В очереди'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_SUCCEEDED, 'Готово'),
+        (STATUS_FAILED, 'Ошибка'),
+        (STATUS_CANCELLED, 'Отменено'),
+    ]
+    FINISHED_STATUSES = (STATUS_SUCCEEDED, STATUS_FAILED, STATUS_CANCELLED)
+
+    kind = models.CharField(max_length=50, verbose_name='Тип задачи')
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='animation_jobs')
+    project = models.ForeignKey(
+        AnimationProject, on_delete=models.CASCADE, null=True, blank=True, related_name='jobs',
+    )
+    params = models.JSONField(default=dict, blank=True, verbose_name='Параметры')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED, verbose_name='Статус')
+    progress_done = models.PositiveIntegerField(default=0, verbose_name='Сделано шагов')
+    progress_total = models.PositiveIntegerField(default=0, verbose_name='Всего шагов')
+    result = models.JSONField(default=dict, blank=True, verbose_name='Результат')
+    error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')
+    max_attempts = models.PositiveSmallIntegerField(default=3, verbose_name='Максимум попыток')
+    # выполняющуюся задачу отменяет сам воркер, увидев флаг при очередном отчёте о прогрессе
+    cancel_requested = models.BooleanField(default=False, verbose_name='Запрошена отмена')
+    run_after = models.DateTimeField(default=timezone.now, verbose_name='Не раньше')
+    worker = models.CharField(max_length=100, blank=True, verbose_name='Воркер')
+    heartbeat_at = models.DateTimeField(null=True, blank=True, verbose_name='Последний сигнал воркера')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Создано')
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name='Начато')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='Завершено')
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'run_after'])]
+
+    def __str__(self):
+        return f'{self.kind} #{self.pk} ({self.status})'
@@ -0,0 +1,158 @@
+import io
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import Q
+from PIL import Image
+
+from .blobs import set_frame_preview
+from .jobs import enqueue_job
+from .models import Frame, Job
+from .revisions import record_frame_changes
+
+# сторона квадратной плитки, которой редактор отправляет изменения слоя
+RASTER_TILE_SIZE = 256
+
+
+def tile_grid_size(width, height):
+    """Сколько столбцов и строк плиток покрывают холст."""
+    cols = (width + RASTER_TILE_SIZE - 1) // RASTER_TILE_SIZE
+    rows = (height + RASTER_TILE_SIZE - 1) // RASTER_TILE_SIZE
+    return cols, rows
+
+
+def read_image(file_field):
+    with file_field.open('rb') as image_file:
+        image = Image.open(image_file)
+        image.load()
+    return image.convert('RGBA')
+
+
+def open_layer_image(layer, size, tiles=None):
+    """
+    Читает слой в RGBA нужного размера (размер холста проекта):
+    базовый PNG слоя, поверх которого целиком заменяются сохранённые плитки.
+    """
+    if layer.raster:
+        image = read_image(layer.raster)
+        if image.size != size:
+            image = image.resize(size)
+    else:
+        image = Image.new('RGBA', size, (0, 0, 0, 0))
+
+    if tiles is None:
+        tiles = layer.tiles.all()
+    for tile in tiles:
+        tile_image = read_image(tile.image)
+        left = tile.col * RASTER_TILE_SIZE
+        top = tile.row * RASTER_TILE_SIZE
+        width = min(tile_image.width, size[0] - left)
+        height = min(tile_image.height, size[1] - top)
+        if width <= 0 or height <= 0:
+            continue
+        if tile_image.size != (width, height):
+            tile_image = tile_image.crop((0, 0, width, height))
+        # paste без маски: плитка заменяет пиксели, включая прозрачные
+        image.paste(tile_image, (left, top))
+    return image
+
+
+def compose_layers(layers, size):
+    """
+    Сводит слои снизу вверх так же, как flattenLayers в editor.js:
+    скрытые слои пропускаются, прозрачность слоя умножается на альфу пикселей.
+    """
+    result = Image.new('RGBA', size, (0, 0, 0, 0))
+    ordered = sorted(layers, key=lambda item: (item.order, item.pk))
+    for layer in ordered:
+        if not layer.visible or not layer.raster_version:
+            continue
+        image = open_layer_image(layer, size)
+        if layer.opacity < 100:
+            opacity = max(0, layer.opacity)
+            alpha = image.getchannel('A').point(lambda value: value * opacity // 100)
+            image.putalpha(alpha)
+        result.alpha_composite(image)
+    return result
+
+
+def encode_png(image):
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def compose_frame_preview(frame, layers):
+    """
+    Пересобирает плоское превью кадра из сохранённых растров слоёв
+    (одинаковые картинки ложатся в один блоб). Кадр не сохраняется — это делает вызывающий код.
+    Возвращает False, если превью не изменилось.
+    """
+    project = frame.project
+    size = (project.width, project.height)
+    preview = compose_layers(layers, size)
+    return set_frame_preview(frame, encode_png(preview), 'png')
+
+
+def compact_layer_raster(layer, size):
+    """
+    Вклеивает накопленные плитки в базовый PNG слоя и удаляет их.
+    Плитку, которую успели перезаписать во время сборки, не трогаем.
+    """
+    tiles = list(layer.tiles.all())
+    if not tiles:
+        return False
+
+    image = open_layer_image(layer, size, tiles=tiles)
+    filename = f'project_{layer.frame.project_id}_layer_{layer.pk}.png'
+    with transaction.atomic():
+        layer.raster.save(filename, ContentFile(encode_png(image)), save=False)
+        layer.save(update_fields=['raster'])
+        merged = Q()
+        for tile in tiles:
+            merged |= Q(pk=tile.pk, image=tile.image.name)
+        layer.tiles.filter(merged).delete()
+    return True
+
+
+def job_worker_enabled():
+    """Запущен ли воркер run_jobs (settings.ANIMATION_JOB_WORKER). По умолчанию — нет, как при runserver."""
+    return bool(getattr(settings, 'ANIMATION_JOB_WORKER', False))
+
+
+def schedule_frame_rasters(frame):
+    """
+    Ставит в очередь задачу frame_rasters (rebuild_frame_rasters) для кадра,
+    если такая ещё не ждёт: несколько сохранений подряд дают одну задачу.
+    Без воркера задачу некому выполнить — кадр собирается сразу после коммита сохранения.
+    """
+    if not job_worker_enabled():
+        frame_id = frame.pk
+        transaction.on_commit(lambda: rebuild_frame_rasters(frame_id))
+        return
+    pending = Job.objects.filter(kind='frame_rasters', status=Job.STATUS_QUEUED, params__frame_id=frame.pk)
+    if not pending.exists():
+        enqueue_job('frame_rasters', {'frame_id': frame.pk})
+
+
+def rebuild_frame_rasters(frame_id):
+    """
+    Отложенная часть сохранения слоёв: вклеивает накопленные плитки в растры слоёв кадра
+    и пересобирает его плоское превью. Строка кадра заблокирована на всё время работы —
+    layers_save блокирует её же, поэтому свежий растр или плитку не перезапишет устаревшая сборка.
+    Новое превью сдвигает ревизию кадра (revisions.record_frame_changes),
+    чтобы frames_list?since= отдал его клиентам.
+    """
+    with transaction.atomic():
+        frame = Frame.objects.select_for_update().select_related('project').filter(pk=frame_id).first()
+        if frame is None:
+            return {'compacted_layers': 0, 'preview_changed': False}
+        size = (frame.project.width, frame.project.height)
+        compacted = sum(1 for layer in frame.layers.prefetch_related('tiles') if compact_layer_raster(layer, size))
+        # слои читаются заново: после сборки у них новые растры и нет плиток
+        preview_changed = compose_frame_preview(frame, frame.layers.prefetch_related('tiles'))
+        if preview_changed:
+            frame.save(update_fields=['preview_blob', 'preview_image', 'updated_at'])
+            record_frame_changes(frame.project, [frame.pk])
+    return {'compacted_layers': compacted, 'preview_changed': preview_changed}
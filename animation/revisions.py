@@ -0,0 +1,41 @@
+"""
+Ревизии кадров для ленты frames_list?since=. Ими пользуются и представления,
+и фоновые задачи (миниатюры, сборка растров), поэтому они не во views.
+"""
+from django.db.models import F
+from django.utils import timezone
+
+from .models import AnimationProject, Frame, FrameTombstone
+
+REVISION_BATCH_SIZE = 500
+
+
+def next_project_revision(project):
+    """
+    Следующая ревизия кадров проекта; заодно сдвигает updated_at (ETag frames_list).
+    UPDATE держит блокировку строки проекта до конца транзакции,
+    поэтому параллельные изменения получают ревизии строго по очереди.
+    """
+    now = timezone.now()
+    AnimationProject.objects.filter(pk=project.pk).update(revision=F('revision') + 1, updated_at=now)
+    project.revision = AnimationProject.objects.values_list('revision', flat=True).get(pk=project.pk)
+    project.updated_at = now
+    return project.revision
+
+
+def record_frame_changes(project, changed_pks=(), deleted_pks=()):
+    """
+    Записывает изменения в ленту frames_list?since=: новым и изменённым кадрам
+    ставится свежая ревизия, на удалённые остаются надгробия.
+    Вызывать в той же транзакции, что и сами изменения.
+    """
+    revision = next_project_revision(project)
+    changed_pks = list(changed_pks)
+    for start in range(0, len(changed_pks), REVISION_BATCH_SIZE):
+        batch = changed_pks[start:start + REVISION_BATCH_SIZE]
+        Frame.objects.filter(pk__in=batch).update(revision=revision)
+    FrameTombstone.objects.bulk_create(
+        [FrameTombstone(project=project, frame_id=frame_id, revision=revision) for frame_id in deleted_pks],
+        batch_size=REVISION_BATCH_SIZE,
+    )
+    return revision
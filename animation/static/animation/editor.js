@@ -44,6 +44,7 @@ const canvasWrapper = document.querySelector('.canvas-wrapper');
 const toolButtons = document.querySelectorAll('.tool-button[data-tool]');
 const selectionModeButtons = document.querySelectorAll('[data-select-mode]');
 const wandSensitivityInput = document.getElementById('wand-sensitivity');
+const fillAntialiasInput = document.getElementById('fill-antialias');
 const colorInput = document.getElementById('color-picker');
 const sizeInput = document.getElementById('brush-size');
 const saveButton = document.getElementById('save-project-button');
@@ -70,11 +71,15 @@ const deleteFrameButton = document.getElementById('delete-frame-button');
 const projectSaveUrl = (editorRoot && editorRoot.dataset.projectSaveUrl)
     || window.ANIM_PROJECT_SAVE_URL
     || '';
+const projectBundleUrl = (editorRoot && editorRoot.dataset.projectBundleUrl) || '';
 const framesListUrl = (editorRoot && editorRoot.dataset.framesListUrl) || '';
 const frameDetailUrlTemplate = (editorRoot && editorRoot.dataset.frameDetailUrlTemplate) || '';
 const frameCreateUrl = (editorRoot && editorRoot.dataset.frameCreateUrl) || '';
 const frameDeleteUrlTemplate = (editorRoot && editorRoot.dataset.frameDeleteUrlTemplate) || '';
 const frameReorderUrl = (editorRoot && editorRoot.dataset.frameReorderUrl) || '';
+const framesRangeDuplicateUrl = (editorRoot && editorRoot.dataset.framesRangeDuplicateUrl) || '';
+const framesRangeDeleteUrl = (editorRoot && editorRoot.dataset.framesRangeDeleteUrl) || '';
+const framesRangeMoveUrl = (editorRoot && editorRoot.dataset.framesRangeMoveUrl) || '';
 const frameSaveUrlTemplate = (editorRoot && editorRoot.dataset.frameSaveUrlTemplate)
     || window.ANIM_FRAME_SAVE_URL_TEMPLATE
     || '';
@@ -82,6 +87,15 @@ const layerListUrlTemplate = (editorRoot && editorRoot.dataset.layerListUrlTempl
     || '';
 const layerReorderUrlTemplate = (editorRoot && editorRoot.dataset.layerReorderUrlTemplate)
     || '';
+const layerSaveUrlTemplate = (editorRoot && editorRoot.dataset.layerSaveUrlTemplate)
+    || '';
+const projectWidth = parseInt((editorRoot && editorRoot.dataset.projectWidth) || '', 10) || 1280;
+const projectHeight = parseInt((editorRoot && editorRoot.dataset.projectHeight) || '', 10) || 720;
+const RASTER_TILE_SIZE = parseInt((editorRoot && editorRoot.dataset.rasterTileSize) || '', 10) || 256;
+// не больше плиток за запрос: лимит числа файлов Django (DATA_UPLOAD_MAX_NUMBER_FILES) и размер тела
+const MAX_TILES_PER_REQUEST = 64;
+const encodeWorkerUrl = (editorRoot && editorRoot.dataset.encodeWorkerUrl) || '';
+const floodFillWorkerUrl = (editorRoot && editorRoot.dataset.floodFillWorkerUrl) || '';
 const layerUpdateUrlTemplate = (editorRoot && editorRoot.dataset.layerUpdateUrlTemplate)
     || '';
 const layerDeleteUrlTemplate = (editorRoot && editorRoot.dataset.layerDeleteUrlTemplate)
@@ -123,11 +137,21 @@ let layersPanelOffsetY = 0;
 let isOpacityDragging = false;
 
 let isDrawing = false;
+// заливка или волшебная палочка ждут маску из воркера
+let isFillPending = false;
 let activeTool = null;
 let lastX = 0;
 let lastY = 0;
 let startX = 0;
 let startY = 0;
+// штрих кисти: отсчёты указателя копятся до кадра анимации и рисуются сплайном
+let strokeSamples = [];
+let strokePredicted = [];
+let strokeControlPoint = null;
+let strokePathEnd = null;
+let strokeFrameId = null;
+let strokeTailRect = null;
+let canvasMetricsCache = null;
 
 let isSelecting = false;
 let selectionMode = SELECT_RECT;
@@ -143,6 +167,13 @@ let lastPointerX = null;
 let lastPointerY = null;
 let selectionScratchCanvas = null;
 let selectionScratchCtx = null;
+let selectionAnimationLastTime = 0;
+let shapePreviewRect = null;
+// повреждённые области слоёв до ближайшего кадра: слой -> прямоугольник в координатах кадра (null — весь слой)
+let layerDamage = new Map();
+let layerRenderFrameId = null;
+const layersPendingPreview = new Set();
+let layerPreviewTimerId = null;
 let lastDebugAt = 0;
 
 let isTransformingSelection = false;
@@ -172,20 +203,36 @@ const MAX_SCALE = 8;
 const SCALE_STEP = 1.1;
 const SELECTION_MIN_SIZE = 4;
 const LASSO_POINT_DISTANCE = 2;
-const SELECTION_DASH_SPEED = 0.8;
+// скорость «бегущих муравьёв» в пикселях в секунду и частота их перерисовки
+const SELECTION_DASH_SPEED = 48;
+const SELECTION_ANIMATION_INTERVAL_MS = 100;
+// отсчёты штриха ближе этого (в пикселях кадра) к предыдущему не добавляют сегмент
+const STROKE_MIN_SAMPLE_DISTANCE = 0.5;
+// дорисовывать прогноз браузера (getPredictedEvents) временным хвостом штриха
+const STROKE_PREDICTION = true;
 const WAND_DEFAULT_TOLERANCE = 32;
+// заливка берёт пиксели точно цвета старта; сглаженный край (полупрозрачное покрытие
+// пикселей у границы) — опция инструмента, по умолчанию выключена: пиксель-арт заливается без ореола
+const FILL_TOLERANCE = 0;
+const FILL_ANTIALIAS = false;
 const EYEDROPPER_ZOOM_SIZE = 120;
 const EYEDROPPER_ZOOM_PIXELS = 15;
 const EYEDROPPER_ZOOM_OFFSET = 18;
 const LAYER_PREVIEW_SIZE = 32;
+// превью слоя в списке при частичной перерисовке обновляется не чаще этого
+const LAYER_PREVIEW_DELAY_MS = 250;
 const DEBUG_COORDS = true;
 const DEBUG_COORDS_THROTTLE_MS = 200;
 const TRANSFORM_HANDLE_SIZE_PX = 10;
 const TRANSFORM_HANDLE_HIT_PX = 16;
 const TRANSFORM_HINT_OFFSET = 14;
+// запас вокруг повреждённой области на экране: сглаживание при масштабе и ручки трансформации
+const RENDER_DAMAGE_PADDING_PX = 2;
+const OVERLAY_DAMAGE_PADDING_PX = TRANSFORM_HANDLE_SIZE_PX + 2;
 let wandTolerance = wandSensitivityInput
     ? parseInt(wandSensitivityInput.value, 10) || WAND_DEFAULT_TOLERANCE
     : WAND_DEFAULT_TOLERANCE;
+let fillAntialias = fillAntialiasInput ? fillAntialiasInput.checked : FILL_ANTIALIAS;
 
 // =======================
 // Состояние сохранения
@@ -197,23 +244,60 @@ let hasUnsavedChanges = false;
 let isSaving = false;
 let isAutosaving = false;
 let lastSavedAt = null;
+// хэш содержимого кадра на момент последнего сохранения/загрузки (см. computeFrameContentHash)
+let lastSavedContentHash = '';
+// счётчик правок кадра: сохранение запоминает его вместе со снимком и по нему видит,
+// правили ли кадр, пока запрос был в пути
+let frameEditGeneration = 0;
 let autosaveTimerId = null;
 let lastSavedTickerId = null;
 let currentFrameId = null;
 let timelineFrames = [];
+// ревизия кадров проекта, по которую timelineFrames совпадает с сервером (null — список ещё не загружен)
+let timelineRevision = null;
+// кадр и слои из project_bundle (или снимок при уходе с кадра): id кадра -> { frame, layers };
+// переход на такой кадр обходится без запроса frame_detail
+const frameBundleCache = new Map();
+// декодированные кадры для мгновенного перехода: id кадра -> { updatedAt, frame, layers, bitmaps, bytes },
+// bitmaps — ImageBitmap растров слоёв по raster_url; порядок Map — от давно открытых кадров к недавним
+const decodedFrameCache = new Map();
+let decodedFrameBytes = 0;
+// кадры, которые сейчас догружаются в фоне: id кадра -> Promise
+const framePrefetches = new Map();
+let framePrefetchGeneration = 0;
 let isSwitchingFrame = false;
 let dragFrameId = null;
+// выделенный Shift+кликом диапазон кадров { start, end } (номера, включительно)
+let timelineSelection = null;
 let panStartedByMiddle = false;
 
 const AUTOSAVE_INTERVAL_MS = 30000;
 const LAST_SAVED_TICK_MS = 1000;
+// превью кадра после сохранения слоёв сводит воркер (задача frame_rasters):
+// через эту паузу лента frames_list?since= обычно уже отдаёт новое превью
+const FRAME_PREVIEW_REFRESH_DELAY_MS = 2000;
+let framePreviewRefreshTimerId = null;
+// сколько памяти занимают декодированные соседние и недавние кадры; сверх — уходят давно открытые
+const FRAME_CACHE_BUDGET = 192 * 1024 * 1024;
+// сколько кадров в каждую сторону от текущего декодируются заранее
+const FRAME_PREFETCH_RADIUS = 2;
 
 // =======================
 // История действий
 // =======================
 
 const HISTORY_LIMIT = 50;
+// общий на все кадры лимит пикселей в истории: сверх него уходят самые старые
+// шаги кадров, которые открывали давнее всех
+const HISTORY_MEMORY_BUDGET = 256 * 1024 * 1024;
+// плитка, залитая одним цветом, хранится как этот цвет — учитываем её условным размером
+const HISTORY_FILL_TILE_BYTES = 16;
+// ключ -> история кадра; порядок Map — от давно открытых кадров к недавним
 const frameHistories = new Map();
+let historyBytes = 0;
+// копия слоя на начало мазка: по ней берутся «до» для плиток, которые мазок задел
+let historyBeforeCanvas = null;
+let historyBeforeCtx = null;
 let isHistoryApplying = false;
 let didDrawStroke = false;
 let lastDrawTool = null;
@@ -253,6 +337,9 @@ function setTool(toolName) {
     if (toolName !== TOOL_EYEDROPPER) {
         hideEyedropperZoom();
     }
+    if (fillAntialiasInput) {
+        fillAntialiasInput.disabled = toolName !== TOOL_FILL;
+    }
     updateCursor();
 }
 
@@ -358,16 +445,20 @@ function getHistoryKey() {
 
 function getFrameHistory() {
     const key = getHistoryKey();
-    if (!frameHistories.has(key)) {
-        frameHistories.set(key, {
+    let history = frameHistories.get(key);
+    if (!history) {
+        history = {
             key,
             entries: [],
             position: 0,
             baselineLabel: 'Старт кадра',
             isTrimmed: false,
-        });
+        };
     }
-    return frameHistories.get(key);
+    // в конец Map: история текущего кадра вытесняется последней
+    frameHistories.delete(key);
+    frameHistories.set(key, history);
+    return history;
 }
 
 function getToolHistoryLabel(toolName) {
@@ -380,32 +471,96 @@ function getToolHistoryLabel(toolName) {
     return 'Действие';
 }
 
-function captureLayerImage(layer) {
-    if (!layer || !layer.bufferCtx || !layer.bufferCanvas) return null;
+/**
+ * Плитка истории: пиксели прямоугольника слоя. Плитка одного цвета (чаще всего
+ * пустая — «до» первого мазка по слою) хранится только цветом, без ImageData.
+ */
+function packHistoryTile(ctx, left, top, width, height) {
+    const imageData = ctx.getImageData(left, top, width, height);
+    const pixels = new Uint32Array(imageData.data.buffer);
+    const first = pixels[0];
+    let isUniform = true;
+    for (let i = 1; i < pixels.length; i += 1) {
+        if (pixels[i] !== first) {
+            isUniform = false;
+            break;
+        }
+    }
+    return isUniform
+        ? { left, top, width, height, fill: first, imageData: null }
+        : { left, top, width, height, fill: null, imageData };
+}
+
+function historyTileBytes(tile) {
+    return tile && tile.imageData ? tile.imageData.data.byteLength : HISTORY_FILL_TILE_BYTES;
+}
+
+function isSameHistoryTile(a, b) {
+    if (a.imageData === null || b.imageData === null) {
+        return a.imageData === b.imageData && a.fill === b.fill;
+    }
+    const left = new Uint32Array(a.imageData.data.buffer);
+    const right = new Uint32Array(b.imageData.data.buffer);
+    for (let i = 0; i < left.length; i += 1) {
+        if (left[i] !== right[i]) return false;
+    }
+    return true;
+}
+
+function putHistoryTile(ctx, tile) {
+    if (tile.imageData) {
+        ctx.putImageData(tile.imageData, tile.left, tile.top);
+        return;
+    }
+    if (tile.fill === 0) {
+        ctx.clearRect(tile.left, tile.top, tile.width, tile.height);
+        return;
+    }
+    const imageData = ctx.createImageData(tile.width, tile.height);
+    new Uint32Array(imageData.data.buffer).fill(tile.fill);
+    ctx.putImageData(imageData, tile.left, tile.top);
+}
+
+function getTileRect(sourceCanvas, key) {
+    const [col, row] = key.split('_').map(Number);
+    const left = col * RASTER_TILE_SIZE;
+    const top = row * RASTER_TILE_SIZE;
+    const width = Math.min(RASTER_TILE_SIZE, sourceCanvas.width - left);
+    const height = Math.min(RASTER_TILE_SIZE, sourceCanvas.height - top);
+    if (width <= 0 || height <= 0) return null;
+    return { left, top, width, height };
+}
+
+/**
+ * Непустые плитки слоя — пиксели слоя, который исчезает из кадра (удаление слоя).
+ */
+function captureLayerTiles(layer) {
+    if (!layer || !layer.bufferCtx || !layer.bufferCanvas) return [];
+    const tiles = [];
+    const cols = Math.ceil(layer.bufferCanvas.width / RASTER_TILE_SIZE);
+    const rows = Math.ceil(layer.bufferCanvas.height / RASTER_TILE_SIZE);
     try {
-        return layer.bufferCtx.getImageData(0, 0, layer.bufferCanvas.width, layer.bufferCanvas.height);
+        for (let row = 0; row < rows; row += 1) {
+            for (let col = 0; col < cols; col += 1) {
+                const rect = getTileRect(layer.bufferCanvas, `${col}_${row}`);
+                if (!rect) continue;
+                const tile = packHistoryTile(layer.bufferCtx, rect.left, rect.top, rect.width, rect.height);
+                if (tile.imageData || tile.fill !== 0) tiles.push(tile);
+            }
+        }
     } catch (error) {
         console.warn('Не удалось сохранить слой для истории', error);
-        return null;
     }
+    return tiles;
 }
 
-function captureFullSnapshot() {
-    if (!canvas || !layers.length) return null;
-    const snapshotLayers = layers.map((layer) => {
-        ensureLayerCanvases(layer);
-        return {
-            id: layer.id,
-            name: layer.name,
-            order: layer.order,
-            visible: layer.visible,
-            opacity: layer.opacity,
-            imageData: captureLayerImage(layer),
-        };
-    });
+function getLayerMeta(layer) {
     return {
-        activeLayerId,
-        layers: snapshotLayers,
+        id: layer.id,
+        name: layer.name,
+        order: layer.order,
+        visible: layer.visible,
+        opacity: layer.opacity,
     };
 }
 
@@ -418,6 +573,16 @@ function cancelPendingHistory() {
     historyPending = null;
 }
 
+/**
+ * addDirtyTiles сообщает сюда, какие плитки задело действие:
+ * в шаг истории попадут только они.
+ */
+function noteHistoryTiles(layer, keys) {
+    if (!historyPending || historyPending.type !== 'layer' || isHistoryApplying) return;
+    if (layer.id !== historyPending.layerId) return;
+    keys.forEach((key) => historyPending.touchedTiles.add(key));
+}
+
 function beginLayerHistory(label) {
     if (isHistoryApplying) return;
     if (historyPending) {
@@ -427,67 +592,146 @@ function beginLayerHistory(label) {
     const layer = getLayerById(activeLayerId);
     if (!layer) return;
     ensureLayerCanvases(layer);
-    const beforeImage = captureLayerImage(layer);
-    if (!beforeImage) return;
+    if (!layer.bufferCanvas) return;
+    // копия холстом, а не getImageData всего слоя: пиксели читаются потом,
+    // и только у задетых плиток
+    if (!historyBeforeCanvas) {
+        historyBeforeCanvas = document.createElement('canvas');
+    }
+    if (historyBeforeCanvas.width !== layer.bufferCanvas.width
+        || historyBeforeCanvas.height !== layer.bufferCanvas.height) {
+        historyBeforeCanvas.width = layer.bufferCanvas.width;
+        historyBeforeCanvas.height = layer.bufferCanvas.height;
+        historyBeforeCtx = null;
+    }
+    if (!historyBeforeCtx) {
+        historyBeforeCtx = historyBeforeCanvas.getContext('2d', { willReadFrequently: true });
+    }
+    if (!historyBeforeCtx) return;
+    historyBeforeCtx.clearRect(0, 0, historyBeforeCanvas.width, historyBeforeCanvas.height);
+    historyBeforeCtx.drawImage(layer.bufferCanvas, 0, 0);
     historyPending = {
         type: 'layer',
         label: label || 'Действие',
         layerId: layer.id,
-        beforeImage,
+        touchedTiles: new Set(),
     };
 }
 
 function commitLayerHistory() {
     if (!historyPending || historyPending.type !== 'layer') return;
-    const layer = getLayerById(historyPending.layerId);
-    if (!layer) {
-        historyPending = null;
-        return;
-    }
-    ensureLayerCanvases(layer);
-    const afterImage = captureLayerImage(layer);
-    if (!afterImage || !historyPending.beforeImage) {
-        historyPending = null;
+    const pending = historyPending;
+    historyPending = null;
+    const layer = getLayerById(pending.layerId);
+    if (!layer || !layer.bufferCtx || !layer.bufferCanvas || !historyBeforeCtx) return;
+
+    const tiles = [];
+    try {
+        pending.touchedTiles.forEach((key) => {
+            const rect = getTileRect(layer.bufferCanvas, key);
+            if (!rect) return;
+            const before = packHistoryTile(historyBeforeCtx, rect.left, rect.top, rect.width, rect.height);
+            const after = packHistoryTile(layer.bufferCtx, rect.left, rect.top, rect.width, rect.height);
+            if (!isSameHistoryTile(before, after)) {
+                tiles.push({ before, after });
+            }
+        });
+    } catch (error) {
+        console.warn('Не удалось сохранить слой для истории', error);
         return;
     }
     pushHistoryEntry({
         type: 'layer',
-        label: historyPending.label,
+        label: pending.label,
         createdAt: Date.now(),
-        layerId: historyPending.layerId,
-        beforeImage: historyPending.beforeImage,
-        afterImage,
+        layerId: pending.layerId,
+        tiles,
+        bytes: tiles.reduce((sum, tile) => sum + historyTileBytes(tile.before) + historyTileBytes(tile.after), 0),
     });
-    historyPending = null;
 }
 
+/**
+ * Действия со списком слоёв (добавить, удалить, порядок, имя, видимость,
+ * прозрачность) пикселей не рисуют: шаг хранит свойства слоёв, а пиксели —
+ * только у слоя, который появился или исчез.
+ */
 function beginFullHistory(label) {
     if (isHistoryApplying) return;
     cancelPendingHistory();
-    const beforeSnapshot = captureFullSnapshot();
-    if (!beforeSnapshot) return;
+    if (!canvas || !layers.length) return;
     historyPending = {
         type: 'full',
         label: label || 'Действие',
-        beforeSnapshot,
+        activeLayerId,
+        layers: layers.map((layer) => ({ meta: getLayerMeta(layer), layer })),
     };
 }
 
 function commitFullHistory() {
     if (!historyPending || historyPending.type !== 'full') return;
-    const afterSnapshot = captureFullSnapshot();
-    if (!afterSnapshot || !historyPending.beforeSnapshot) {
-        historyPending = null;
-        return;
-    }
+    const pending = historyPending;
+    historyPending = null;
+    if (!canvas || !layers.length) return;
+
+    const beforeIds = new Set(pending.layers.map((item) => item.meta.id));
+    const afterIds = new Set(layers.map((layer) => layer.id));
+    const beforeSnapshot = {
+        activeLayerId: pending.activeLayerId,
+        layers: pending.layers.map(({ meta, layer }) => ({
+            ...meta,
+            tiles: afterIds.has(meta.id) ? null : captureLayerTiles(layer),
+        })),
+    };
+    const afterSnapshot = {
+        activeLayerId,
+        layers: layers.map((layer) => ({
+            ...getLayerMeta(layer),
+            tiles: beforeIds.has(layer.id) ? null : captureLayerTiles(layer),
+        })),
+    };
+    const snapshotBytes = (snapshot) => snapshot.layers.reduce(
+        (sum, layer) => sum + (layer.tiles || []).reduce((tileSum, tile) => tileSum + historyTileBytes(tile), 0),
+        0,
+    );
     pushHistoryEntry({
         type: 'full',
-        label: historyPending.label,
+        label: pending.label,
         createdAt: Date.now(),
-        beforeSnapshot: historyPending.beforeSnapshot,
+        beforeSnapshot,
         afterSnapshot,
+        bytes: snapshotBytes(beforeSnapshot) + snapshotBytes(afterSnapshot),
     });
-    historyPending = null;
+}
+
+function dropHistoryEntries(history, start, count) {
+    const removed = history.entries.splice(start, count);
+    removed.forEach((entry) => {
+        historyBytes -= entry.bytes || 0;
+    });
+    return removed.length;
+}
+
+/**
+ * Укладываем историю в HISTORY_MEMORY_BUDGET: убираем самые старые шаги,
+ * начиная с кадров, которые открывали давнее всех. У текущего кадра
+ * последний шаг остаётся всегда.
+ */
+function enforceHistoryBudget(currentHistory) {
+    for (const history of frameHistories.values()) {
+        if (historyBytes <= HISTORY_MEMORY_BUDGET) return;
+        while (history.entries.length && historyBytes > HISTORY_MEMORY_BUDGET) {
+            if (history === currentHistory && history.entries.length <= 1) break;
+            if (history.position === 0) {
+                // всё отменено: без первого шага повторять остальные не от чего
+                dropHistoryEntries(history, 0, history.entries.length);
+            } else {
+                dropHistoryEntries(history, 0, 1);
+                history.position -= 1;
+            }
+            history.baselineLabel = 'Начало истории';
+            history.isTrimmed = true;
+        }
+    }
 }
 
 function pushHistoryEntry(entry) {
@@ -495,18 +739,19 @@ function pushHistoryEntry(entry) {
     if (!entry) return;
     const history = getFrameHistory();
     if (history.position < history.entries.length) {
-        history.entries = history.entries.slice(0, history.position);
+        dropHistoryEntries(history, history.position, history.entries.length - history.position);
     }
     history.entries.push(entry);
+    historyBytes += entry.bytes || 0;
     history.position = history.entries.length;
 
     if (history.entries.length > HISTORY_LIMIT) {
-        const overflow = history.entries.length - HISTORY_LIMIT;
-        history.entries.splice(0, overflow);
+        const overflow = dropHistoryEntries(history, 0, history.entries.length - HISTORY_LIMIT);
         history.position = Math.max(0, history.position - overflow);
         history.baselineLabel = 'Начало истории';
         history.isTrimmed = true;
     }
+    enforceHistoryBudget(history);
 
     updateHistoryPanel();
 }
@@ -568,27 +813,22 @@ function applyFullSnapshot(snapshot) {
     isHistoryApplying = true;
     discardSelectionState();
 
-    const layerPayloads = snapshot.layers.map((layer) => ({
-        id: layer.id,
-        name: layer.name,
-        order: layer.order,
-        visible: layer.visible,
-        opacity: layer.opacity,
-    }));
-    mergeLayerList(layerPayloads);
+    const existingIds = new Set(layers.map((layer) => layer.id));
+    mergeLayerList(snapshot.layers.map(({ tiles, ...meta }) => meta));
 
+    // пиксели нужны только слоям, которые вернулись в кадр: остальные не менялись
     snapshot.layers.forEach((layerSnapshot) => {
+        if (!layerSnapshot.tiles || existingIds.has(layerSnapshot.id)) return;
         const layer = getLayerById(layerSnapshot.id);
         if (!layer) return;
         ensureLayerCanvases(layer);
         if (!layer.bufferCtx || !layer.bufferCanvas) return;
+        addDirtyTiles(layer);
         clearCanvas(layer.bufferCtx, layer.bufferCanvas);
-        if (layerSnapshot.imageData) {
-            try {
-                layer.bufferCtx.putImageData(layerSnapshot.imageData, 0, 0);
-            } catch (error) {
-                console.warn('Не удалось восстановить слой из истории', error);
-            }
+        try {
+            layerSnapshot.tiles.forEach((tile) => putHistoryTile(layer.bufferCtx, tile));
+        } catch (error) {
+            console.warn('Не удалось восстановить слой из истории', error);
         }
     });
 
@@ -607,16 +847,19 @@ function applyFullSnapshot(snapshot) {
 
 function applyLayerEntry(entry, direction) {
     if (!entry || entry.type !== 'layer') return;
-    const imageData = direction === 'undo' ? entry.beforeImage : entry.afterImage;
-    if (!imageData) return;
     const layer = getLayerById(entry.layerId);
     if (!layer) return;
     isHistoryApplying = true;
     discardSelectionState();
     ensureLayerCanvases(layer);
     if (layer.bufferCtx && layer.bufferCanvas) {
+        // возвращаем только плитки, которые задел шаг
         try {
-            layer.bufferCtx.putImageData(imageData, 0, 0);
+            entry.tiles.forEach((tile) => {
+                const saved = direction === 'undo' ? tile.before : tile.after;
+                putHistoryTile(layer.bufferCtx, saved);
+                addDirtyTiles(layer, { x: saved.left, y: saved.top, width: saved.width, height: saved.height });
+            });
         } catch (error) {
             console.warn('Не удалось восстановить слой из истории', error);
         }
@@ -692,6 +935,51 @@ function fillFrameUrl(template, frameIndex) {
     return result;
 }
 
+// тела GET-ответов с ETag: url -> { etag, lastModified, text }
+const conditionalGetCache = new Map();
+const CONDITIONAL_GET_CACHE_LIMIT = 200;
+
+/**
+ * GET с валидаторами: отправляем ETag / Last-Modified прошлого ответа,
+ * и на 304 берём тело из памяти — сервер его не сериализует и не передаёт.
+ * Храним текст, а не объект, чтобы вызывающий код мог свободно менять данные.
+ */
+async function fetchJsonWithValidators(url) {
+    const cached = conditionalGetCache.get(url);
+    const headers = {};
+    if (cached) {
+        if (cached.etag) headers['If-None-Match'] = cached.etag;
+        if (cached.lastModified) headers['If-Modified-Since'] = cached.lastModified;
+    }
+    // no-store: валидаторы ведём сами, HTTP-кэш браузера здесь не нужен
+    const response = await fetch(url, { credentials: 'same-origin', cache: 'no-store', headers });
+    conditionalGetCache.delete(url);
+
+    if (response.status === 304 && cached) {
+        // переставляем в конец Map — из кэша первыми уходят давно не читанные
+        conditionalGetCache.set(url, cached);
+        return { ok: true, status: 200, data: JSON.parse(cached.text) };
+    }
+
+    const text = await response.text();
+    let data = null;
+    try {
+        data = JSON.parse(text);
+    } catch (error) {
+        data = null;
+    }
+
+    const etag = response.headers.get('ETag');
+    const lastModified = response.headers.get('Last-Modified');
+    if (response.ok && data && (etag || lastModified)) {
+        conditionalGetCache.set(url, { etag, lastModified, text });
+        if (conditionalGetCache.size > CONDITIONAL_GET_CACHE_LIMIT) {
+            conditionalGetCache.delete(conditionalGetCache.keys().next().value);
+        }
+    }
+    return { ok: response.ok, status: response.status, data };
+}
+
 function getFrameDetailUrl(index) {
     return fillFrameUrl(frameDetailUrlTemplate, index);
 }
@@ -722,6 +1010,10 @@ function getLayerDeleteUrl(layerId) {
     return fillLayerUrl(layerDeleteUrlTemplate, currentFrameIndex, layerId);
 }
 
+function getLayerSaveUrl() {
+    return fillLayerUrl(layerSaveUrlTemplate, currentFrameIndex);
+}
+
 function getLayerById(id) {
     return layers.find((layer) => layer.id === id) || null;
 }
@@ -834,12 +1126,85 @@ function updateLayerPreview(layer) {
     previewCtx.drawImage(layer.bufferCanvas, offsetX, offsetY, drawWidth, drawHeight);
 }
 
-function renderLayer(layer) {
+/**
+ * Объединение двух прямоугольников ({ x, y, width, height }); null — пустой.
+ */
+function unionRects(first, second) {
+    if (!first) return second || null;
+    if (!second) return first;
+    const left = Math.min(first.x, second.x);
+    const top = Math.min(first.y, second.y);
+    const right = Math.max(first.x + first.width, second.x + second.width);
+    const bottom = Math.max(first.y + first.height, second.y + second.height);
+    return { x: left, y: top, width: right - left, height: bottom - top };
+}
+
+/**
+ * Прямоугольник в координатах кадра -> целые пиксели экранного холста
+ * с запасом padding, обрезанные по холсту. null — область вне холста.
+ */
+function getScreenRect(rect, padding = 0) {
+    if (!canvas || !rect) return null;
+    const left = Math.max(0, Math.floor(rect.x * scale + offsetX) - padding);
+    const top = Math.max(0, Math.floor(rect.y * scale + offsetY) - padding);
+    const right = Math.min(canvas.width, Math.ceil((rect.x + rect.width) * scale + offsetX) + padding);
+    const bottom = Math.min(canvas.height, Math.ceil((rect.y + rect.height) * scale + offsetY) + padding);
+    if (right <= left || bottom <= top) return null;
+    return { x: left, y: top, width: right - left, height: bottom - top };
+}
+
+/**
+ * Перерисовывает слой на экране. С rect (в координатах кадра) — только эту
+ * область: очищается и копируется лишь соответствующий кусок буфера.
+ */
+function renderLayer(layer, rect = null) {
     if (!layer || !layer.ctx || !layer.canvas || !layer.bufferCanvas) return;
-    clearCanvas(layer.ctx, layer.canvas);
+    const screenRect = rect ? getScreenRect(rect, RENDER_DAMAGE_PADDING_PX) : null;
+    if (rect && !screenRect) return;
+
     layer.ctx.save();
+    layer.ctx.setTransform(1, 0, 0, 1, 0, 0);
+    if (screenRect) {
+        layer.ctx.beginPath();
+        layer.ctx.rect(screenRect.x, screenRect.y, screenRect.width, screenRect.height);
+        layer.ctx.clip();
+        layer.ctx.clearRect(screenRect.x, screenRect.y, screenRect.width, screenRect.height);
+    } else {
+        layer.ctx.clearRect(0, 0, layer.canvas.width, layer.canvas.height);
+    }
     layer.ctx.setTransform(scale, 0, 0, scale, offsetX, offsetY);
-    layer.ctx.drawImage(layer.bufferCanvas, 0, 0);
+    if (screenRect) {
+        // кусок буфера под областью с запасом: сглаживание при масштабе берёт соседние пиксели,
+        // при уменьшении — не один экранный пиксель буфера, а несколько
+        const margin = Math.ceil(1 / Math.min(scale, 1)) + 1;
+        const sourceLeft = Math.max(0, Math.floor((screenRect.x - offsetX) / scale) - margin);
+        const sourceTop = Math.max(0, Math.floor((screenRect.y - offsetY) / scale) - margin);
+        const sourceRight = Math.min(
+            layer.bufferCanvas.width,
+            Math.ceil((screenRect.x + screenRect.width - offsetX) / scale) + margin,
+        );
+        const sourceBottom = Math.min(
+            layer.bufferCanvas.height,
+            Math.ceil((screenRect.y + screenRect.height - offsetY) / scale) + margin,
+        );
+        if (sourceRight > sourceLeft && sourceBottom > sourceTop) {
+            const sourceWidth = sourceRight - sourceLeft;
+            const sourceHeight = sourceBottom - sourceTop;
+            layer.ctx.drawImage(
+                layer.bufferCanvas,
+                sourceLeft,
+                sourceTop,
+                sourceWidth,
+                sourceHeight,
+                sourceLeft,
+                sourceTop,
+                sourceWidth,
+                sourceHeight,
+            );
+        }
+    } else {
+        layer.ctx.drawImage(layer.bufferCanvas, 0, 0);
+    }
     if (layer.id === activeLayerId
         && selectionTransform
         && transformClipboard
@@ -856,7 +1221,12 @@ function renderLayer(layer) {
         }
     }
     layer.ctx.restore();
-    updateLayerPreview(layer);
+    if (screenRect) {
+        scheduleLayerPreview(layer);
+    } else {
+        layersPendingPreview.delete(layer);
+        updateLayerPreview(layer);
+    }
 }
 
 function renderAllLayers() {
@@ -865,6 +1235,64 @@ function renderAllLayers() {
     });
 }
 
+/**
+ * Превью в списке слоёв уменьшает весь буфер — при частичной перерисовке
+ * (штрих, трансформация) обновляем его с задержкой, а не на каждом кадре.
+ */
+function scheduleLayerPreview(layer) {
+    layersPendingPreview.add(layer);
+    if (layerPreviewTimerId) return;
+    layerPreviewTimerId = setTimeout(() => {
+        layerPreviewTimerId = null;
+        layersPendingPreview.forEach((pendingLayer) => {
+            if (layers.includes(pendingLayer)) {
+                updateLayerPreview(pendingLayer);
+            }
+        });
+        layersPendingPreview.clear();
+    }, LAYER_PREVIEW_DELAY_MS);
+}
+
+/**
+ * Отмечает область слоя (в координатах кадра) как изменённую; без rect — весь слой.
+ * Области объединяются и перерисовываются один раз в ближайшем кадре анимации,
+ * сколько бы событий указателя ни пришло между кадрами.
+ */
+function invalidateLayerRect(layer, rect = null) {
+    if (!layer) return;
+    if (!rect) {
+        layerDamage.set(layer, null);
+    } else if (!layerDamage.has(layer)) {
+        layerDamage.set(layer, rect);
+    } else if (layerDamage.get(layer)) {
+        layerDamage.set(layer, unionRects(layerDamage.get(layer), rect));
+    }
+    if (layerRenderFrameId) return;
+    layerRenderFrameId = requestAnimationFrame(flushLayerDamage);
+}
+
+function flushLayerDamage() {
+    if (layerRenderFrameId) {
+        cancelAnimationFrame(layerRenderFrameId);
+        layerRenderFrameId = null;
+    }
+    const damage = layerDamage;
+    layerDamage = new Map();
+    damage.forEach((rect, layer) => {
+        if (layers.includes(layer)) {
+            renderLayer(layer, rect);
+        }
+    });
+}
+
+function cancelLayerDamage() {
+    if (layerRenderFrameId) {
+        cancelAnimationFrame(layerRenderFrameId);
+        layerRenderFrameId = null;
+    }
+    layerDamage.clear();
+}
+
 function updateActiveLayerPointers() {
     const nextLayer = getLayerById(activeLayerId);
     activeLayer = nextLayer;
@@ -1050,11 +1478,13 @@ function mergeLayerList(layerItems) {
             stored.order = item.order;
             stored.visible = item.visible;
             stored.opacity = item.opacity;
+            stored.raster_url = item.raster_url || '';
             nextLayers.push(stored);
             existing.delete(item.id);
         } else {
             nextLayers.push({
                 ...item,
+                dirtyTiles: new Set(),
                 canvas: null,
                 ctx: null,
                 bufferCanvas: null,
@@ -1095,6 +1525,7 @@ function mergeLayerList(layerItems) {
 function addLayerFromPayload(item) {
     const layer = {
         ...item,
+        dirtyTiles: new Set(),
         canvas: null,
         ctx: null,
         bufferCanvas: null,
@@ -1115,9 +1546,8 @@ async function loadLayers() {
     const listUrl = getLayerListUrl();
     if (!listUrl) return;
     try {
-        const response = await fetch(listUrl, { credentials: 'same-origin' });
-        const data = await response.json();
-        if (!response.ok || !data || !data.ok) {
+        const { ok, data } = await fetchJsonWithValidators(listUrl);
+        if (!ok || !data || !data.ok) {
             throw new Error('Не удалось загрузить слои.');
         }
         mergeLayerList(data.layers || []);
@@ -1129,10 +1559,13 @@ async function loadLayers() {
 function fillBackgroundLayerIfNeeded() {
     if (didInitBackground) return;
     if (currentFramePreviewUrl) return;
+    if (layers.some((layer) => layer.raster_url)) return;
     const backgroundLayer = getBackgroundLayer();
     if (!backgroundLayer || !backgroundLayer.bufferCtx || !backgroundLayer.bufferCanvas) return;
     backgroundLayer.bufferCtx.fillStyle = '#ffffff';
     backgroundLayer.bufferCtx.fillRect(0, 0, backgroundLayer.bufferCanvas.width, backgroundLayer.bufferCanvas.height);
+    // белый фон ещё не лежит на сервере — уйдёт вместе с первым сохранением кадра
+    addDirtyTiles(backgroundLayer);
     renderScene();
     didInitBackground = true;
     ensureHistoryBaseline();
@@ -1210,6 +1643,7 @@ async function deleteLayer(layerId) {
             throw new Error('Не удалось удалить слой.');
         }
         mergeLayerList(data.layers || []);
+        markUnsavedChanges();
         commitFullHistory();
     } catch (error) {
         cancelPendingHistory();
@@ -1235,6 +1669,7 @@ async function saveLayerOrder(orderedIds) {
             throw new Error('Не удалось сохранить порядок слоёв.');
         }
         mergeLayerList(data.layers || []);
+        markUnsavedChanges();
         commitFullHistory();
     } catch (error) {
         cancelPendingHistory();
@@ -1335,31 +1770,44 @@ function clearOverlay() {
     clearCanvas(overlayCtx, overlayCanvas);
 }
 
-function renderOverlay() {
+/**
+ * Перерисовывает оверлей (рамка кадра, выделение, ручки трансформации).
+ * С rect (в координатах кадра) очищается и рисуется только эта область.
+ */
+function renderOverlay(rect = null) {
     if (!overlayCtx || !overlayCanvas) return;
-    clearCanvas(overlayCtx, overlayCanvas);
-    renderFrameOutline();
-    if (!selectionDraft && !selection) {
-        updateSelectionAnimationState();
-        return;
+    const screenRect = rect ? getScreenRect(rect, OVERLAY_DAMAGE_PADDING_PX) : null;
+    if (rect && !screenRect) return;
+    overlayCtx.save();
+    if (screenRect) {
+        overlayCtx.setTransform(1, 0, 0, 1, 0, 0);
+        overlayCtx.beginPath();
+        overlayCtx.rect(screenRect.x, screenRect.y, screenRect.width, screenRect.height);
+        overlayCtx.clip();
+        overlayCtx.clearRect(screenRect.x, screenRect.y, screenRect.width, screenRect.height);
+    } else {
+        clearCanvas(overlayCtx, overlayCanvas);
     }
+    renderFrameOutline();
+    if (selectionDraft || selection) {
+        withTransformedContext(overlayCtx, () => {
+            const targetSelection = selectionDraft || selection;
+            if (targetSelection) {
+                drawSelectionPath(overlayCtx, targetSelection);
+            }
 
-    withTransformedContext(overlayCtx, () => {
-        const targetSelection = selectionDraft || selection;
-        if (targetSelection) {
-            drawSelectionPath(overlayCtx, targetSelection);
-        }
-
-        if (!selectionDraft && shouldShowSelectionTransformUI()) {
-            const bounds = selectionTransform && selectionTransform.currentBounds
-                ? selectionTransform.currentBounds
-                : getSelectionBounds(selection);
-            const clamped = clampSelectionBounds(bounds);
-            if (clamped && clamped.width > 0 && clamped.height > 0) {
-                drawSelectionTransformControls(overlayCtx, clamped);
+            if (!selectionDraft && shouldShowSelectionTransformUI()) {
+                const bounds = selectionTransform && selectionTransform.currentBounds
+                    ? selectionTransform.currentBounds
+                    : getSelectionBounds(selection);
+                const clamped = clampSelectionBounds(bounds);
+                if (clamped && clamped.width > 0 && clamped.height > 0) {
+                    drawSelectionTransformControls(overlayCtx, clamped);
+                }
             }
-        }
-    }, { clipToFrame: true });
+        }, { clipToFrame: true });
+    }
+    overlayCtx.restore();
     updateSelectionAnimationState();
 }
 
@@ -1380,6 +1828,8 @@ function renderFrameOutline() {
 }
 
 function renderScene() {
+    // полная перерисовка перекрывает накопленные области
+    cancelLayerDamage();
     if (!layers.length) return;
     renderAllLayers();
 }
@@ -1400,6 +1850,7 @@ function syncCanvasSizes() {
 
 function syncOverlayPlacement() {
     if (!overlayCanvas || !canvas) return;
+    canvasMetricsCache = null;
     const rect = canvas.getBoundingClientRect();
     overlayCanvas.style.width = `${rect.width}px`;
     overlayCanvas.style.height = `${rect.height}px`;
@@ -1495,6 +1946,7 @@ function startDrawing(x, y, toolName) {
     lastY = y;
     startX = x;
     startY = y;
+    shapePreviewRect = null;
 
     if (toolName === TOOL_BRUSH || toolName === TOOL_ERASER || isShapeTool(toolName)) {
         beginLayerHistory(getToolHistoryLabel(toolName));
@@ -1503,23 +1955,33 @@ function startDrawing(x, y, toolName) {
     if (toolName === TOOL_BRUSH || toolName === TOOL_ERASER) {
         didDrawStroke = true;
         lastDrawTool = toolName;
-        markUnsavedChanges();
+        markLayerDirty(activeLayer, getPaddedRect(x, y, x, y, currentSize));
         drawStrokeSegment(x, y, x, y, toolName);
+        strokeSamples = [];
+        strokePredicted = [];
+        strokeControlPoint = { x, y };
+        strokePathEnd = { x, y };
+        strokeTailRect = null;
     }
 }
 
 /**
- * Продолжение рисования
- * Рисуем линию от предыдущей точки до новой
+ * Продолжение рисования.
+ * Кисть и ластик копят все отсчёты события (getCoalescedEvents) и рисуют их
+ * один раз за кадр; фигуры перерисовывают превью до новой точки.
  */
-function continueDrawing(x, y) {
+function continueDrawing(x, y, event = null) {
     if (!isDrawing) return;
 
     if (activeTool === TOOL_BRUSH || activeTool === TOOL_ERASER) {
-        const target = isShiftPressed ? getSnappedPoint(startX, startY, x, y) : { x, y };
-        drawStrokeSegment(lastX, lastY, target.x, target.y, activeTool);
-        lastX = target.x;
-        lastY = target.y;
+        const samples = event ? getCoalescedCanvasCoords(event) : [{ x, y }];
+        samples.forEach((point) => {
+            strokeSamples.push(isShiftPressed ? getSnappedPoint(startX, startY, point.x, point.y) : point);
+        });
+        strokePredicted = STROKE_PREDICTION && event && !isShiftPressed ? getPredictedCanvasCoords(event) : [];
+        if (!strokeFrameId) {
+            strokeFrameId = requestAnimationFrame(() => flushStrokeSamples());
+        }
         return;
     }
 
@@ -1536,8 +1998,13 @@ function continueDrawing(x, y) {
  * Завершение рисования
  */
 function stopDrawing() {
+    const isStroke = didDrawStroke && (lastDrawTool === TOOL_BRUSH || lastDrawTool === TOOL_ERASER);
+    if (isStroke) {
+        // остаток штриха рисуется, пока isDrawing ещё true
+        finishStroke();
+    }
     isDrawing = false;
-    if (didDrawStroke && (lastDrawTool === TOOL_BRUSH || lastDrawTool === TOOL_ERASER)) {
+    if (isStroke) {
         commitLayerHistory();
     }
     didDrawStroke = false;
@@ -1545,35 +2012,144 @@ function stopDrawing() {
     activeTool = null;
 }
 
-function drawStrokeSegment(fromX, fromY, toX, toY, toolName) {
+/**
+ * Рисует накопленные отсчёты штриха в буфер слоя. Сглаживание — квадратичный
+ * B-сплайн: отсчёты служат контрольными точками, кривая идёт через середины
+ * между ними, поэтому быстрый штрих не распадается на ломаную и не даёт выбросов.
+ * Последняя половина сегмента ждёт следующего отсчёта; до него на экране
+ * её (и прогноз браузера) показывает временный хвост.
+ */
+function flushStrokeSamples(options = {}) {
+    if (strokeFrameId) {
+        cancelAnimationFrame(strokeFrameId);
+        strokeFrameId = null;
+    }
+    if (!isDrawing || !strokeControlPoint || !strokePathEnd) {
+        strokeSamples = [];
+        return;
+    }
+
+    const segments = [];
+    let control = strokeControlPoint;
+    strokeSamples.forEach((sample) => {
+        if (Math.hypot(sample.x - control.x, sample.y - control.y) < STROKE_MIN_SAMPLE_DISTANCE) return;
+        segments.push({
+            control,
+            to: { x: (control.x + sample.x) / 2, y: (control.y + sample.y) / 2 },
+        });
+        control = sample;
+    });
+    strokeSamples = [];
+    if (segments.length) {
+        drawStrokePath(strokePathEnd, segments, activeTool);
+        strokePathEnd = segments[segments.length - 1].to;
+        strokeControlPoint = control;
+        lastX = control.x;
+        lastY = control.y;
+    }
+
+    if (strokeTailRect) {
+        invalidateLayerRect(activeLayer, strokeTailRect);
+        strokeTailRect = null;
+    }
+    // мы уже в кадре анимации: показываем штрих сейчас, а не в следующем кадре
+    flushLayerDamage();
+    if (!options.final) {
+        drawStrokeTail();
+    }
+}
+
+/**
+ * Временный хвост штриха прямо на экранном холсте слоя: от конца нарисованной
+ * кривой к последнему отсчёту и дальше по прогнозу. Буфер он не трогает
+ * и стирается при следующем сбросе отсчётов.
+ */
+function drawStrokeTail() {
+    if (!activeLayer || !activeLayer.ctx) return;
+    // маску волшебной палочки на экранном холсте не повторить без копии буфера
+    if (selection && selection.type === SELECT_MAGIC) return;
+    const points = [strokePathEnd, strokeControlPoint, ...strokePredicted];
+    let tailRect = null;
+    for (let i = 1; i < points.length; i += 1) {
+        tailRect = unionRects(tailRect, getPaddedRect(
+            points[i - 1].x,
+            points[i - 1].y,
+            points[i].x,
+            points[i].y,
+            currentSize,
+        ));
+    }
+    if (!tailRect || (points.length === 2 && strokePathEnd.x === strokeControlPoint.x
+        && strokePathEnd.y === strokeControlPoint.y)) {
+        return;
+    }
+    const targetCtx = activeLayer.ctx;
+    withTransformedContext(targetCtx, () => {
+        targetCtx.save();
+        applyStrokeStyles(targetCtx, { useEraser: activeTool === TOOL_ERASER });
+        targetCtx.beginPath();
+        targetCtx.moveTo(points[0].x, points[0].y);
+        for (let i = 1; i < points.length; i += 1) {
+            targetCtx.lineTo(points[i].x, points[i].y);
+        }
+        targetCtx.stroke();
+        targetCtx.restore();
+    }, { clipToFrame: true, clipToSelection: true });
+    strokeTailRect = tailRect;
+}
+
+/**
+ * Конец штриха: рисуем оставшиеся отсчёты и последний отрезок до точки отпускания.
+ */
+function finishStroke() {
+    flushStrokeSamples({ final: true });
+    if (!strokeControlPoint || !strokePathEnd) return;
+    if (strokePathEnd.x !== strokeControlPoint.x || strokePathEnd.y !== strokeControlPoint.y) {
+        drawStrokePath(strokePathEnd, [{ control: null, to: strokeControlPoint }], lastDrawTool);
+    }
+    strokePredicted = [];
+    strokeControlPoint = null;
+    strokePathEnd = null;
+}
+
+/**
+ * Рисует в буфер активного слоя путь штриха от точки from: сегмент
+ * { control, to } — квадратичная кривая, без control — отрезок.
+ */
+function drawStrokePath(from, segments, toolName) {
     if (!bufferCtx || !bufferCanvas) return;
     const useEraser = toolName === TOOL_ERASER;
     const isMagicErase = useEraser && selection && selection.type === SELECT_MAGIC && selection.maskCanvas;
+    // кривая лежит внутри многоугольника своих контрольных точек
+    let pathRect = getPaddedRect(from.x, from.y, from.x, from.y, currentSize);
+    segments.forEach(({ control, to }) => {
+        const corner = control || to;
+        pathRect = unionRects(pathRect, getPaddedRect(corner.x, corner.y, to.x, to.y, currentSize));
+    });
 
+    addDirtyTiles(activeLayer, pathRect);
     drawBufferWithSelection((targetCtx) => {
         targetCtx.save();
         applyStrokeStyles(targetCtx, { useEraser: isMagicErase ? false : useEraser });
         targetCtx.beginPath();
-        targetCtx.moveTo(fromX, fromY);
-        targetCtx.lineTo(toX, toY);
+        targetCtx.moveTo(from.x, from.y);
+        segments.forEach(({ control, to }) => {
+            if (control) {
+                targetCtx.quadraticCurveTo(control.x, control.y, to.x, to.y);
+            } else {
+                targetCtx.lineTo(to.x, to.y);
+            }
+        });
         targetCtx.stroke();
         targetCtx.restore();
     }, { useEraser: isMagicErase });
 
-    if (!ctx || !canvas) return;
-    if (selection && selection.type === SELECT_MAGIC) {
-        renderScene();
-        return;
-    }
-    withTransformedContext(ctx, () => {
-        ctx.save();
-        applyStrokeStyles(ctx, { useEraser });
-        ctx.beginPath();
-        ctx.moveTo(fromX, fromY);
-        ctx.lineTo(toX, toY);
-        ctx.stroke();
-        ctx.restore();
-    }, { clipToFrame: true, clipToSelection: true });
+    // на экран попадёт только область пути, один раз за кадр
+    invalidateLayerRect(activeLayer, pathRect);
+}
+
+function drawStrokeSegment(fromX, fromY, toX, toY, toolName) {
+    drawStrokePath({ x: fromX, y: fromY }, [{ control: null, to: { x: toX, y: toY } }], toolName);
 }
 
 function drawShapePath(targetCtx, toolName, fromX, fromY, toX, toY) {
@@ -1607,7 +2183,10 @@ function drawShapePath(targetCtx, toolName, fromX, fromY, toX, toY) {
 
 function drawShapePreview(x, y) {
     if (!overlayCtx || !overlayCanvas) return;
-    renderOverlay();
+    // стираем прошлое превью фигуры и рисуем новое — только в их общей области
+    const previewRect = getPaddedRect(startX, startY, x, y, currentSize);
+    renderOverlay(unionRects(shapePreviewRect, previewRect));
+    shapePreviewRect = previewRect;
     drawOverlayWithSelection((targetCtx) => {
         targetCtx.save();
         applyStrokeStyles(targetCtx, { useEraser: false });
@@ -1624,7 +2203,8 @@ function commitShape() {
         cancelPendingHistory();
         return;
     }
-    markUnsavedChanges();
+    const shapeRect = getPaddedRect(startX, startY, lastX, lastY, currentSize);
+    markLayerDirty(activeLayer, shapeRect);
     drawBufferWithSelection((targetCtx) => {
         targetCtx.save();
         applyStrokeStyles(targetCtx, { useEraser: false });
@@ -1633,19 +2213,9 @@ function commitShape() {
         targetCtx.restore();
     });
 
-    if (selection && selection.type === SELECT_MAGIC) {
-        renderScene();
-    } else {
-        withTransformedContext(ctx, () => {
-            ctx.save();
-            applyStrokeStyles(ctx, { useEraser: false });
-            drawShapePath(ctx, activeTool, startX, startY, lastX, lastY);
-            ctx.stroke();
-            ctx.restore();
-        }, { clipToFrame: true, clipToSelection: true });
-    }
-
-    renderOverlay();
+    renderLayer(activeLayer, shapeRect);
+    renderOverlay(unionRects(shapePreviewRect, shapeRect));
+    shapePreviewRect = null;
     commitLayerHistory();
 }
 
@@ -1799,21 +2369,14 @@ function drawSelectionPath(targetCtx, selectionShape) {
     targetCtx.restore();
 }
 
-function drawMagicSelectionOutline(targetCtx, selectionShape) {
-    const mask = selectionShape.mask;
-    if (!mask) return;
-    const width = selectionShape.width;
-    const height = selectionShape.height;
-    const bounds = selectionShape.bounds;
-    if (!width || !height || !bounds) return;
-
-    const offset = Math.floor(selectionDashOffset);
-    const dashPeriod = 8;
-    const dashOn = 4;
-
-    targetCtx.save();
-    targetCtx.fillStyle = '#2563eb';
-
+/**
+ * Индексы граничных пикселей маски волшебной палочки. Маска выделения
+ * не меняется, поэтому граница считается один раз и хранится в самом выделении.
+ */
+function getMagicSelectionEdges(selectionShape) {
+    if (selectionShape.edgeIndices) return selectionShape.edgeIndices;
+    const { mask, width, height, bounds } = selectionShape;
+    const edges = [];
     const maxY = Math.min(height, bounds.y + bounds.height);
     const maxX = Math.min(width, bounds.x + bounds.width);
 
@@ -1826,14 +2389,40 @@ function drawMagicSelectionOutline(targetCtx, selectionShape) {
                 || (x < width - 1 && !mask[index + 1])
                 || (y > 0 && !mask[index - width])
                 || (y < height - 1 && !mask[index + width]);
-            if (!isEdge) continue;
-            if (((x + y + offset) % dashPeriod) < dashOn) {
-                targetCtx.fillRect(x, y, 1, 1);
-            }
+            if (isEdge) edges.push(index);
         }
     }
-
-    targetCtx.restore();
+    selectionShape.edgeIndices = Int32Array.from(edges);
+    return selectionShape.edgeIndices;
+}
+
+function drawMagicSelectionOutline(targetCtx, selectionShape) {
+    const mask = selectionShape.mask;
+    if (!mask) return;
+    const width = selectionShape.width;
+    const height = selectionShape.height;
+    const bounds = selectionShape.bounds;
+    if (!width || !height || !bounds) return;
+
+    const offset = Math.floor(selectionDashOffset);
+    const dashPeriod = 8;
+    const dashOn = 4;
+    const edges = getMagicSelectionEdges(selectionShape);
+
+    // все штрихи — один путь и одна заливка вместо fillRect на каждый пиксель
+    targetCtx.save();
+    targetCtx.fillStyle = '#2563eb';
+    targetCtx.beginPath();
+    for (let i = 0; i < edges.length; i += 1) {
+        const index = edges[i];
+        const x = index % width;
+        const y = (index - x) / width;
+        if ((((x + y + offset) % dashPeriod) + dashPeriod) % dashPeriod < dashOn) {
+            targetCtx.rect(x, y, 1, 1);
+        }
+    }
+    targetCtx.fill();
+    targetCtx.restore();
 }
 
 function getLassoBounds(points) {
@@ -2356,11 +2945,13 @@ function updateSelectionTransform(event) {
     if (nextSelection) {
         selection = nextSelection;
     }
+    // плавающий фрагмент уходит со старого места и появляется на новом — перерисовываем обе области
+    const previousBounds = selectionTransform.currentBounds || selectionTransform.startBounds;
     selectionTransform.currentBounds = nextBounds;
     if (activeLayer) {
-        renderLayer(activeLayer);
+        renderLayer(activeLayer, unionRects(previousBounds, nextBounds));
     }
-    renderOverlay();
+    renderOverlay(unionRects(previousBounds, nextBounds));
 }
 
 function commitSelectionTransform() {
@@ -2398,11 +2989,11 @@ function commitSelectionTransform() {
     );
     bufferCtx.restore();
 
-    markUnsavedChanges();
+    markLayerDirty(activeLayer, bounds);
     commitLayerHistory();
 
     resetSelectionTransformState();
-    renderScene();
+    renderLayer(activeLayer, bounds);
     renderOverlay();
 }
 
@@ -2499,6 +3090,7 @@ function copySelectionToClipboard() {
 
 function clearSelectionContent() {
     if (!selection || !bufferCtx || !bufferCanvas) return false;
+    const clearedBounds = getSelectionBounds(selection);
     if (selection.type === SELECT_MAGIC && selection.maskCanvas) {
         bufferCtx.save();
         bufferCtx.globalCompositeOperation = 'destination-out';
@@ -2511,8 +3103,8 @@ function clearSelectionContent() {
         bufferCtx.clearRect(0, 0, bufferCanvas.width, bufferCanvas.height);
         bufferCtx.restore();
     }
-    renderScene();
-    markUnsavedChanges();
+    renderLayer(activeLayer, clearedBounds);
+    markLayerDirty(activeLayer, clearedBounds);
     return true;
 }
 
@@ -2574,8 +3166,14 @@ function pasteSelectionFromClipboard() {
         bufferCtx.restore();
     }
 
-    renderScene();
-    markUnsavedChanges();
+    const pasteRect = {
+        x: pasteX,
+        y: pasteY,
+        width: selectionClipboard.width,
+        height: selectionClipboard.height,
+    };
+    renderLayer(activeLayer, pasteRect);
+    markLayerDirty(activeLayer, pasteRect);
     if (!selection && pastedSelection) {
         selection = pastedSelection;
         selectionDashOffset = 0;
@@ -2664,64 +3262,31 @@ function buildSelectionMaskCanvas(mask, width, height) {
     return maskCanvas;
 }
 
-function createMagicWandSelection(startX, startY) {
-    if (!bufferCtx || !bufferCanvas) return false;
-    const width = bufferCanvas.width;
-    const height = bufferCanvas.height;
+async function createMagicWandSelection(startX, startY) {
+    if (!bufferCtx || !bufferCanvas || isFillPending) return false;
+    const targetCanvas = bufferCanvas;
+    const width = targetCanvas.width;
+    const height = targetCanvas.height;
     const x = Math.floor(startX);
     const y = Math.floor(startY);
     if (x < 0 || y < 0 || x >= width || y >= height) return false;
 
-    const imageData = bufferCtx.getImageData(0, 0, width, height);
-    const { data } = imageData;
-    const startIndex = (y * width + x) * 4;
-    const targetColor = [
-        data[startIndex],
-        data[startIndex + 1],
-        data[startIndex + 2],
-        data[startIndex + 3],
-    ];
-    const tolerance = clamp(wandTolerance, 0, 255);
-    const toleranceSq = tolerance * tolerance;
-
-    const mask = new Uint8Array(width * height);
-    const stack = [x, y];
-    let minX = x;
-    let maxX = x;
-    let minY = y;
-    let maxY = y;
-
-    while (stack.length > 0) {
-        const currentY = stack.pop();
-        const currentX = stack.pop();
-        if (currentX === undefined || currentY === undefined) break;
-        if (currentX < 0 || currentY < 0 || currentX >= width || currentY >= height) {
-            continue;
-        }
-        const offset = currentY * width + currentX;
-        if (mask[offset]) continue;
-
-        const dataIndex = offset * 4;
-        const dr = data[dataIndex] - targetColor[0];
-        const dg = data[dataIndex + 1] - targetColor[1];
-        const db = data[dataIndex + 2] - targetColor[2];
-        const distanceSq = dr * dr + dg * dg + db * db;
-        if (distanceSq > toleranceSq) continue;
-
-        mask[offset] = 1;
-        minX = Math.min(minX, currentX);
-        maxX = Math.max(maxX, currentX);
-        minY = Math.min(minY, currentY);
-        maxY = Math.max(maxY, currentY);
-
-        stack.push(currentX + 1, currentY);
-        stack.push(currentX - 1, currentY);
-        stack.push(currentX, currentY + 1);
-        stack.push(currentX, currentY - 1);
-    }
-
-    if (minX > maxX || minY > maxY) return false;
+    isFillPending = true;
+    let result = null;
+    try {
+        result = await computeLayerFillMask(x, y, {
+            tolerance: clamp(wandTolerance, 0, 255),
+            includeAlpha: false,
+            antialias: false,
+        });
+    } catch (error) {
+        console.error('Ошибка волшебной палочки', error);
+    } finally {
+        isFillPending = false;
+    }
+    if (!result || targetCanvas !== bufferCanvas) return false;
 
+    const { mask, bounds } = result;
     const maskCanvas = buildSelectionMaskCanvas(mask, width, height);
     if (!maskCanvas) return false;
 
@@ -2734,28 +3299,38 @@ function createMagicWandSelection(startX, startY) {
         maskCanvas,
         width,
         height,
-        bounds: {
-            x: minX,
-            y: minY,
-            width: maxX - minX + 1,
-            height: maxY - minY + 1,
-        },
+        bounds,
     };
     selectionDashOffset = 0;
     renderOverlay();
+    updateSelectionAnimationState();
     return true;
 }
 
+/**
+ * Анимация «бегущих муравьёв». Изменения выделения перерисовывают оверлей сразу,
+ * а сама анимация сдвигает штрих не чаще SELECTION_ANIMATION_INTERVAL_MS
+ * и перерисовывает только область выделения.
+ */
 function startSelectionAnimation() {
     if (selectionAnimationId) return;
-    const tick = () => {
+    selectionAnimationLastTime = 0;
+    const tick = (now) => {
         if (!selection) {
             selectionAnimationId = null;
             return;
         }
-        if (!isDrawing && !isSelecting && !isPanning && !isTransformingSelection) {
-            selectionDashOffset -= SELECTION_DASH_SPEED;
-            renderOverlay();
+        const isIdle = !isDrawing && !isSelecting && !isPanning && !isTransformingSelection;
+        if (!isIdle) {
+            selectionAnimationLastTime = now;
+        } else if (now - selectionAnimationLastTime >= SELECTION_ANIMATION_INTERVAL_MS) {
+            const elapsed = selectionAnimationLastTime
+                ? Math.min(now - selectionAnimationLastTime, SELECTION_ANIMATION_INTERVAL_MS * 2)
+                : SELECTION_ANIMATION_INTERVAL_MS;
+            selectionAnimationLastTime = now;
+            selectionDashOffset -= (SELECTION_DASH_SPEED * elapsed) / 1000;
+            const bounds = getSelectionBounds(selection);
+            renderOverlay(bounds && bounds.width > 0 && bounds.height > 0 ? bounds : null);
         }
         selectionAnimationId = requestAnimationFrame(tick);
     };
@@ -2827,6 +3402,8 @@ function logCoordDebug(label, event, extra = {}) {
  * Переводим координаты мыши в систему координат canvas
  */
 function getCanvasMetrics() {
+    // в одном кадре приходит много событий (и их отсчётов), а раскладка между ними не меняется
+    if (canvasMetricsCache) return canvasMetricsCache;
     const rect = canvas.getBoundingClientRect();
     const style = window.getComputedStyle(canvas);
     const borderLeft = parseFloat(style.borderLeftWidth) || 0;
@@ -2838,7 +3415,7 @@ function getCanvasMetrics() {
     const scaleX = canvas.width / contentWidth;
     const scaleY = canvas.height / contentHeight;
 
-    return {
+    canvasMetricsCache = {
         rect,
         borderLeft,
         borderTop,
@@ -2849,6 +3426,10 @@ function getCanvasMetrics() {
         scaleX,
         scaleY,
     };
+    requestAnimationFrame(() => {
+        canvasMetricsCache = null;
+    });
+    return canvasMetricsCache;
 }
 
 function getCanvasRawCoords(event) {
@@ -2859,7 +3440,10 @@ function getCanvasRawCoords(event) {
         scaleX,
         scaleY,
     } = getCanvasMetrics();
-    const hasOffset = typeof event.offsetX === 'number' && typeof event.offsetY === 'number';
+    // offsetX считается от цели события, а события с window приходят и не от холста
+    const hasOffset = event.target === canvas
+        && typeof event.offsetX === 'number'
+        && typeof event.offsetY === 'number';
     const rawX = hasOffset ? event.offsetX : event.clientX - rect.left - borderLeft;
     const rawY = hasOffset ? event.offsetY : event.clientY - rect.top - borderTop;
     const x = rawX * scaleX;
@@ -2875,6 +3459,20 @@ function getCanvasCoords(event) {
     return { x, y };
 }
 
+/**
+ * Все отсчёты, которые браузер слил в одно pointermove (мышь и перо дают
+ * их чаще, чем кадры); без поддержки — само событие.
+ */
+function getCoalescedCanvasCoords(event) {
+    const samples = typeof event.getCoalescedEvents === 'function' ? event.getCoalescedEvents() : [];
+    return (samples.length ? samples : [event]).map((sample) => getCanvasCoords(sample));
+}
+
+function getPredictedCanvasCoords(event) {
+    if (typeof event.getPredictedEvents !== 'function') return [];
+    return event.getPredictedEvents().map((sample) => getCanvasCoords(sample));
+}
+
 function pickColorAt(x, y) {
     if (!bufferCtx || !bufferCanvas) return;
     const px = Math.floor(x);
@@ -3012,70 +3610,144 @@ function colorsMatch(data, index, color) {
         && data[index + 3] === color[3];
 }
 
-function setPixelColor(data, index, color) {
-    data[index] = color[0];
-    data[index + 1] = color[1];
-    data[index + 2] = color[2];
-    data[index + 3] = color[3];
-}
-
-function floodFill(startX, startY) {
-    if (!bufferCtx || !bufferCanvas) return false;
+/**
+ * Маска заливки от точки (x, y) по текущему слою (flood_fill.js: computeFillMask).
+ * Пиксели уходят в воркер снимком ImageBitmap; без воркера маска считается здесь.
+ */
+async function computeLayerFillMask(x, y, options) {
     const width = bufferCanvas.width;
     const height = bufferCanvas.height;
-    const x = Math.floor(startX);
-    const y = Math.floor(startY);
-    const hasSelection = Boolean(selection);
-
-    if (x < 0 || y < 0 || x >= width || y >= height) return false;
-    if (hasSelection && !isPointInSelection(x + 0.5, y + 0.5, selection)) return false;
-
-    const imageData = bufferCtx.getImageData(0, 0, width, height);
-    const { data } = imageData;
-    const startIndex = (y * width + x) * 4;
-    const targetColor = [
-        data[startIndex],
-        data[startIndex + 1],
-        data[startIndex + 2],
-        data[startIndex + 3],
-    ];
-    const fillColor = hexToRgba(currentColor);
-
-    if (colorsMatch(data, startIndex, fillColor)) return false;
+    if (floodFillWorkerClient.isAvailable() && canSendBitmapsToWorkers()) {
+        try {
+            const bitmap = await createImageBitmap(bufferCanvas);
+            return await floodFillWorkerClient.run({ bitmap, width, height, x, y, ...options }, [bitmap]);
+        } catch (error) {
+            console.warn('Заливка в воркере не удалась, считаем в основном потоке', error);
+        }
+    }
+    if (typeof computeFillMask !== 'function') return null;
+    const pixels = bufferCtx.getImageData(0, 0, width, height).data;
+    return computeFillMask({ pixels, width, height, x, y, ...options });
+}
 
-    const visited = new Uint8Array(width * height);
-    const stack = [x, y];
+/**
+ * Выделение как маска пикселей (ненулевое — внутри) для заливки внутри выделения.
+ * Контур растеризуется только в своих границах; пиксель внутри, если внутри его центр.
+ */
+function getSelectionClipMask(width, height) {
+    if (!selection) return null;
+    if (selection.type === SELECT_MAGIC) return selection.mask || null;
+    const clip = new Uint8Array(width * height);
+    const bounds = clampSelectionBounds(getSelectionBounds(selection));
+    if (!bounds || !bounds.width || !bounds.height) return clip;
+    const left = Math.floor(bounds.x);
+    const top = Math.floor(bounds.y);
+    const clipWidth = Math.min(width, Math.ceil(bounds.x + bounds.width)) - left;
+    const clipHeight = Math.min(height, Math.ceil(bounds.y + bounds.height)) - top;
+    if (clipWidth <= 0 || clipHeight <= 0) return clip;
+    const clipCanvas = document.createElement('canvas');
+    clipCanvas.width = clipWidth;
+    clipCanvas.height = clipHeight;
+    const clipCtx = clipCanvas.getContext('2d', { willReadFrequently: true });
+    clipCtx.translate(-left, -top);
+    appendSelectionPath(clipCtx, selection);
+    clipCtx.fillStyle = '#000000';
+    clipCtx.fill();
+    const alpha = clipCtx.getImageData(0, 0, clipWidth, clipHeight).data;
+    for (let row = 0; row < clipHeight; row += 1) {
+        const rowOffset = (top + row) * width + left;
+        for (let col = 0; col < clipWidth; col += 1) {
+            if (alpha[(row * clipWidth + col) * 4 + 3] >= 128) clip[rowOffset + col] = 1;
+        }
+    }
+    return clip;
+}
 
-    while (stack.length > 0) {
-        const currentY = stack.pop();
-        const currentX = stack.pop();
-        if (currentX === undefined || currentY === undefined) break;
-        if (currentX < 0 || currentY < 0 || currentX >= width || currentY >= height) {
-            continue;
+/**
+ * Кладёт цвет заливки по маске покрытия: внутри заливки — как есть,
+ * на сглаженном крае — с долей альфы. Читается и пишется только прямоугольник заливки.
+ */
+function applyFillMask(targetCtx, { mask, bounds }, fillColor) {
+    const patch = new ImageData(bounds.width, bounds.height);
+    const { data } = patch;
+    const canvasWidth = targetCtx.canvas.width;
+    for (let row = 0; row < bounds.height; row += 1) {
+        const maskOffset = (bounds.y + row) * canvasWidth + bounds.x;
+        for (let col = 0; col < bounds.width; col += 1) {
+            const coverage = mask[maskOffset + col];
+            if (!coverage) continue;
+            const offset = (row * bounds.width + col) * 4;
+            data[offset] = fillColor[0];
+            data[offset + 1] = fillColor[1];
+            data[offset + 2] = fillColor[2];
+            data[offset + 3] = Math.round((fillColor[3] * coverage) / 255);
         }
+    }
+    const patchCanvas = document.createElement('canvas');
+    patchCanvas.width = bounds.width;
+    patchCanvas.height = bounds.height;
+    patchCanvas.getContext('2d').putImageData(patch, 0, 0);
+    targetCtx.save();
+    targetCtx.setTransform(1, 0, 0, 1, 0, 0);
+    targetCtx.globalAlpha = 1;
+    targetCtx.globalCompositeOperation = 'source-over';
+    targetCtx.drawImage(patchCanvas, bounds.x, bounds.y);
+    targetCtx.restore();
+}
 
-        const offset = currentY * width + currentX;
-        if (visited[offset]) continue;
-        visited[offset] = 1;
+async function floodFill(startX, startY) {
+    if (!bufferCtx || !bufferCanvas) return null;
+    const targetCanvas = bufferCanvas;
+    const targetCtx = bufferCtx;
+    const width = targetCanvas.width;
+    const height = targetCanvas.height;
+    const x = Math.floor(startX);
+    const y = Math.floor(startY);
 
-        if (hasSelection && !isPointInSelection(currentX + 0.5, currentY + 0.5, selection)) {
-            continue;
-        }
+    if (x < 0 || y < 0 || x >= width || y >= height) return null;
+    if (selection && !isPointInSelection(x + 0.5, y + 0.5, selection)) return null;
 
-        const pixelIndex = offset * 4;
-        if (!colorsMatch(data, pixelIndex, targetColor)) continue;
+    const fillColor = hexToRgba(currentColor);
+    const startPixel = targetCtx.getImageData(x, y, 1, 1).data;
+    if (colorsMatch(startPixel, 0, fillColor)) return null;
+
+    const result = await computeLayerFillMask(x, y, {
+        tolerance: FILL_TOLERANCE,
+        includeAlpha: true,
+        antialias: fillAntialias,
+        clip: getSelectionClipMask(width, height),
+    });
+    // пока считалась маска, пользователь мог переключить слой или кадр
+    if (!result || targetCanvas !== bufferCanvas) return null;
 
-        setPixelColor(data, pixelIndex, fillColor);
+    applyFillMask(targetCtx, result, fillColor);
+    renderLayer(activeLayer, result.bounds);
+    // границы залитой области — по ним отмечаются изменённые плитки
+    return result.bounds;
+}
 
-        stack.push(currentX + 1, currentY);
-        stack.push(currentX - 1, currentY);
-        stack.push(currentX, currentY + 1);
-        stack.push(currentX, currentY - 1);
+/**
+ * Инструмент «Заливка»: маска считается асинхронно, до её применения
+ * новые нажатия на холст не начинают другое действие.
+ */
+async function runFillTool(x, y) {
+    if (isFillPending) return;
+    isFillPending = true;
+    beginLayerHistory(getToolHistoryLabel(TOOL_FILL));
+    try {
+        const filledBounds = await floodFill(x, y);
+        if (filledBounds && activeLayer) {
+            markLayerDirty(activeLayer, filledBounds);
+            commitLayerHistory();
+        } else {
+            cancelPendingHistory();
+        }
+    } catch (error) {
+        cancelPendingHistory();
+        console.error('Ошибка заливки', error);
+    } finally {
+        isFillPending = false;
     }
-
-    bufferCtx.putImageData(imageData, 0, 0);
-    renderScene();
-    return true;
 }
 
 // =======================
@@ -3179,6 +3851,7 @@ function updateSaveButtonState() {
  * Помечаем, что в проекте появились несохраненные изменения.
  */
 function markUnsavedChanges() {
+    frameEditGeneration += 1;
     if (hasUnsavedChanges) return;
 
     hasUnsavedChanges = true;
@@ -3187,6 +3860,61 @@ function markUnsavedChanges() {
     updateSaveButtonState();
 }
 
+/**
+ * Отмечает плитки слоя, задетые прямоугольником rect (в координатах кадра).
+ * Без rect — весь слой.
+ */
+function addDirtyTiles(layer, rect = null) {
+    if (!layer) return;
+    if (!layer.dirtyTiles) {
+        layer.dirtyTiles = new Set();
+    }
+    const width = layer.bufferCanvas ? layer.bufferCanvas.width : (canvas ? canvas.width : 0);
+    const height = layer.bufferCanvas ? layer.bufferCanvas.height : (canvas ? canvas.height : 0);
+    const cols = Math.ceil(width / RASTER_TILE_SIZE);
+    const rows = Math.ceil(height / RASTER_TILE_SIZE);
+    let fromCol = 0;
+    let fromRow = 0;
+    let toCol = cols - 1;
+    let toRow = rows - 1;
+    if (rect) {
+        if (!(rect.width > 0) || !(rect.height > 0)) return;
+        fromCol = Math.max(0, Math.floor(rect.x / RASTER_TILE_SIZE));
+        fromRow = Math.max(0, Math.floor(rect.y / RASTER_TILE_SIZE));
+        toCol = Math.min(cols - 1, Math.floor((rect.x + rect.width) / RASTER_TILE_SIZE));
+        toRow = Math.min(rows - 1, Math.floor((rect.y + rect.height) / RASTER_TILE_SIZE));
+    }
+    const keys = [];
+    for (let row = fromRow; row <= toRow; row += 1) {
+        for (let col = fromCol; col <= toCol; col += 1) {
+            keys.push(`${col}_${row}`);
+        }
+    }
+    keys.forEach((key) => layer.dirtyTiles.add(key));
+    frameEditGeneration += 1;
+    noteHistoryTiles(layer, keys);
+}
+
+/**
+ * Прямоугольник отрезка от (x1, y1) до (x2, y2) с запасом padding со всех сторон.
+ */
+function getPaddedRect(x1, y1, x2, y2, padding) {
+    return {
+        x: Math.min(x1, x2) - padding,
+        y: Math.min(y1, y2) - padding,
+        width: Math.abs(x2 - x1) + padding * 2,
+        height: Math.abs(y2 - y1) + padding * 2,
+    };
+}
+
+/**
+ * Пиксели слоя изменились: при сохранении уйдут только задетые плитки.
+ */
+function markLayerDirty(layer, rect = null) {
+    addDirtyTiles(layer, rect);
+    markUnsavedChanges();
+}
+
 function initSaveState() {
     setSaveIndicator('idle');
     setSaveStatus('Нет изменений');
@@ -3212,6 +3940,32 @@ function normalizeAssetUrl(url) {
     }
 }
 
+// ячейка таймлайна (.timeline-frame в style.css), пока её нельзя измерить
+const TIMELINE_CELL_FALLBACK = { width: 104, height: 70 };
+
+function getTimelineCellSize() {
+    const cell = timelineStrip ? timelineStrip.querySelector('.timeline-frame') : null;
+    if (cell && cell.clientWidth && cell.clientHeight) {
+        return { width: cell.clientWidth, height: cell.clientHeight };
+    }
+    return TIMELINE_CELL_FALLBACK;
+}
+
+// Самая маленькая миниатюра, которая закрывает ячейку (object-fit: cover) с учётом
+// devicePixelRatio; если таких нет или миниатюры ещё не построены — полное превью.
+function pickTimelineImageUrl(frame, cellSize) {
+    const thumbnails = Array.isArray(frame.thumbnails) ? frame.thumbnails : [];
+    const ratio = window.devicePixelRatio || 1;
+    const longSide = Math.max(projectWidth, projectHeight);
+    for (const thumbnail of thumbnails) {
+        const scale = Math.min(1, thumbnail.size / longSide);
+        if (projectWidth * scale >= cellSize.width * ratio && projectHeight * scale >= cellSize.height * ratio) {
+            return thumbnail.url;
+        }
+    }
+    return frame.preview_url || '';
+}
+
 function getTimelineFrameById(frameId) {
     return timelineFrames.find((frame) => frame.id === frameId) || null;
 }
@@ -3220,6 +3974,33 @@ function getTimelineFrameByIndex(frameIndex) {
     return timelineFrames.find((frame) => frame.index === frameIndex) || null;
 }
 
+/**
+ * Номер кадра на сервере не хранится — это его место в списке,
+ * поэтому после локальных вставок/удалений номера просто пересчитываются.
+ */
+function reindexTimelineFrames() {
+    timelineFrames.forEach((frame, position) => {
+        frame.index = position + 1;
+    });
+}
+
+function isFrameIndexSelected(frameIndex) {
+    return Boolean(timelineSelection)
+        && frameIndex >= timelineSelection.start
+        && frameIndex <= timelineSelection.end;
+}
+
+function setTimelineSelection(fromIndex, toIndex) {
+    const start = Math.min(fromIndex, toIndex);
+    const end = Math.max(fromIndex, toIndex);
+    timelineSelection = end > start ? { start, end } : null;
+    renderTimelineFrames();
+}
+
+function getTimelineSelectionLength() {
+    return timelineSelection ? timelineSelection.end - timelineSelection.start + 1 : 0;
+}
+
 function syncCurrentFrameIdFromTimeline() {
     if (currentFrameId) return;
     const found = getTimelineFrameByIndex(currentFrameIndex);
@@ -3232,6 +4013,7 @@ function renderTimelineFrames() {
     if (!timelineStrip) return;
 
     const previousScroll = timelineStrip.scrollLeft;
+    const cellSize = getTimelineCellSize();
     timelineStrip.innerHTML = '';
 
     timelineFrames.forEach((frame) => {
@@ -3241,6 +4023,9 @@ function renderTimelineFrames() {
         if (frame.index === currentFrameIndex) {
             button.classList.add('timeline-frame--active');
         }
+        if (isFrameIndexSelected(frame.index)) {
+            button.classList.add('timeline-frame--selected');
+        }
         button.dataset.frameId = String(frame.id);
         button.dataset.frameIndex = String(frame.index);
         button.draggable = true;
@@ -3255,7 +4040,7 @@ function renderTimelineFrames() {
             const img = document.createElement('img');
             img.className = 'timeline-frame__img';
             img.alt = `Кадр ${frame.index}`;
-            img.src = normalizeAssetUrl(frame.preview_url);
+            img.src = normalizeAssetUrl(pickTimelineImageUrl(frame, cellSize));
             img.onerror = () => {
                 img.remove();
                 if (!button.querySelector('.timeline-frame__placeholder')) {
@@ -3307,6 +4092,7 @@ function updateTimelineFramePreview(framePayload) {
     const storedByIndex = stored || (Number.isFinite(frameIndex) ? getTimelineFrameByIndex(frameIndex) : null);
     if (storedByIndex) {
         storedByIndex.preview_url = previewUrl || storedByIndex.preview_url || '';
+        storedByIndex.thumbnails = Array.isArray(framePayload.thumbnails) ? framePayload.thumbnails : [];
         storedByIndex.updated_at = updatedAt || storedByIndex.updated_at || '';
         if (Number.isFinite(frameIndex) && frameIndex > 0) {
             storedByIndex.index = frameIndex;
@@ -3328,8 +4114,9 @@ function updateTimelineFramePreview(framePayload) {
     }
 
     if (previewUrl) {
-        const normalized = normalizeAssetUrl(previewUrl);
-        const cacheBusted = `${normalized}${normalized.includes('?') ? '&' : '?'}v=${Date.now()}`;
+        const imageUrl = pickTimelineImageUrl({ preview_url: previewUrl, thumbnails: framePayload.thumbnails }, getTimelineCellSize());
+        // адрес превью содержит хэш содержимого: новые пиксели — новый URL, сбрасывать кэш не нужно
+        const normalized = normalizeAssetUrl(imageUrl);
         let img = el.querySelector('img.timeline-frame__img');
         if (!img) {
             img = document.createElement('img');
@@ -3339,7 +4126,7 @@ function updateTimelineFramePreview(framePayload) {
             if (placeholder) placeholder.remove();
             el.appendChild(img);
         }
-        img.src = cacheBusted;
+        img.src = normalized;
         img.onerror = () => {
             img.remove();
             if (!el.querySelector('.timeline-frame__placeholder')) {
@@ -3352,15 +4139,53 @@ function updateTimelineFramePreview(framePayload) {
     }
 }
 
+function getFramesListUrl() {
+    if (timelineRevision === null) return framesListUrl;
+    const url = new URL(framesListUrl, window.location.origin);
+    url.searchParams.set('since', String(timelineRevision));
+    return url.toString();
+}
+
+/**
+ * Вливает ответ frames_list в timelineFrames. Полный список просто заменяет
+ * старый; в ленте изменений приходят только изменённые кадры (с position)
+ * и id удалённых — остальные кадры остаются как есть.
+ */
+function applyTimelineFrames(data) {
+    const frames = Array.isArray(data.frames) ? data.frames : [];
+    if (data.full || timelineRevision === null) {
+        timelineFrames = frames;
+        frameBundleCache.clear();
+    } else {
+        // кадры из ленты изменений менялись на сервере — их снимки устарели
+        frames.forEach((frame) => frameBundleCache.delete(frame.id));
+        (data.deleted_ids || []).forEach((id) => frameBundleCache.delete(Number(id)));
+        const replacedIds = new Set((data.deleted_ids || []).map(Number));
+        frames.forEach((frame) => replacedIds.add(frame.id));
+        timelineFrames = timelineFrames
+            .filter((frame) => !replacedIds.has(frame.id))
+            .concat(frames)
+            .sort((a, b) => a.position - b.position);
+        reindexTimelineFrames();
+    }
+    timelineRevision = Number(data.revision) || 0;
+    pruneDecodedFrames();
+}
+
 async function loadTimelineFrames() {
     if (!framesListUrl) return;
     try {
-        const response = await fetch(framesListUrl, { credentials: 'same-origin' });
-        const data = await response.json();
-        if (!response.ok || !data || !data.ok) {
+        const { ok, data } = await fetchJsonWithValidators(getFramesListUrl());
+        if (!ok || !data || !data.ok) {
             throw new Error('Не удалось загрузить кадры.');
         }
-        timelineFrames = Array.isArray(data.frames) ? data.frames : [];
+        applyTimelineFrames(data);
+        if (!data.full && timelineFrames.length !== Number(data.total)) {
+            // локальный список разошёлся с сервером — берём его целиком
+            timelineRevision = null;
+            await loadTimelineFrames();
+            return;
+        }
         syncCurrentFrameIdFromTimeline();
         renderTimelineFrames();
     } catch (error) {
@@ -3368,27 +4193,309 @@ async function loadTimelineFrames() {
     }
 }
 
+/**
+ * Ответ на изменение кадров несёт ревизию проекта. Если она следующая за нашей,
+ * локальная правка timelineFrames и есть всё изменение; иначе кадры менял
+ * кто-то ещё (другая вкладка, перераздача position) — догружаем ленту изменений.
+ */
+function acknowledgeTimelineRevision(revision) {
+    const value = Number(revision);
+    if (!Number.isFinite(value) || timelineRevision === null) return;
+    if (value === timelineRevision + 1) {
+        timelineRevision = value;
+    } else if (value > timelineRevision) {
+        loadTimelineFrames();
+    }
+}
+
+/**
+ * Открывает редактор одним запросом project_bundle: таймлайн и слои всех кадров.
+ * Слои кадров, кроме текущего, остаются в frameBundleCache до перехода на кадр.
+ * Возвращает false, если бандл не загрузился — тогда работают frames_list и frame_layers.
+ */
+async function loadProjectBundle() {
+    if (!projectBundleUrl) return false;
+    try {
+        // Cache-Control: no-cache — браузер сам переспросит сервер по ETag
+        const response = await fetch(projectBundleUrl, { credentials: 'same-origin' });
+        const data = response.ok ? await response.json() : null;
+        if (!data || !data.ok || !Array.isArray(data.frames)) {
+            throw new Error('Не удалось загрузить проект.');
+        }
+        const bundled = data.frames.map(({ layers: frameLayers, ...frame }) => ({ frame, layers: frameLayers || [] }));
+        timelineRevision = null;
+        applyTimelineFrames({ full: true, revision: data.revision, frames: bundled.map((item) => ({ ...item.frame })) });
+        bundled.forEach((item) => frameBundleCache.set(item.frame.id, item));
+        syncCurrentFrameIdFromTimeline();
+        const current = currentFrameId ? frameBundleCache.get(currentFrameId) : null;
+        if (current) {
+            frameBundleCache.delete(currentFrameId);
+            mergeLayerList(current.layers);
+        } else {
+            await loadLayers();
+        }
+        renderTimelineFrames();
+        return true;
+    } catch (error) {
+        console.error('Ошибка загрузки проекта', error);
+        return false;
+    }
+}
+
+/**
+ * Снимок текущего кадра перед уходом с него: слои в layers и ссылки на растры
+ * после сохранения совпадают с сервером, так что обратный переход тоже без запроса.
+ * С несохранёнными правками снимок не делается — кадр загрузится с сервера.
+ */
+function rememberCurrentFrameBundle() {
+    if (!currentFrameId || hasUnsavedChanges) return;
+    const snapshot = {
+        frame: {
+            id: currentFrameId,
+            preview_url: currentFramePreviewUrl,
+            updated_at: currentFrameUpdatedAt,
+            has_content: Boolean(currentFrameUpdatedAt),
+        },
+        layers: layers.map((layer) => ({
+            id: layer.id,
+            order: layer.order,
+            name: layer.name,
+            visible: layer.visible,
+            opacity: layer.opacity,
+            raster_url: layer.raster_url || '',
+        })),
+    };
+    frameBundleCache.set(currentFrameId, snapshot);
+    rememberDecodedFrame(currentFrameId, snapshot);
+}
+
+function canCacheDecodedFrames() {
+    return typeof createImageBitmap === 'function';
+}
+
+function dropDecodedFrame(frameId) {
+    const entry = decodedFrameCache.get(frameId);
+    if (!entry) return;
+    decodedFrameCache.delete(frameId);
+    decodedFrameBytes -= entry.bytes;
+    entry.bitmaps.forEach((bitmap) => bitmap.close());
+}
+
+/**
+ * Кладёт декодированный кадр в кэш и вытесняет давно открытые кадры сверх
+ * FRAME_CACHE_BUDGET. Открытый кадр не вытесняется: его битмапы могут ещё рисоваться.
+ */
+function storeDecodedFrame(frameId, entry) {
+    dropDecodedFrame(frameId);
+    decodedFrameCache.set(frameId, entry);
+    decodedFrameBytes += entry.bytes;
+    for (const cachedId of decodedFrameCache.keys()) {
+        if (decodedFrameBytes <= FRAME_CACHE_BUDGET) break;
+        if (cachedId !== currentFrameId) {
+            dropDecodedFrame(cachedId);
+        }
+    }
+}
+
+/**
+ * Декодированный кадр, если он не менялся с момента декодирования:
+ * updated_at из таймлайна сравнивается с тем, что был у кадра тогда.
+ */
+function getDecodedFrame(timelineFrame) {
+    const entry = decodedFrameCache.get(timelineFrame.id);
+    if (!entry) return null;
+    if (entry.updatedAt !== (timelineFrame.updated_at || '')) {
+        dropDecodedFrame(timelineFrame.id);
+        return null;
+    }
+    decodedFrameCache.delete(timelineFrame.id);
+    decodedFrameCache.set(timelineFrame.id, entry);
+    return entry;
+}
+
+/**
+ * Битмап растра слоя открытого кадра; raster_url несёт версию растра,
+ * так что битмап под тем же адресом совпадает с сервером.
+ */
+function getDecodedRaster(url) {
+    const entry = currentFrameId ? decodedFrameCache.get(currentFrameId) : null;
+    return entry && url ? entry.bitmaps.get(url) || null : null;
+}
+
+/**
+ * Кадры, удалённые или изменённые на сервере (по ленте таймлайна), освобождают память сразу.
+ */
+function pruneDecodedFrames() {
+    decodedFrameCache.forEach((entry, frameId) => {
+        if (frameId === currentFrameId) return;
+        const timelineFrame = getTimelineFrameById(frameId);
+        if (!timelineFrame || (timelineFrame.updated_at || '') !== entry.updatedAt) {
+            dropDecodedFrame(frameId);
+        }
+    });
+}
+
+/**
+ * Уходя с кадра, снимаем битмапы его слоёв прямо с буферов — возврат на него
+ * не загружает и не декодирует растры заново.
+ */
+function rememberDecodedFrame(frameId, snapshot) {
+    if (!canCacheDecodedFrames()) return;
+    const timelineFrame = getTimelineFrameById(frameId);
+    const updatedAt = timelineFrame ? timelineFrame.updated_at || '' : '';
+    const rasterLayers = layers.filter((layer) => layer.raster_url && layer.bufferCanvas);
+    // createImageBitmap снимает пиксели в момент вызова, до замены слоёв новым кадром
+    Promise.all(rasterLayers.map((layer) => createImageBitmap(layer.bufferCanvas)))
+        .then((bitmaps) => {
+            const entry = { updatedAt, ...snapshot, bitmaps: new Map(), bytes: 0 };
+            rasterLayers.forEach((layer, position) => {
+                entry.bitmaps.set(layer.raster_url, bitmaps[position]);
+                entry.bytes += bitmaps[position].width * bitmaps[position].height * 4;
+            });
+            storeDecodedFrame(frameId, entry);
+        })
+        .catch((error) => {
+            console.warn('Не удалось запомнить кадр', error);
+        });
+}
+
+/**
+ * Загружает и декодирует растры слоёв кадра вне основного потока (createImageBitmap).
+ */
+async function decodeFrameRasters(frameLayers) {
+    const rasterLayers = frameLayers.filter((layer) => layer.raster_url);
+    const results = await Promise.allSettled(rasterLayers.map(async (layer) => {
+        const response = await fetch(normalizeAssetUrl(layer.raster_url), { credentials: 'same-origin' });
+        if (!response.ok) {
+            throw new Error(`Не удалось загрузить растр слоя ${layer.id}`);
+        }
+        return createImageBitmap(await response.blob());
+    }));
+    const failed = results.find((result) => result.status === 'rejected');
+    if (failed) {
+        results.forEach((result) => {
+            if (result.status === 'fulfilled') result.value.close();
+        });
+        throw failed.reason;
+    }
+    const bitmaps = new Map();
+    let bytes = 0;
+    rasterLayers.forEach((layer, position) => {
+        const bitmap = results[position].value;
+        bitmaps.set(layer.raster_url, bitmap);
+        bytes += bitmap.width * bitmap.height * 4;
+    });
+    return { bitmaps, bytes };
+}
+
+/**
+ * Фоновая загрузка кадра: метаданные из бандла проекта или frame_detail, затем растры.
+ */
+function prefetchFrame(timelineFrame, index) {
+    const frameId = timelineFrame.id;
+    if (framePrefetches.has(frameId)) return framePrefetches.get(frameId);
+    const task = (async () => {
+        let frame = null;
+        let frameLayers = null;
+        const bundled = frameBundleCache.get(frameId);
+        if (bundled) {
+            ({ frame, layers: frameLayers } = bundled);
+        } else {
+            const url = getFrameDetailUrl(index);
+            if (!url) return;
+            const { ok, data } = await fetchJsonWithValidators(url);
+            // за время запроса кадры могли переставить — под номером оказался другой кадр
+            if (!ok || !data || !data.ok || !data.frame || Number(data.frame.id) !== frameId) return;
+            frame = data.frame;
+            frameLayers = Array.isArray(data.layers) ? data.layers : [];
+        }
+        const { bitmaps, bytes } = await decodeFrameRasters(frameLayers);
+        storeDecodedFrame(frameId, {
+            updatedAt: frame.updated_at || '',
+            frame,
+            layers: frameLayers,
+            bitmaps,
+            bytes,
+        });
+    })()
+        .catch((error) => {
+            console.warn('Не удалось заранее загрузить кадр', error);
+        })
+        .finally(() => {
+            framePrefetches.delete(frameId);
+        });
+    framePrefetches.set(frameId, task);
+    return task;
+}
+
+/**
+ * Декодирует кадры N±1…N±FRAME_PREFETCH_RADIUS вокруг текущего, ближние первыми,
+ * по одному за раз. Новый переход прерывает прежний обход.
+ */
+async function prefetchNeighbourFrames() {
+    if (!canCacheDecodedFrames() || !timelineFrames.length) return;
+    framePrefetchGeneration += 1;
+    const generation = framePrefetchGeneration;
+    const center = currentFrameIndex;
+    for (let distance = 1; distance <= FRAME_PREFETCH_RADIUS; distance += 1) {
+        for (const index of [center + distance, center - distance]) {
+            if (generation !== framePrefetchGeneration) return;
+            const timelineFrame = getTimelineFrameByIndex(index);
+            if (!timelineFrame || timelineFrame.id === currentFrameId) continue;
+            if (getDecodedFrame(timelineFrame)) continue;
+            await prefetchFrame(timelineFrame, index);
+        }
+    }
+}
+
+async function fetchFrameForSwitch(index) {
+    const timelineFrame = getTimelineFrameByIndex(index);
+    if (timelineFrame && framePrefetches.has(timelineFrame.id)) {
+        // кадр уже догружается в фоне — дожидаемся его, а не запрашиваем второй раз
+        await framePrefetches.get(timelineFrame.id);
+    }
+    const decoded = timelineFrame ? getDecodedFrame(timelineFrame) : null;
+    if (decoded) {
+        frameBundleCache.delete(timelineFrame.id);
+        return { ok: true, data: { ok: true, frame: decoded.frame, layers: decoded.layers } };
+    }
+    const bundled = timelineFrame ? frameBundleCache.get(timelineFrame.id) : null;
+    if (bundled) {
+        // снимок забираем: пока кадр открыт, его состояние — это layers редактора
+        frameBundleCache.delete(timelineFrame.id);
+        return { ok: true, data: { ok: true, frame: bundled.frame, layers: bundled.layers } };
+    }
+    const url = getFrameDetailUrl(index);
+    if (!url) return null;
+    return fetchJsonWithValidators(url);
+}
+
 async function loadFrameByIndex(targetIndex) {
     const index = Number(targetIndex);
     if (!Number.isFinite(index) || index <= 0) return false;
 
-    const url = getFrameDetailUrl(index);
-    if (!url) return false;
+    if (!getFrameDetailUrl(index)) return false;
 
     isSwitchingFrame = true;
     setTimelineControlsDisabled(true);
 
     try {
-        const response = await fetch(url, { credentials: 'same-origin' });
-        const data = await response.json();
-        if (!response.ok || !data || !data.ok) {
+        const previousFrameId = currentFrameId;
+        const loaded = await fetchFrameForSwitch(index);
+        const data = loaded ? loaded.data : null;
+        if (!loaded || !loaded.ok || !data || !data.ok) {
             throw new Error('Не удалось загрузить кадр.');
         }
+        if (previousFrameId !== (data.frame && data.frame.id ? Number(data.frame.id) : null)) {
+            rememberCurrentFrameBundle();
+        }
 
         currentFrameIndex = index;
         currentFrameId = data.frame && data.frame.id ? Number(data.frame.id) : currentFrameId;
 
-        const hasPersistedData = Boolean(data.frame && (data.frame.preview_url || data.frame.content_json));
+        const hasPersistedData = Boolean(
+            data.frame && (data.frame.preview_url || data.frame.content_json || data.frame.has_content),
+        );
         currentFramePreviewUrl = (data.frame && data.frame.preview_url) ? data.frame.preview_url : '';
         currentFrameUpdatedAt = hasPersistedData && data.frame && data.frame.updated_at ? data.frame.updated_at : '';
 
@@ -3397,6 +4504,7 @@ async function loadFrameByIndex(targetIndex) {
         cancelPendingHistory();
         hasUnsavedChanges = false;
         lastSavedAt = null;
+        lastSavedContentHash = '';
 
         if (Array.isArray(data.layers)) {
             mergeLayerList(data.layers);
@@ -3411,6 +4519,7 @@ async function loadFrameByIndex(targetIndex) {
         setActiveTimelineIndex(currentFrameIndex);
         updateSaveButtonState();
         updateHistoryPanel();
+        prefetchNeighbourFrames();
         return true;
     } catch (error) {
         console.error('Ошибка загрузки кадра', error);
@@ -3468,7 +4577,12 @@ async function createFrameOnServer(options = {}) {
             throw new Error('Не удалось создать кадр.');
         }
 
-        timelineFrames = Array.isArray(data.frames) ? data.frames : timelineFrames;
+        if (data.frame) {
+            timelineFrames.push(data.frame);
+            reindexTimelineFrames();
+        }
+        acknowledgeTimelineRevision(data.revision);
+        timelineSelection = null;
         currentFrameIndex = Number(data.active_index) || currentFrameIndex;
         currentFrameId = data.frame && data.frame.id ? Number(data.frame.id) : currentFrameId;
         renderTimelineFrames();
@@ -3513,7 +4627,14 @@ async function deleteCurrentFrameOnServer() {
             throw new Error('Не удалось удалить кадр.');
         }
 
-        timelineFrames = Array.isArray(data.frames) ? data.frames : [];
+        const deletedId = Number(data.deleted_id);
+        timelineFrames = timelineFrames.filter((frame) => frame.id !== deletedId);
+        if (data.frame) {
+            timelineFrames.push(data.frame);
+        }
+        reindexTimelineFrames();
+        acknowledgeTimelineRevision(data.revision);
+        timelineSelection = null;
         const nextIndex = Number(data.active_index) || 1;
         currentFrameId = null;
         renderTimelineFrames();
@@ -3527,9 +4648,9 @@ async function deleteCurrentFrameOnServer() {
     }
 }
 
-async function saveFrameOrder(orderedIds) {
+async function saveFrameMove(frameId, targetIndex) {
     if (!frameReorderUrl) return;
-    if (!Array.isArray(orderedIds) || orderedIds.length < 2) return;
+    if (!Number.isFinite(frameId) || !Number.isFinite(targetIndex)) return;
 
     try {
         const response = await fetch(frameReorderUrl, {
@@ -3539,17 +4660,24 @@ async function saveFrameOrder(orderedIds) {
                 'X-CSRFToken': getCsrfToken(),
             },
             credentials: 'same-origin',
-            body: JSON.stringify({ ordered_ids: orderedIds }),
+            body: JSON.stringify({ frame_id: frameId, target_index: targetIndex }),
         });
         const data = await response.json();
         if (!response.ok || !data || !data.ok) {
             throw new Error('Не удалось сохранить порядок кадров.');
         }
 
-        const activeId = currentFrameId;
-        timelineFrames = Array.isArray(data.frames) ? data.frames : timelineFrames;
-        if (activeId) {
-            const activeFrame = getTimelineFrameById(activeId);
+        // сервер вернул только перенесённый кадр — остальные сдвигаем у себя
+        const fromPosition = timelineFrames.findIndex((frame) => frame.id === frameId);
+        if (fromPosition !== -1) {
+            const [moved] = timelineFrames.splice(fromPosition, 1);
+            timelineFrames.splice(Number(data.to_index) - 1, 0, { ...moved, ...data.frame });
+        }
+        reindexTimelineFrames();
+        acknowledgeTimelineRevision(data.revision);
+        timelineSelection = null;
+        if (currentFrameId) {
+            const activeFrame = getTimelineFrameById(currentFrameId);
             if (activeFrame) {
                 currentFrameIndex = activeFrame.index;
             }
@@ -3558,11 +4686,126 @@ async function saveFrameOrder(orderedIds) {
         setActiveTimelineIndex(currentFrameIndex);
     } catch (error) {
         console.error('Ошибка сохранения порядка кадров', error);
+        renderTimelineFrames();
     }
 }
 
-function bindTimelineEvents() {
-    if (addFrameButton) {
+/**
+ * Операции над диапазоном кадров: одна транзакция на сервере вместо запроса на каждый кадр.
+ */
+async function postFramesRange(url, payload) {
+    const response = await fetch(url, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'X-CSRFToken': getCsrfToken(),
+        },
+        credentials: 'same-origin',
+        body: JSON.stringify(payload),
+    });
+    const data = await response.json();
+    if (!response.ok || !data || !data.ok) {
+        throw new Error((data && data.error) || 'Не удалось изменить кадры.');
+    }
+    return data;
+}
+
+async function duplicateSelectedFrames() {
+    if (!timelineSelection || !framesRangeDuplicateUrl || isSwitchingFrame) return;
+    setTimelineControlsDisabled(true);
+    const savedOk = await saveCurrentFrame();
+    if (!savedOk && hasUnsavedChanges) {
+        setTimelineControlsDisabled(false);
+        return;
+    }
+
+    try {
+        const { start, end } = timelineSelection;
+        const data = await postFramesRange(framesRangeDuplicateUrl, { start, end });
+        const copies = Array.isArray(data.frames) ? data.frames : [];
+        const insertAt = Number(data.active_index) || end + 1;
+        timelineFrames.splice(insertAt - 1, 0, ...copies);
+        reindexTimelineFrames();
+        acknowledgeTimelineRevision(data.revision);
+        timelineSelection = copies.length > 1
+            ? { start: insertAt, end: insertAt + copies.length - 1 }
+            : null;
+        currentFrameId = copies.length ? copies[0].id : currentFrameId;
+        renderTimelineFrames();
+        await loadFrameByIndex(insertAt);
+    } catch (error) {
+        console.error('Ошибка дублирования кадров', error);
+        setSaveStatus('Не удалось дублировать кадры', 'error');
+        setSaveIndicator('error');
+    } finally {
+        setTimelineControlsDisabled(false);
+    }
+}
+
+async function deleteSelectedFrames() {
+    if (!timelineSelection || !framesRangeDeleteUrl || isSwitchingFrame) return;
+    const { start, end } = timelineSelection;
+    const confirmDelete = window.confirm(`Удалить кадры ${start}–${end}?`);
+    if (!confirmDelete) return;
+
+    setTimelineControlsDisabled(true);
+    const savedOk = await saveCurrentFrame();
+    if (!savedOk && hasUnsavedChanges) {
+        setTimelineControlsDisabled(false);
+        return;
+    }
+
+    try {
+        const data = await postFramesRange(framesRangeDeleteUrl, { start, end });
+        const deletedIds = new Set((data.deleted_ids || []).map(Number));
+        timelineFrames = timelineFrames.filter((frame) => !deletedIds.has(frame.id));
+        if (data.frame) {
+            timelineFrames.push(data.frame);
+        }
+        reindexTimelineFrames();
+        acknowledgeTimelineRevision(data.revision);
+        timelineSelection = null;
+        currentFrameId = null;
+        renderTimelineFrames();
+        await loadFrameByIndex(Number(data.active_index) || 1);
+    } catch (error) {
+        console.error('Ошибка удаления кадров', error);
+        setSaveStatus('Не удалось удалить кадры', 'error');
+        setSaveIndicator('error');
+    } finally {
+        setTimelineControlsDisabled(false);
+    }
+}
+
+async function moveSelectedFrames(targetIndex) {
+    if (!timelineSelection || !framesRangeMoveUrl) return;
+    const { start, end } = timelineSelection;
+    try {
+        const data = await postFramesRange(framesRangeMoveUrl, { start, end, target: targetIndex });
+        const moved = Array.isArray(data.frames) ? data.frames : [];
+        const movedIds = new Set(moved.map((frame) => frame.id));
+        // берём кадры из ответа: у них новые position
+        const movedFrames = moved.map((frame) => ({ ...getTimelineFrameById(frame.id), ...frame }));
+        timelineFrames = timelineFrames.filter((frame) => !movedIds.has(frame.id));
+        const toIndex = Number(data.to_index) || start;
+        timelineFrames.splice(toIndex - 1, 0, ...movedFrames);
+        reindexTimelineFrames();
+        acknowledgeTimelineRevision(data.revision);
+        timelineSelection = { start: toIndex, end: toIndex + movedFrames.length - 1 };
+        if (currentFrameId) {
+            const activeFrame = getTimelineFrameById(currentFrameId);
+            if (activeFrame) {
+                currentFrameIndex = activeFrame.index;
+            }
+        }
+    } catch (error) {
+        console.error('Ошибка переноса кадров', error);
+    }
+    renderTimelineFrames();
+}
+
+function bindTimelineEvents() {
+    if (addFrameButton) {
         addFrameButton.addEventListener('click', () => {
             createFrameOnServer({ duplicate: false });
         });
@@ -3570,12 +4813,20 @@ function bindTimelineEvents() {
 
     if (duplicateFrameButton) {
         duplicateFrameButton.addEventListener('click', () => {
+            if (timelineSelection) {
+                duplicateSelectedFrames();
+                return;
+            }
             createFrameOnServer({ duplicate: true });
         });
     }
 
     if (deleteFrameButton) {
         deleteFrameButton.addEventListener('click', () => {
+            if (timelineSelection) {
+                deleteSelectedFrames();
+                return;
+            }
             deleteCurrentFrameOnServer();
         });
     }
@@ -3587,6 +4838,14 @@ function bindTimelineEvents() {
         if (!item) return;
         const index = Number(item.dataset.frameIndex);
         if (!Number.isFinite(index) || index <= 0) return;
+        if (event.shiftKey) {
+            setTimelineSelection(currentFrameIndex, index);
+            return;
+        }
+        if (timelineSelection) {
+            timelineSelection = null;
+            renderTimelineFrames();
+        }
         switchToFrameIndex(index);
     });
 
@@ -3624,14 +4883,38 @@ function bindTimelineEvents() {
 
     timelineStrip.addEventListener('drop', (event) => {
         event.preventDefault();
-        const orderedIds = [...timelineStrip.querySelectorAll('.timeline-frame')]
-            .map((item) => Number(item.dataset.frameId))
-            .filter((value) => Number.isFinite(value));
-        saveFrameOrder(orderedIds);
+        if (!dragFrameId) return;
+        const items = [...timelineStrip.querySelectorAll('.timeline-frame')];
+        const dragged = getTimelineFrameById(dragFrameId);
+        if (dragged && isFrameIndexSelected(dragged.index) && getTimelineSelectionLength() > 1) {
+            // тащим выделенный диапазон: первый кадр встанет после всех невыделенных кадров левее
+            const selectedIds = new Set(timelineFrames
+                .filter((frame) => isFrameIndexSelected(frame.index))
+                .map((frame) => frame.id));
+            let othersBefore = 0;
+            for (const item of items) {
+                const itemId = Number(item.dataset.frameId);
+                if (itemId === dragFrameId) break;
+                if (!selectedIds.has(itemId)) othersBefore += 1;
+            }
+            if (othersBefore + 1 === timelineSelection.start) {
+                renderTimelineFrames();
+                return;
+            }
+            moveSelectedFrames(othersBefore + 1);
+            return;
+        }
+        const targetPosition = items.findIndex((item) => Number(item.dataset.frameId) === dragFrameId);
+        if (targetPosition === -1) return;
+        if (dragged && dragged.index === targetPosition + 1) return;
+        saveFrameMove(dragFrameId, targetPosition + 1);
     });
 }
 
-function flattenLayers() {
+/**
+ * Сводит видимые слои снимка кадра (captureFrameSnapshot) в общий холст flattenCanvas.
+ */
+function flattenLayers(snapshot = captureFrameSnapshot()) {
     if (!canvas || !layers.length) return null;
     if (!flattenCanvas) {
         flattenCanvas = document.createElement('canvas');
@@ -3650,25 +4933,164 @@ function flattenLayers() {
     flattenCtx.setTransform(1, 0, 0, 1, 0, 0);
     flattenCtx.clearRect(0, 0, flattenCanvas.width, flattenCanvas.height);
 
-    const ordered = [...layers].sort((a, b) => {
-        if (a.order !== b.order) {
-            return a.order - b.order;
-        }
-        return a.id - b.id;
+    snapshot.layers.forEach((source) => {
+        if (!source.visible || !source.canvas) return;
+        flattenCtx.globalAlpha = clamp(source.opacity, 0, 100) / 100;
+        flattenCtx.drawImage(source.canvas, 0, 0);
     });
+    flattenCtx.globalAlpha = 1;
+    return flattenCanvas;
+}
 
-    const activeCompositeCanvas = hasFloatingSelection() ? getActiveLayerCompositeCanvas() : null;
-    ordered.forEach((layer) => {
-        if (!layer.visible) return;
-        const sourceCanvas = (activeCompositeCanvas && layer.id === activeLayerId)
-            ? activeCompositeCanvas
-            : layer.bufferCanvas;
-        if (!sourceCanvas) return;
-        flattenCtx.globalAlpha = clamp(layer.opacity, 0, 100) / 100;
-        flattenCtx.drawImage(sourceCanvas, 0, 0);
+function canvasToBlob(sourceCanvas, type = 'image/png') {
+    return new Promise((resolve) => {
+        sourceCanvas.toBlob((blob) => resolve(blob), type);
     });
-    flattenCtx.globalAlpha = 1;
-    return flattenCanvas.toDataURL('image/png');
+}
+
+// =======================
+// Воркеры (encode_worker.js, flood_fill.js)
+// =======================
+
+/**
+ * Клиент воркера: запрос { id, ...message } -> Promise ответа { id, result | error }.
+ * Если воркер не запустился или упал, до перезагрузки страницы isAvailable() ложно
+ * и вызывающий код работает в основном потоке.
+ */
+function createWorkerClient(url) {
+    let worker = null;
+    let broken = false;
+    let nextId = 1;
+    const requests = new Map();
+
+    function fail(error) {
+        broken = true;
+        if (worker) {
+            worker.terminate();
+            worker = null;
+        }
+        requests.forEach(({ reject }) => reject(error));
+        requests.clear();
+    }
+
+    function getWorker() {
+        if (worker) return worker;
+        worker = new Worker(url);
+        worker.onmessage = (event) => {
+            const { id, result, error } = event.data || {};
+            const request = requests.get(id);
+            if (!request) return;
+            requests.delete(id);
+            if (error) {
+                request.reject(new Error(error));
+            } else {
+                request.resolve(result);
+            }
+        };
+        worker.onerror = (event) => {
+            event.preventDefault();
+            fail(new Error(event.message || 'Воркер недоступен.'));
+        };
+        return worker;
+    }
+
+    return {
+        isAvailable() {
+            return Boolean(url) && !broken && typeof Worker !== 'undefined';
+        },
+        // объекты из transfer передаются без копирования и в основном потоке больше недоступны
+        run(message, transfer = []) {
+            return new Promise((resolve, reject) => {
+                const id = nextId;
+                nextId += 1;
+                requests.set(id, { resolve, reject });
+                try {
+                    getWorker().postMessage({ id, ...message }, transfer);
+                } catch (error) {
+                    requests.delete(id);
+                    fail(error);
+                    reject(error);
+                }
+            });
+        },
+    };
+}
+
+const encodeWorkerClient = createWorkerClient(encodeWorkerUrl);
+const floodFillWorkerClient = createWorkerClient(floodFillWorkerUrl);
+
+// воркеру нужны OffscreenCanvas (у него нет DOM) и снимки холстов через createImageBitmap
+function canSendBitmapsToWorkers() {
+    return typeof OffscreenCanvas !== 'undefined' && typeof createImageBitmap === 'function';
+}
+
+function canUseEncodeWorker() {
+    return encodeWorkerClient.isAvailable() && canSendBitmapsToWorkers();
+}
+
+function runEncodeWorker(type, payload, transfer) {
+    return encodeWorkerClient.run({ type, ...payload }, transfer);
+}
+
+function getLayerSaveSourceCanvas(layer, activeCompositeCanvas) {
+    return (activeCompositeCanvas && layer.id === activeLayerId)
+        ? activeCompositeCanvas
+        : layer.bufferCanvas;
+}
+
+/**
+ * Снимки холстов для воркера. createImageBitmap копирует пиксели холста
+ * в момент вызова, поэтому все снимки берутся синхронно, до первого await, —
+ * рисование во время кодирования в сохранение не попадёт.
+ */
+async function snapshotBitmaps(sources) {
+    const pending = sources.map((source) => (source
+        ? createImageBitmap(source.canvas, source.left, source.top, source.width, source.height)
+        : Promise.resolve(null)));
+    const results = await Promise.allSettled(pending);
+    const bitmaps = results.map((result) => (result.status === 'fulfilled' ? result.value : null));
+    const failed = results.find((result) => result.status === 'rejected');
+    if (failed) {
+        bitmaps.forEach((bitmap) => {
+            if (bitmap) bitmap.close();
+        });
+        throw failed.reason;
+    }
+    return bitmaps;
+}
+
+function wholeCanvasSource(sourceCanvas) {
+    if (!sourceCanvas || !sourceCanvas.width || !sourceCanvas.height) return null;
+    return { canvas: sourceCanvas, left: 0, top: 0, width: sourceCanvas.width, height: sourceCanvas.height };
+}
+
+/**
+ * Плоский PNG снимка кадра: сведение и кодирование в воркере,
+ * без него — flattenLayers и toBlob в основном потоке.
+ */
+async function flattenLayersToBlob(snapshot) {
+    if (!canvas || !snapshot.layers.length) return null;
+    if (canUseEncodeWorker()) {
+        const visible = snapshot.layers.filter((source) => source.visible && source.canvas);
+        try {
+            const bitmaps = await snapshotBitmaps(visible.map((source) => wholeCanvasSource(source.canvas)));
+            const flattenedLayers = visible
+                .map((source, position) => ({
+                    bitmap: bitmaps[position],
+                    opacity: clamp(source.opacity, 0, 100) / 100,
+                }))
+                .filter((item) => item.bitmap);
+            return await runEncodeWorker(
+                'flatten',
+                { width: canvas.width, height: canvas.height, layers: flattenedLayers },
+                flattenedLayers.map((item) => item.bitmap),
+            );
+        } catch (error) {
+            console.warn('Сведение кадра в воркере не удалось, сводим в основном потоке', error);
+        }
+    }
+    const flattened = flattenLayers(snapshot);
+    return flattened ? canvasToBlob(flattened, 'image/png') : null;
 }
 
 function drawImageOnLayer(layer, image, options = {}) {
@@ -3682,6 +5104,142 @@ function drawImageOnLayer(layer, image, options = {}) {
     renderScene();
 }
 
+function loadImageElement(url) {
+    return new Promise((resolve, reject) => {
+        const image = new Image();
+        image.onload = () => resolve(image);
+        image.onerror = () => reject(new Error(`Не удалось загрузить изображение ${url}`));
+        image.src = normalizeAssetUrl(url);
+    });
+}
+
+function markFrameHydrated() {
+    if (!lastSavedAt) {
+        lastSavedAt = new Date();
+    }
+    setSaveIndicator('saved');
+    setSaveStatus('Сохранено', 'saved');
+    updateLastSavedLabel();
+    updateSaveButtonState();
+    ensureHistoryBaseline();
+}
+
+function markFrameHydrateFailed() {
+    console.warn('Не удалось загрузить сохраненный кадр');
+    setSaveIndicator('error');
+    setSaveStatus('Не удалось загрузить сохраненный кадр', 'error');
+    ensureHistoryBaseline();
+}
+
+function bytesToHex(buffer) {
+    return [...new Uint8Array(buffer)]
+        .map((value) => value.toString(16).padStart(2, '0'))
+        .join('');
+}
+
+function copyCanvasPixels(sourceCanvas) {
+    if (!sourceCanvas || !sourceCanvas.width || !sourceCanvas.height) return null;
+    const copy = document.createElement('canvas');
+    copy.width = sourceCanvas.width;
+    copy.height = sourceCanvas.height;
+    const copyCtx = copy.getContext('2d');
+    if (!copyCtx) return null;
+    copyCtx.drawImage(sourceCanvas, 0, 0);
+    return copy;
+}
+
+/**
+ * Снимок кадра для сохранения: копии холстов слоёв и их свойства, снятые синхронно.
+ * Хэш и PNG считаются по снимку, а не по живым холстам, — нарисованное
+ * во время сохранения в запрос не попадает.
+ */
+function captureFrameSnapshot() {
+    const activeCompositeCanvas = hasFloatingSelection() ? getActiveLayerCompositeCanvas() : null;
+    return {
+        generation: frameEditGeneration,
+        layers: [...layers]
+            .sort((a, b) => (a.order - b.order) || (a.id - b.id))
+            .map((layer) => ({
+                layer,
+                meta: `${layer.id}:${layer.order}:${layer.visible ? 1 : 0}:${layer.opacity}`,
+                visible: layer.visible,
+                opacity: layer.opacity,
+                canvas: copyCanvasPixels(getLayerSaveSourceCanvas(layer, activeCompositeCanvas)),
+            })),
+    };
+}
+
+/**
+ * SHA-256 содержимого снимка кадра: свойства слоёв и хэши их пикселей.
+ * Намного дешевле кодирования PNG: если хэш совпал с сохранённым, сохранять нечего.
+ * Без crypto.subtle (не https) возвращает '' — тогда кадр сохраняется как обычно.
+ */
+async function computeFrameContentHash(snapshot = captureFrameSnapshot()) {
+    if (!window.crypto || !window.crypto.subtle || !snapshot.layers.length) return '';
+    if (canUseEncodeWorker()) {
+        // getImageData всех слоёв в основном потоке — самая долгая часть автосохранения
+        try {
+            const bitmaps = await snapshotBitmaps(snapshot.layers.map((source) => wholeCanvasSource(source.canvas)));
+            const hashedLayers = snapshot.layers.map((source, position) => ({
+                meta: source.meta,
+                bitmap: bitmaps[position],
+            }));
+            return await runEncodeWorker(
+                'hash',
+                { layers: hashedLayers },
+                bitmaps.filter(Boolean),
+            );
+        } catch (error) {
+            console.warn('Хэш кадра в воркере не посчитан, считаем в основном потоке', error);
+        }
+    }
+    const parts = [];
+    for (const source of snapshot.layers) {
+        parts.push(source.meta);
+        if (source.canvas) {
+            const pixels = source.canvas.getContext('2d')
+                .getImageData(0, 0, source.canvas.width, source.canvas.height).data;
+            parts.push(bytesToHex(await window.crypto.subtle.digest('SHA-256', pixels)));
+        }
+    }
+    const digest = await window.crypto.subtle.digest('SHA-256', new TextEncoder().encode(parts.join('|')));
+    return bytesToHex(digest);
+}
+
+/**
+ * После загрузки растров слоёв запоминаем хэш как «сохранённое» состояние,
+ * чтобы автосохранение без реальных изменений не уходило на сервер.
+ */
+async function rememberHydratedContentHash() {
+    const frameId = currentFrameId;
+    const hasDirtyTiles = layers.some((layer) => layer.dirtyTiles && layer.dirtyTiles.size);
+    if (hasDirtyTiles) return;
+    const contentHash = await computeFrameContentHash();
+    if (frameId === currentFrameId && !hasUnsavedChanges) {
+        lastSavedContentHash = contentHash;
+    }
+}
+
+/**
+ * Рисуем сохранённые PNG слоёв — все запросы идут параллельно.
+ */
+async function hydrateLayerRasters(rasterLayers) {
+    try {
+        // растры из кэша декодированных кадров уже готовы, остальные грузятся как раньше
+        const images = await Promise.all(rasterLayers.map(
+            (layer) => getDecodedRaster(layer.raster_url) || loadImageElement(layer.raster_url),
+        ));
+        rasterLayers.forEach((layer, position) => {
+            drawImageOnLayer(layer, images[position]);
+        });
+        markFrameHydrated();
+        rememberHydratedContentHash();
+    } catch (error) {
+        console.error(error);
+        markFrameHydrateFailed();
+    }
+}
+
 function hydrateSavedFrame() {
     if (!canvas || !layers.length) return;
 
@@ -3690,6 +5248,12 @@ function hydrateSavedFrame() {
         lastSavedAt = savedAt;
     }
 
+    const rasterLayers = layers.filter((layer) => layer.raster_url);
+    if (rasterLayers.length) {
+        hydrateLayerRasters(rasterLayers);
+        return;
+    }
+
     if (!currentFramePreviewUrl) {
         if (lastSavedAt) {
             setSaveIndicator('saved');
@@ -3699,46 +5263,221 @@ function hydrateSavedFrame() {
         return;
     }
 
-    const image = new Image();
-    image.onload = () => {
-        const backgroundLayer = getBackgroundLayer();
-        if (backgroundLayer) {
-            drawImageOnLayer(backgroundLayer, image);
+    // старый кадр без растров слоёв: плоское превью кладём в фон,
+    // и при первом сохранении фон уйдёт на сервер как отдельный слой
+    loadImageElement(currentFramePreviewUrl)
+        .then((image) => {
+            const backgroundLayer = getBackgroundLayer();
+            if (backgroundLayer) {
+                drawImageOnLayer(backgroundLayer, image);
+                addDirtyTiles(backgroundLayer);
+            }
+            markFrameHydrated();
+        })
+        .catch(() => {
+            markFrameHydrateFailed();
+        });
+}
+
+/**
+ * Прямоугольник плитки (col, row) на холсте слоя; null — плитка за краем холста.
+ */
+function getLayerTileSource(sourceCanvas, col, row) {
+    const left = col * RASTER_TILE_SIZE;
+    const top = row * RASTER_TILE_SIZE;
+    const width = Math.min(RASTER_TILE_SIZE, sourceCanvas.width - left);
+    const height = Math.min(RASTER_TILE_SIZE, sourceCanvas.height - top);
+    if (width <= 0 || height <= 0) return null;
+    return { canvas: sourceCanvas, left, top, width, height };
+}
+
+/**
+ * Вырезает плитку из холста слоя в отдельный PNG.
+ */
+function encodeLayerTile({ canvas: sourceCanvas, left, top, width, height }) {
+    const tileCanvas = document.createElement('canvas');
+    tileCanvas.width = width;
+    tileCanvas.height = height;
+    tileCanvas.getContext('2d').drawImage(sourceCanvas, left, top, width, height, 0, 0, width, height);
+    return canvasToBlob(tileCanvas, 'image/png');
+}
+
+/**
+ * PNG изменённых плиток: [{ name, source }] -> [{ name, blob }].
+ * С воркером основной поток только снимает битмапы плиток, кодирует воркер.
+ */
+async function encodeLayerTiles(tileSources) {
+    if (!tileSources.length) return [];
+    if (canUseEncodeWorker()) {
+        try {
+            const bitmaps = await snapshotBitmaps(tileSources.map((tile) => tile.source));
+            return await runEncodeWorker(
+                'tiles',
+                { tiles: tileSources.map((tile, position) => ({ name: tile.name, bitmap: bitmaps[position] })) },
+                bitmaps,
+            );
+        } catch (error) {
+            console.warn('Плитки не закодированы в воркере, кодируем в основном потоке', error);
         }
-        if (!lastSavedAt) {
-            lastSavedAt = new Date();
+    }
+    const tiles = [];
+    for (const tile of tileSources) {
+        const blob = await encodeLayerTile(tile.source);
+        if (blob) tiles.push({ name: tile.name, blob });
+    }
+    return tiles;
+}
+
+/**
+ * Забирает грязные плитки слоёв снимка: [{ layer, keys }].
+ * Вызывать сразу после captureFrameSnapshot, до первого await, — тогда плитки,
+ * задетые во время сохранения, останутся в dirtyTiles до следующего сохранения.
+ */
+function takeDirtyTiles(snapshot) {
+    const pendingTiles = [];
+    snapshot.layers.forEach(({ layer, canvas: sourceCanvas }) => {
+        if (!sourceCanvas || !layer.dirtyTiles || !layer.dirtyTiles.size) return;
+        pendingTiles.push({ layer, keys: [...layer.dirtyTiles] });
+        layer.dirtyTiles.clear();
+    });
+    return pendingTiles;
+}
+
+function restoreDirtyTiles(pendingTiles) {
+    pendingTiles.forEach(({ layer, keys }) => {
+        if (!layer.dirtyTiles) layer.dirtyTiles = new Set();
+        keys.forEach((key) => layer.dirtyTiles.add(key));
+    });
+}
+
+/**
+ * Собираем запрос(ы) сохранения снимка кадра.
+ * Если сервер умеет хранить слои — отправляем только плитки pendingTiles
+ * пачками по MAX_TILES_PER_REQUEST (превью кадра сервер пересобирает на последней),
+ * иначе (старый шаблон) — плоский кадр бинарным multipart-телом (toBlob), без base64.
+ */
+async function buildFrameSaveRequest(snapshot, pendingTiles) {
+    const layerSaveUrl = getLayerSaveUrl();
+    if (layerSaveUrl) {
+        if (!snapshot.layers.length) return null;
+        const snapshotCanvases = new Map(snapshot.layers.map((source) => [source.layer, source.canvas]));
+        const tileSources = [];
+        pendingTiles.forEach(({ layer, keys }) => {
+            const sourceCanvas = snapshotCanvases.get(layer);
+            if (!sourceCanvas) return;
+            keys.forEach((key) => {
+                const [col, row] = key.split('_').map(Number);
+                const source = getLayerTileSource(sourceCanvas, col, row);
+                if (source) tileSources.push({ name: `tile_${layer.id}_${col}_${row}`, source });
+            });
+        });
+        const tiles = await encodeLayerTiles(tileSources);
+
+        const bodies = [];
+        for (let start = 0; start < tiles.length; start += MAX_TILES_PER_REQUEST) {
+            const formData = new FormData();
+            tiles.slice(start, start + MAX_TILES_PER_REQUEST).forEach((tile) => {
+                formData.append(tile.name, tile.blob, `${tile.name}.png`);
+            });
+            bodies.push(formData);
         }
-        setSaveIndicator('saved');
-        setSaveStatus('Сохранено', 'saved');
-        updateLastSavedLabel();
-        updateSaveButtonState();
-        ensureHistoryBaseline();
-    };
-    image.onerror = () => {
-        console.warn('Не удалось загрузить сохраненный кадр');
-        setSaveIndicator('error');
-        setSaveStatus('Не удалось загрузить сохраненный кадр', 'error');
-        ensureHistoryBaseline();
+        if (!bodies.length) {
+            // менялись только свойства слоёв — превью всё равно надо пересобрать
+            bodies.push(new FormData());
+        }
+        bodies.slice(0, -1).forEach((formData) => {
+            formData.append('compose_preview', '0');
+        });
+        return { url: layerSaveUrl, bodies, composesPreviewLater: true };
+    }
+
+    const saveUrl = getFrameSaveUrl(currentFrameIndex);
+    if (!saveUrl) return null;
+    const blob = await flattenLayersToBlob(snapshot);
+    if (!blob) return null;
+    const formData = new FormData();
+    formData.append('image', blob, `frame_${currentFrameIndex}.png`);
+    return { url: saveUrl, bodies: [formData], composesPreviewLater: false };
+}
+
+async function postFrameSaveBody(url, body, contentHash = '') {
+    const headers = {
+        'X-CSRFToken': getCsrfToken(),
     };
-    image.src = normalizeAssetUrl(currentFramePreviewUrl);
+    if (contentHash) {
+        // условная запись: сервер ответит 412, если у кадра уже это содержимое
+        headers['If-None-Match'] = `"${contentHash}"`;
+    }
+    const response = await fetch(url, {
+        method: 'POST',
+        headers,
+        credentials: 'same-origin',
+        body,
+    });
+
+    let data = null;
+    try {
+        data = await response.json();
+    } catch (error) {
+        data = null;
+    }
+
+    if (response.status === 412 && data && data.error === 'unchanged') {
+        return { ...data, ok: true, unchanged: true };
+    }
+
+    if (!response.ok || !data || !data.ok) {
+        const errorMessage = data && data.error ? data.error : 'Не удалось сохранить кадр.';
+        throw new Error(errorMessage);
+    }
+    return data;
+}
+
+function applySavedLayerPayloads(layerItems) {
+    if (!Array.isArray(layerItems)) return;
+    layerItems.forEach((item) => {
+        const layer = getLayerById(item.id);
+        if (layer) {
+            layer.raster_url = item.raster_url || '';
+        }
+    });
 }
 
 /**
- * Собираем данные текущего кадра для сохранения.
+ * После сохранения слоёв превью кадра в таймлайне обновится из ленты изменений,
+ * когда воркер его пересоберёт. Серия сохранений даёт один запрос.
  */
-function getCurrentFramePayload() {
-    const flattened = flattenLayers();
-    if (flattened) {
-        return { image_data: flattened };
+function scheduleFramePreviewRefresh() {
+    if (framePreviewRefreshTimerId !== null) {
+        clearTimeout(framePreviewRefreshTimerId);
     }
-    return null;
+    framePreviewRefreshTimerId = setTimeout(() => {
+        framePreviewRefreshTimerId = null;
+        loadTimelineFrames();
+    }, FRAME_PREVIEW_REFRESH_DELAY_MS);
+}
+
+/**
+ * Снимок сохранён. Флаг несохранённых изменений снимается, только если кадр
+ * не правили после снимка (generation), иначе новые правки ждут следующего сохранения.
+ */
+function finishFrameSave(generation) {
+    if (generation === frameEditGeneration) {
+        hasUnsavedChanges = false;
+        setSaveStatus('Сохранено', 'saved');
+        setSaveIndicator('saved');
+    } else {
+        setSaveStatus('Есть несохраненные изменения', 'dirty');
+        setSaveIndicator('dirty');
+    }
+    updateLastSavedLabel();
 }
 
 /**
  * Отправляем текущий кадр на сервер.
  */
 async function saveCurrentFrame(options = {}) {
-    if (!frameSaveUrlTemplate) {
+    if (!frameSaveUrlTemplate && !layerSaveUrlTemplate) {
         setSaveStatus('Не найден адрес сохранения кадра', 'error');
         setSaveIndicator('error');
         return false;
@@ -3747,20 +5486,6 @@ async function saveCurrentFrame(options = {}) {
     if (isSaving || isAutosaving) return false;
     if (!hasUnsavedChanges) return true;
 
-    const saveUrl = getFrameSaveUrl(currentFrameIndex);
-    if (!saveUrl) {
-        setSaveStatus('Не найден адрес сохранения кадра', 'error');
-        setSaveIndicator('error');
-        return false;
-    }
-
-    const payload = getCurrentFramePayload();
-    if (!payload) {
-        setSaveStatus('Нет данных для сохранения', 'error');
-        setSaveIndicator('error');
-        return false;
-    }
-
     const isAuto = Boolean(options.isAuto);
     if (isAuto) {
         isAutosaving = true;
@@ -3769,45 +5494,60 @@ async function saveCurrentFrame(options = {}) {
     }
 
     updateSaveButtonState();
-    setSaveStatus('Идёт сохранение…', 'saving');
-    setSaveIndicator('saving');
 
+    let pendingTiles = [];
     try {
-        const response = await fetch(saveUrl, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-                'X-CSRFToken': getCsrfToken(),
-            },
-            credentials: 'same-origin',
-            body: JSON.stringify(payload),
-        });
+        // флаги выставлены до await, чтобы кодирование PNG не пересеклось со вторым сохранением.
+        // Снимок и его плитки берутся синхронно: хэш, PNG и очищенные плитки описывают
+        // одно состояние кадра, а правки во время сохранения остаются несохранёнными
+        const snapshot = captureFrameSnapshot();
+        pendingTiles = takeDirtyTiles(snapshot);
+        const contentHash = await computeFrameContentHash(snapshot);
+        if (contentHash && contentHash === lastSavedContentHash) {
+            // пиксели и свойства слоёв совпадают с сохранёнными — ни кодирования, ни запроса
+            pendingTiles = [];
+            finishFrameSave(snapshot.generation);
+            return true;
+        }
 
-        let data = null;
-        try {
-            data = await response.json();
-        } catch (error) {
-            data = null;
+        const saveRequest = await buildFrameSaveRequest(snapshot, pendingTiles);
+        if (!saveRequest) {
+            restoreDirtyTiles(pendingTiles);
+            pendingTiles = [];
+            setSaveStatus('Нет данных для сохранения', 'error');
+            setSaveIndicator('error');
+            return false;
         }
 
-        if (!response.ok || !data || !data.ok) {
-            const errorMessage = data && data.error ? data.error : 'Не удалось сохранить кадр.';
-            throw new Error(errorMessage);
+        setSaveStatus('Идёт сохранение…', 'saving');
+        setSaveIndicator('saving');
+
+        // пачки уходят по очереди: превью пересобирается только на последней
+        let data = null;
+        for (const body of saveRequest.bodies) {
+            data = await postFrameSaveBody(saveRequest.url, body, contentHash);
+            if (data.unchanged) break;
         }
 
-        hasUnsavedChanges = false;
+        pendingTiles = [];
+        lastSavedContentHash = contentHash;
         lastSavedAt = new Date();
+        applySavedLayerPayloads(data.layers);
         if (data.frame) {
             currentFramePreviewUrl = data.frame.preview_url || currentFramePreviewUrl || '';
             currentFrameUpdatedAt = data.frame.updated_at || currentFrameUpdatedAt || '';
             updateTimelineFramePreview(data.frame);
         }
-        setSaveStatus('Сохранено', 'saved');
-        setSaveIndicator('saved');
-        updateLastSavedLabel();
+        acknowledgeTimelineRevision(data.revision);
+        if (saveRequest.composesPreviewLater && !data.unchanged) {
+            scheduleFramePreviewRefresh();
+        }
+        finishFrameSave(snapshot.generation);
         return true;
     } catch (error) {
         console.error('Ошибка сохранения кадра', error);
+        // уже принятые пачки отправятся повторно — плитки на сервере просто перезапишутся
+        restoreDirtyTiles(pendingTiles);
         let errorText = 'Не удалось сохранить кадр.';
         if (error instanceof Error && error.message) {
             errorText = error.message;
@@ -3884,6 +5624,8 @@ function handlePointerDown(event) {
 
     if (event.button !== 0) return;
     if (isTransformingSelection) return;
+    // заливка или палочка ещё считают маску по этому слою
+    if (isFillPending) return;
     if (isSpacePressed) {
         startPan(event);
         return;
@@ -3935,14 +5677,7 @@ function handlePointerDown(event) {
     }
 
     if (currentTool === TOOL_FILL) {
-        beginLayerHistory(getToolHistoryLabel(TOOL_FILL));
-        const didFill = floodFill(x, y);
-        if (didFill) {
-            markUnsavedChanges();
-            commitLayerHistory();
-        } else {
-            cancelPendingHistory();
-        }
+        runFillTool(x, y);
         return;
     }
 
@@ -3999,7 +5734,7 @@ function handlePointerMove(event) {
         updateSelectionTransformHover(event, x, y);
         return;
     }
-    continueDrawing(x, y);
+    continueDrawing(x, y, event);
 }
 
 function handlePointerUp(event) {
@@ -4077,6 +5812,8 @@ function handlePointerLeave() {
 
 function handleWindowPointerMove(event) {
     if (!isDrawing && !isSelecting && !isPanning && !isTransformingSelection) return;
+    // над холстом событие уже обработал его собственный обработчик
+    if (event.target === canvas) return;
     handlePointerMove(event);
 }
 
@@ -4164,8 +5901,14 @@ function pasteExternalImage(image, options = {}) {
         bufferCtx.restore();
     }
 
-    renderScene();
-    markUnsavedChanges();
+    const pasteRect = {
+        x: pasteX,
+        y: pasteY,
+        width: drawWidth,
+        height: drawHeight,
+    };
+    renderLayer(activeLayer, pasteRect);
+    markLayerDirty(activeLayer, pasteRect);
 
     const shouldSelectPasted = options.selectPasted !== false;
     if (shouldSelectPasted && !selection) {
@@ -4283,20 +6026,22 @@ function handleKeyUp(event) {
 }
 
 /**
- * Навешиваем обработчики мыши на canvas
+ * Навешиваем обработчики указателя на canvas: pointer events, а не mouse —
+ * только у них есть слитые и прогнозные отсчёты, и так же работают перо и касание
  */
 function bindCanvasEvents() {
     if (!canvas) return;
 
-    canvas.addEventListener('mousedown', handlePointerDown);
-    canvas.addEventListener('mousemove', handlePointerMove);
-    canvas.addEventListener('mouseup', handlePointerUp);
-    canvas.addEventListener('mouseleave', handlePointerLeave);
+    canvas.addEventListener('pointerdown', handlePointerDown);
+    canvas.addEventListener('pointermove', handlePointerMove);
+    canvas.addEventListener('pointerup', handlePointerUp);
+    canvas.addEventListener('pointerleave', handlePointerLeave);
     canvas.addEventListener('dblclick', handleCanvasDoubleClick);
     canvas.addEventListener('wheel', handleWheel, { passive: false });
 
-    window.addEventListener('mouseup', handlePointerUp);
-    window.addEventListener('mousemove', handleWindowPointerMove);
+    window.addEventListener('pointerup', handlePointerUp);
+    window.addEventListener('pointercancel', handlePointerUp);
+    window.addEventListener('pointermove', handleWindowPointerMove);
     window.addEventListener('keydown', handleKeyDown);
     window.addEventListener('keyup', handleKeyUp);
     document.addEventListener('paste', handlePaste);
@@ -4349,6 +6094,12 @@ function bindToolbarEvents() {
             }
         });
     }
+
+    if (fillAntialiasInput) {
+        fillAntialiasInput.addEventListener('change', (event) => {
+            fillAntialias = event.target.checked;
+        });
+    }
 }
 
 // =======================
@@ -4389,6 +6140,7 @@ function bindLayerEvents() {
                 layer.visible = updated.visible;
                 applyLayerStyles(layer);
                 renderLayerList();
+                markUnsavedChanges();
                 commitFullHistory();
             } else {
                 cancelPendingHistory();
@@ -4468,6 +6220,7 @@ function bindLayerEvents() {
         if (updated) {
             layer.opacity = updated.opacity;
             applyLayerStyles(layer);
+            markUnsavedChanges();
             commitFullHistory();
         } else {
             cancelPendingHistory();
@@ -4644,9 +6397,11 @@ async function initEditor() {
     }
 
     syncCanvasSizes();
-    await loadLayers();
     bindTimelineEvents();
-    await loadTimelineFrames();
+    if (!await loadProjectBundle()) {
+        await loadLayers();
+        await loadTimelineFrames();
+    }
     syncEditorLayout();
     fillBackgroundLayerIfNeeded();
 
@@ -4665,6 +6420,7 @@ async function initEditor() {
     hydrateSavedFrame();
     startLastSavedTicker();
     window.addEventListener('resize', syncEditorLayout);
+    prefetchNeighbourFrames();
 }
 
 // Запускаем после загрузки скрипта
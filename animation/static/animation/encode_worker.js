@@ -0,0 +1,97 @@
+/**
+ * Воркер сохранения кадра: хэш пикселей слоёв, PNG плиток и сведённый PNG кадра
+ * считаются на OffscreenCanvas, а не в основном потоке, — автосохранение
+ * не останавливает рисование. Слои приходят переданными (transfer) ImageBitmap.
+ *
+ * Запрос: { id, type, ...данные }; ответ: { id, result } или { id, error }.
+ */
+
+function bytesToHex(buffer) {
+    return Array.from(new Uint8Array(buffer), (byte) => byte.toString(16).padStart(2, '0')).join('');
+}
+
+function closeBitmaps(bitmaps) {
+    bitmaps.forEach((bitmap) => {
+        if (bitmap) bitmap.close();
+    });
+}
+
+/**
+ * Тот же хэш, что computeFrameContentHash в editor.js: SHA-256 от строки
+ * «мета слоя|хэш пикселей слоя|…» — иначе сравнение с сохранённым хэшем сломается.
+ */
+async function hashLayers({ layers }) {
+    const parts = [];
+    let canvas = null;
+    let ctx = null;
+    for (const layer of layers) {
+        parts.push(layer.meta);
+        const { bitmap } = layer;
+        if (!bitmap) continue;
+        if (!canvas) {
+            canvas = new OffscreenCanvas(bitmap.width, bitmap.height);
+            ctx = canvas.getContext('2d', { willReadFrequently: true });
+        }
+        if (canvas.width !== bitmap.width || canvas.height !== bitmap.height) {
+            canvas.width = bitmap.width;
+            canvas.height = bitmap.height;
+        }
+        ctx.clearRect(0, 0, canvas.width, canvas.height);
+        ctx.drawImage(bitmap, 0, 0);
+        bitmap.close();
+        const pixels = ctx.getImageData(0, 0, canvas.width, canvas.height).data;
+        parts.push(bytesToHex(await crypto.subtle.digest('SHA-256', pixels)));
+    }
+    const digest = await crypto.subtle.digest('SHA-256', new TextEncoder().encode(parts.join('|')));
+    return bytesToHex(digest);
+}
+
+function bitmapToPng(bitmap) {
+    const canvas = new OffscreenCanvas(bitmap.width, bitmap.height);
+    canvas.getContext('2d').drawImage(bitmap, 0, 0);
+    bitmap.close();
+    return canvas.convertToBlob({ type: 'image/png' });
+}
+
+/**
+ * PNG каждой плитки: [{ name, bitmap }] -> [{ name, blob }].
+ */
+async function encodeTiles({ tiles }) {
+    return Promise.all(tiles.map(async ({ name, bitmap }) => ({ name, blob: await bitmapToPng(bitmap) })));
+}
+
+/**
+ * Сводит видимые слои (снизу вверх, с прозрачностью) в один PNG кадра.
+ */
+async function flattenLayers({ width, height, layers }) {
+    const canvas = new OffscreenCanvas(width, height);
+    const ctx = canvas.getContext('2d');
+    layers.forEach(({ bitmap, opacity }) => {
+        ctx.globalAlpha = opacity;
+        ctx.drawImage(bitmap, 0, 0);
+        bitmap.close();
+    });
+    ctx.globalAlpha = 1;
+    return canvas.convertToBlob({ type: 'image/png' });
+}
+
+const handlers = {
+    hash: hashLayers,
+    tiles: encodeTiles,
+    flatten: flattenLayers,
+};
+
+self.onmessage = async (event) => {
+    const { id, type, ...payload } = event.data || {};
+    const handler = handlers[type];
+    try {
+        if (!handler) {
+            throw new Error(`Неизвестная операция воркера: ${type}`);
+        }
+        self.postMessage({ id, result: await handler(payload) });
+    } catch (error) {
+        // переданные битмапы принадлежат воркеру — освобождаем их и при ошибке
+        closeBitmaps((payload.layers || payload.tiles || []).map((item) => item.bitmap));
+        self.postMessage({ id, error: error && error.message ? error.message : String(error) });
+    }
+};
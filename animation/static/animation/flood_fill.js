@@ -0,0 +1,185 @@
+/**
+ * Заливка и волшебная палочка: построчная (scanline) заливка по типизированным
+ * массивам. Результат — маска покрытия 0..255 размером со слой и её границы.
+ *
+ * Файл подключается двумя способами: обычным <script> перед editor.js (тогда
+ * computeFillMask вызывается в основном потоке, если воркеры недоступны)
+ * и как Web Worker — тогда пиксели слоя приходят переданным ImageBitmap.
+ */
+
+// за сколько единиц расстояния цвета сверх допуска покрытие края падает до нуля
+const FILL_ANTIALIAS_SOFTNESS = 96;
+
+/**
+ * pixels — RGBA слоя (Uint8ClampedArray), (x, y) — точка клика.
+ * tolerance — допуск по евклидову расстоянию цвета (0 — точное совпадение);
+ * includeAlpha — сравнивать и альфу (заливка) или только RGB (палочка);
+ * clip — необязательная маска выделения (Uint8Array, ненулевое — внутри);
+ * antialias — полупрозрачное покрытие пикселей у границы, похожих на цвет старта.
+ * Возвращает { mask, bounds } или null, если залить нечего.
+ */
+function computeFillMask({ pixels, width, height, x, y, tolerance = 0, includeAlpha = true, clip = null, antialias = false }) {
+    if (x < 0 || y < 0 || x >= width || y >= height) return null;
+    if (clip && !clip[y * width + x]) return null;
+
+    const words = new Uint32Array(pixels.buffer, pixels.byteOffset, width * height);
+    const start = y * width + x;
+    const target = words[start];
+    const startOffset = start * 4;
+    const tr = pixels[startOffset];
+    const tg = pixels[startOffset + 1];
+    const tb = pixels[startOffset + 2];
+    const ta = pixels[startOffset + 3];
+    const toleranceSq = tolerance * tolerance;
+
+    function distanceSq(index) {
+        const offset = index * 4;
+        const dr = pixels[offset] - tr;
+        const dg = pixels[offset + 1] - tg;
+        const db = pixels[offset + 2] - tb;
+        const da = includeAlpha ? pixels[offset + 3] - ta : 0;
+        return dr * dr + dg * dg + db * db + da * da;
+    }
+
+    // один проход по слою: 1 — пиксель подходит и ещё не залит; дальше обход
+    // читает только этот массив. Без допуска пиксель сравнивается одним 32-битным словом
+    const count = width * height;
+    const open = new Uint8Array(count);
+    if (tolerance <= 0 && includeAlpha) {
+        for (let index = 0; index < count; index += 1) {
+            if (words[index] === target) open[index] = 1;
+        }
+    } else {
+        for (let index = 0; index < count; index += 1) {
+            if (distanceSq(index) <= toleranceSq) open[index] = 1;
+        }
+    }
+    if (clip) {
+        for (let index = 0; index < count; index += 1) {
+            if (!clip[index]) open[index] = 0;
+        }
+    }
+
+    const mask = new Uint8Array(count);
+    let stack = new Int32Array(1024);
+    let stackSize = 0;
+    function push(index) {
+        if (stackSize === stack.length) {
+            const grown = new Int32Array(stack.length * 2);
+            grown.set(stack);
+            stack = grown;
+        }
+        stack[stackSize] = index;
+        stackSize += 1;
+    }
+
+    let minX = x;
+    let maxX = x;
+    let minY = y;
+    let maxY = y;
+
+    // соседняя строка: в каждом подходящем отрезке под [left, right] — одна затравка
+    function seedRow(rowStart, left, right) {
+        let inSpan = 0;
+        for (let index = rowStart + left; index <= rowStart + right; index += 1) {
+            const isOpen = open[index];
+            if (isOpen && !inSpan) push(index);
+            inSpan = isOpen;
+        }
+    }
+
+    push(start);
+    while (stackSize > 0) {
+        stackSize -= 1;
+        const seed = stack[stackSize];
+        if (!open[seed]) continue;
+        const row = Math.floor(seed / width);
+        const rowStart = row * width;
+        let left = seed - rowStart;
+        let right = left;
+        while (left > 0 && open[rowStart + left - 1]) left -= 1;
+        while (right < width - 1 && open[rowStart + right + 1]) right += 1;
+        open.fill(0, rowStart + left, rowStart + right + 1);
+        mask.fill(255, rowStart + left, rowStart + right + 1);
+
+        if (left < minX) minX = left;
+        if (right > maxX) maxX = right;
+        if (row < minY) minY = row;
+        if (row > maxY) maxY = row;
+
+        if (row > 0) seedRow(rowStart - width, left, right);
+        if (row < height - 1) seedRow(rowStart + width, left, right);
+    }
+
+    if (antialias) {
+        // кольцо в один пиксель вокруг заливки: сглаженный край штриха
+        // получает частичное покрытие по близости к цвету старта
+        const softness = FILL_ANTIALIAS_SOFTNESS;
+        const fromX = Math.max(0, minX - 1);
+        const toX = Math.min(width - 1, maxX + 1);
+        const fromY = Math.max(0, minY - 1);
+        const toY = Math.min(height - 1, maxY + 1);
+        const edge = [];
+        for (let row = fromY; row <= toY; row += 1) {
+            for (let col = fromX; col <= toX; col += 1) {
+                const index = row * width + col;
+                if (mask[index] || (clip && !clip[index])) continue;
+                const touches = (col > 0 && mask[index - 1] === 255)
+                    || (col < width - 1 && mask[index + 1] === 255)
+                    || (row > 0 && mask[index - width] === 255)
+                    || (row < height - 1 && mask[index + width] === 255);
+                if (!touches) continue;
+                const excess = Math.sqrt(distanceSq(index)) - tolerance;
+                const coverage = Math.round(255 * Math.max(0, 1 - excess / softness) / 2);
+                if (coverage > 0) edge.push(index, coverage);
+            }
+        }
+        for (let i = 0; i < edge.length; i += 2) {
+            const index = edge[i];
+            mask[index] = edge[i + 1];
+            const col = index % width;
+            const row = (index - col) / width;
+            if (col < minX) minX = col;
+            if (col > maxX) maxX = col;
+            if (row < minY) minY = row;
+            if (row > maxY) maxY = row;
+        }
+    }
+
+    return {
+        mask,
+        bounds: { x: minX, y: minY, width: maxX - minX + 1, height: maxY - minY + 1 },
+    };
+}
+
+if (typeof WorkerGlobalScope !== 'undefined' && self instanceof WorkerGlobalScope) {
+    let readCanvas = null;
+    let readCtx = null;
+
+    const readBitmapPixels = (bitmap) => {
+        if (!readCanvas) {
+            readCanvas = new OffscreenCanvas(bitmap.width, bitmap.height);
+            readCtx = readCanvas.getContext('2d', { willReadFrequently: true });
+        }
+        if (readCanvas.width !== bitmap.width || readCanvas.height !== bitmap.height) {
+            readCanvas.width = bitmap.width;
+            readCanvas.height = bitmap.height;
+        }
+        readCtx.clearRect(0, 0, readCanvas.width, readCanvas.height);
+        readCtx.drawImage(bitmap, 0, 0);
+        bitmap.close();
+        return readCtx.getImageData(0, 0, readCanvas.width, readCanvas.height).data;
+    };
+
+    self.onmessage = (event) => {
+        const { id, bitmap, ...options } = event.data || {};
+        try {
+            const pixels = options.pixels || readBitmapPixels(bitmap);
+            const result = computeFillMask({ ...options, pixels });
+            self.postMessage({ id, result }, result ? [result.mask.buffer] : []);
+        } catch (error) {
+            if (bitmap) bitmap.close();
+            self.postMessage({ id, error: error && error.message ? error.message : String(error) });
+        }
+    };
+}
@@ -1,3 +1,1378 @@
-from django.test import TestCase
+import hashlib
+import importlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.core.exceptions import FieldError, ImproperlyConfigured
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from .blobs import release_blobs, retain_blobs, set_frame_preview, store_blob
+from .encoders import (
+    SPRITE_SHEET_ATLAS,
+    SPRITE_SHEET_IMAGE,
+    SPRITE_SHEET_MAX_FRAMES,
+    ApngWriter,
+    ExportError,
+    GifWriter,
+    Mp4Writer,
+    SpriteSheetWriter,
+    WebpWriter,
+    render_frame,
+)
+from .exports import available_export_formats, export_project, ffmpeg_binary
+from .fields import (
+    FORMAT_RAW,
+    FORMAT_ZLIB,
+    FORMAT_ZSTD,
+    compress_text,
+    decompress_text,
+    preferred_format,
+    stored_format,
+    zstandard,
+)
+from .media_gc import collect_media_garbage
+from .models import (
+    FRAME_POSITION_STEP,
+    AnimationProject,
+    Blob,
+    Frame,
+    FrameContent,
+    FrameTombstone,
+    Job,
+    Layer,
+    LayerTile,
+)
+from .thumbnails import thumbnail_path
+from .views import MAX_FRAME_CONTENT_BYTES, MAX_PREVIEW_IMAGE_BYTES
+
+TEST_MEDIA_ROOT = tempfile.mkdtemp()
+
+# Сколько SQL-запросов может сделать один вызов эндпоинта, включая два запроса
+# на сессию и пользователя. Проект в тесте — FRAMES_COUNT кадров по LAYERS_PER_FRAME
+# слоёв, поэтому N+1 по кадрам или слоям сразу выходит за бюджет.
+API_QUERY_BUDGETS = {
+    'frames_list': 4,
+    'frames_list_since': 6,
+    'frames_list_not_modified': 3,
+    'project_bundle': 5,
+    'project_bundle_not_modified': 3,
+    'frame_detail': 5,
+    'frame_detail_not_modified': 3,
+    'frame_layers': 4,
+    'frame_layers_not_modified': 3,
+    'frame_layers_create': 9,
+    'frame_create': 12,
+    'frame_delete': 17,
+    'frame_reorder': 13,
+    'frames_range_duplicate': 17,
+    'frames_range_delete': 18,
+    'frames_range_move': 12,
+    'project_save': 15,
+    'frame_save': 18,
+    'layers_save': 15,
+    'layer_update': 8,
+    'layer_reorder': 9,
+    'layer_delete': 13,
+    'layer_raster': 4,
+    'project_export': 4,
+    'project_jobs': 4,
+    'job_detail': 3,
+    'job_cancel': 6,
+    'blob_file': 3,
+    'blob_file_not_modified': 3,
+}
+
+FRAMES_COUNT = 12
+LAYERS_PER_FRAME = 3
+
+WRITE_SQL_PREFIXES = ('INSERT', 'UPDATE', 'DELETE')
+
+
+def make_png(color=(255, 0, 0, 255), size=(8, 6)):
+    buffer = io.BytesIO()
+    Image.new('RGBA', size, color).save(buffer, format='PNG')
+    buffer.seek(0)
+    buffer.name = 'image.png'
+    return buffer
+
+
+def create_frames(project, count, start=1):
+    """count кадров проекта с шагом FRAME_POSITION_STEP, у каждого — один слой."""
+    frames = Frame.objects.bulk_create([
+        Frame(project=project, position=rank * FRAME_POSITION_STEP)
+        for rank in range(start, start + count)
+    ])
+    Layer.objects.bulk_create([Layer(frame=frame, order=1, name='Фон') for frame in frames])
+    return frames
+
+
+@override_settings(MEDIA_ROOT=TEST_MEDIA_ROOT)
+class MediaTestCase(TestCase):
+    """Файлы тестов пишутся во временный MEDIA_ROOT, который удаляется после класса."""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEST_MEDIA_ROOT, ignore_errors=True)
+
+    def post_json(self, url, payload):
+        return self.client.post(url, json.dumps(payload), content_type='application/json')
+
+
+class UploadLimitTests(MediaTestCase):
+    """Файл больше лимита в multipart-сохранении отклоняется с 413, а не разбирается как пустой запрос."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('uploads', password='uploads')
+        self.client.force_login(self.user)
+        self.project = AnimationProject.objects.create(owner=self.user, title='uploads', width=8, height=6)
+        self.frame = Frame.objects.create(project=self.project, position=FRAME_POSITION_STEP)
+        self.layer = Layer.objects.create(frame=self.frame, order=1, name='Фон')
+
+    def oversized_file(self):
+        buffer = io.BytesIO(b'\0' * (MAX_PREVIEW_IMAGE_BYTES + 1))
+        buffer.name = 'image.png'
+        return buffer
+
+    def test_frame_save_rejects_oversized_image(self):
+        # тестовый клиент не проверяет CSRF, так что тело до view никто не разбирает
+        url = reverse('animation:frame_save', args=[self.project.pk, 1])
+        response = self.client.post(url, {'image': self.oversized_file()})
+        self.assertEqual(response.status_code, 413)
+        self.frame.refresh_from_db()
+        self.assertIsNone(self.frame.preview_blob_id)
+
+    def test_layers_save_rejects_oversized_raster(self):
+        url = reverse('animation:layers_save', args=[self.project.pk, 1])
+        response = self.client.post(url, {f'layer_{self.layer.pk}': self.oversized_file()})
+        self.assertEqual(response.status_code, 413)
+        self.layer.refresh_from_db()
+        self.assertFalse(self.layer.raster)
+
+
+@override_settings(ANIMATION_JOB_WORKER=True)
+class LayerRasterTests(MediaTestCase):
+    """Плитки и превью кадра собирает задача frame_rasters; GET layer_raster только читает."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('rasters', password='rasters')
+        self.client.force_login(self.user)
+        self.project = AnimationProject.objects.create(owner=self.user, title='rasters', width=300, height=10)
+        self.frame = Frame.objects.create(project=self.project, position=FRAME_POSITION_STEP)
+        self.layer = Layer.objects.create(frame=self.frame, order=1, name='Фон')
+
+    def get_raster(self):
+        url = reverse('animation:layer_raster', args=[self.layer.pk])
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        writes = [
+            query['sql'] for query in captured.captured_queries
+            if query['sql'].lstrip().upper().startswith(('INSERT', 'UPDATE', 'DELETE'))
+        ]
+        self.assertEqual(writes, [])
+        body = response.content if not response.streaming else b''.join(response.streaming_content)
+        return Image.open(io.BytesIO(body)).convert('RGBA')
+
+    def test_tiles_are_compacted_by_job(self):
+        url = reverse('animation:layers_save', args=[self.project.pk, 1])
+        tile = make_png((0, 255, 0, 255), (44, 10))
+        response = self.client.post(url, {f'tile_{self.layer.pk}_1_0': tile})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Job.objects.filter(kind='frame_rasters').count(), 1)
+
+        image = self.get_raster()
+        self.assertEqual(image.size, (300, 10))
+        self.assertEqual(image.getpixel((10, 5)), (0, 0, 0, 0))
+        self.assertEqual(image.getpixel((280, 5)), (0, 255, 0, 255))
+        self.assertEqual(LayerTile.objects.filter(layer=self.layer).count(), 1)
+
+        # превью сводит задача, а не запрос сохранения
+        self.frame.refresh_from_db()
+        self.assertIsNone(self.frame.preview_blob_id)
+        revision = self.frame.revision
+
+        call_command('run_jobs', once=True, stdout=io.StringIO())
+        self.assertEqual(Job.objects.get(kind='frame_rasters').status, Job.STATUS_SUCCEEDED)
+        self.layer.refresh_from_db()
+        self.assertTrue(self.layer.raster)
+        self.assertFalse(LayerTile.objects.filter(layer=self.layer).exists())
+        self.assertEqual(self.get_raster().getpixel((280, 5)), (0, 255, 0, 255))
+        self.frame.refresh_from_db()
+        self.assertIsNotNone(self.frame.preview_blob_id)
+        self.assertGreater(self.frame.revision, revision)
+        with self.frame.preview_blob.file.open('rb') as preview_file:
+            preview = Image.open(preview_file).convert('RGBA')
+        self.assertEqual(preview.getpixel((280, 5)), (0, 255, 0, 255))
+
+    @override_settings(ANIMATION_JOB_WORKER=False)
+    def test_save_without_worker_composes_frame(self):
+        url = reverse('animation:layers_save', args=[self.project.pk, 1])
+        tile = make_png((0, 255, 0, 255), (44, 10))
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {f'tile_{self.layer.pk}_1_0': tile})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Job.objects.filter(kind='frame_rasters').exists())
+        self.assertFalse(LayerTile.objects.filter(layer=self.layer).exists())
+        self.frame.refresh_from_db()
+        with self.frame.preview_blob.file.open('rb') as preview_file:
+            preview = Image.open(preview_file).convert('RGBA')
+        self.assertEqual(preview.getpixel((280, 5)), (0, 255, 0, 255))
+
+    def test_intermediate_batch_does_not_schedule_job(self):
+        url = reverse('animation:layers_save', args=[self.project.pk, 1])
+        tile = make_png((0, 0, 255, 255), (256, 10))
+        self.client.post(url, {f'tile_{self.layer.pk}_0_0': tile, 'compose_preview': '0'})
+        self.assertFalse(Job.objects.filter(kind='frame_rasters').exists())
+
+    def test_save_batches_share_one_job(self):
+        url = reverse('animation:layers_save', args=[self.project.pk, 1])
+        for col in (0, 1):
+            tile = make_png((255, 0, 0, 255), (256 if col == 0 else 44, 10))
+            self.client.post(url, {f'tile_{self.layer.pk}_{col}_0': tile})
+        self.assertEqual(Job.objects.filter(kind='frame_rasters').count(), 1)
+
+
+class ProjectSaveTests(MediaTestCase):
+    """project_save: кадры сохраняются одной транзакцией — все или ни одного."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('save', password='save')
+        self.client.force_login(self.user)
+        self.project = AnimationProject.objects.create(owner=self.user, title='save', width=8, height=6)
+        self.frames = create_frames(self.project, 2)
+        FrameContent.objects.bulk_create([
+            FrameContent(frame=frame, content_json=json.dumps({'old': frame.pk})) for frame in self.frames
+        ])
+        self.url = reverse('animation:project_save', args=[self.project.pk])
+
+    def contents(self):
+        contents = FrameContent.objects.filter(frame__project=self.project).order_by('frame__position')
+        return [content.content_json for content in contents]
+
+    def test_saves_existing_and_appends_new_frames(self):
+        response = self.post_json(self.url, {'frames': [
+            {'index': 2, 'content': {'strokes': [1]}},
+            {'index': 3, 'content': '{"strokes": [2]}'},
+            {'index': 7, 'content': {'strokes': [3]}},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        # кадры за концом проекта дописываются подряд, без пропусков
+        self.assertEqual(response.json()['saved_frames'], [2, 3, 4])
+        self.assertEqual(
+            [json.loads(content) for content in self.contents()],
+            [{'old': self.frames[0].pk}, {'strokes': [1]}, {'strokes': [2]}, {'strokes': [3]}],
+        )
+        # у кадров, дописанных в конец, сразу есть фон
+        self.assertFalse(Frame.objects.filter(project=self.project, layers__isnull=True).exists())
+
+    def test_invalid_frame_rejects_whole_save(self):
+        before = self.contents()
+        for invalid, error in (
+            ({'index': 'abc', 'content': {}}, 'invalid_index'),
+            ({'index': 0, 'content': {}}, 'invalid_index'),
+            ({'index': 1}, 'no_content'),
+            ({'index': 1, 'content': '{"strokes": ['}, 'invalid_content'),
+            ({'index': 1, 'content': {'data': 'x' * MAX_FRAME_CONTENT_BYTES}}, 'content_too_large'),
+            ('frame', 'invalid_frame'),
+        ):
+            with self.subTest(error):
+                response = self.post_json(self.url, {'frames': [{'index': 2, 'content': {'new': True}}, invalid]})
+                self.assertEqual(response.status_code, 400)
+                payload = response.json()
+                self.assertEqual(payload['error'], 'invalid_frames')
+                self.assertEqual([(item['position'], item['error']) for item in payload['errors']], [(1, error)])
+                # верный кадр из того же запроса тоже не сохранён
+                self.assertEqual(self.contents(), before)
+        self.assertEqual(Frame.objects.filter(project=self.project).count(), 2)
+
+    def test_invalid_body(self):
+        response = self.client.post(self.url, '{"frames": [', content_type='application/json')
+        self.assertEqual(response.json()['error'], 'invalid_json')
+        self.assertEqual(self.post_json(self.url, {'frames': []}).json()['error'], 'no_frames')
+
+
+class FrameIndexTests(MediaTestCase):
+    """Номер кадра выводится из position: with_index(), index_of() и перенос кадра."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('index', password='index')
+        self.client.force_login(self.user)
+        self.project = AnimationProject.objects.create(owner=self.user, title='index', width=8, height=6)
+        self.frames = create_frames(self.project, 4)
+
+    def test_index_is_never_queried_silently(self):
+        frame = Frame.objects.get(pk=self.frames[2].pk)
+        with self.assertNumQueries(0):
+            with self.assertRaises(FieldError):
+                frame.index
+        self.assertIn(f'#{frame.pk}', str(frame))
+
+        self.assertEqual(Frame.objects.index_of(frame), 3)
+        indexed = self.project.frames.with_index()
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                [(item.pk, item.index) for item in indexed],
+                [(item.pk, number) for number, item in enumerate(self.frames, start=1)],
+            )
+
+    def test_reorder(self):
+        url = reverse('animation:frame_reorder', args=[self.project.pk])
+        response = self.post_json(url, {'frame_id': self.frames[3].pk, 'target_index': 2})
+        payload = response.json()
+        self.assertEqual((payload['from_index'], payload['to_index'], payload['frame']['index']), (4, 2, 2))
+        order = list(self.project.frames.order_by('position').values_list('pk', flat=True))
+        self.assertEqual(order, [self.frames[0].pk, self.frames[3].pk, self.frames[1].pk, self.frames[2].pk])
+        # номер за концом проекта — последний кадр
+        payload = self.post_json(url, {'frame_id': self.frames[0].pk, 'target_index': 99}).json()
+        self.assertEqual((payload['from_index'], payload['to_index']), (1, 4))
+
+
+class FrameRangeTests(MediaTestCase):
+    """Дублирование, перенос и удаление диапазонов кадров: порядок и перебалансировка position."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('ranges', password='ranges')
+        self.client.force_login(self.user)
+        self.project = AnimationProject.objects.create(owner=self.user, title='ranges', width=8, height=6)
+        self.frames = create_frames(self.project, 5)
+        self.ids = [frame.pk for frame in self.frames]
+
+    def post_range(self, name, payload):
+        url = reverse(f'animation:{name}', args=[self.project.pk])
+        return self.client.post(url, json.dumps(payload), content_type='application/json')
+
+    def order(self):
+        return list(self.project.frames.order_by('position').values_list('pk', flat=True))
+
+    def assert_positions_unique(self):
+        positions = list(self.project.frames.order_by('position').values_list('position', flat=True))
+        self.assertEqual(len(positions), len(set(positions)))
+
+    def test_duplicate_inserts_copies_after_range(self):
+        response = self.post_range('frames_range_duplicate', {'start': 2, 'end': 3})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        copies = [frame['id'] for frame in data['frames']]
+        self.assertEqual([frame['index'] for frame in data['frames']], [4, 5])
+        self.assertEqual(data['total'], 7)
+        self.assertEqual(self.order(), self.ids[:3] + copies + self.ids[3:])
+        self.assertEqual(Layer.objects.filter(frame_id__in=copies).count(), 2)
+
+    def test_duplicate_to_start(self):
+        response = self.post_range('frames_range_duplicate', {'start': 4, 'end': 5, 'target': 1})
+        copies = [frame['id'] for frame in response.json()['frames']]
+        self.assertEqual(self.order(), copies + self.ids)
+
+    def test_move_range(self):
+        response = self.post_range('frames_range_move', {'start': 1, 'end': 2, 'target': 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([frame['index'] for frame in response.json()['frames']], [3, 4])
+        ids = self.ids
+        self.assertEqual(self.order(), [ids[2], ids[3], ids[0], ids[1], ids[4]])
+
+        self.post_range('frames_range_move', {'start': 4, 'end': 5, 'target': 1})
+        self.assertEqual(self.order(), [ids[1], ids[4], ids[2], ids[3], ids[0]])
+
+    def test_move_rejects_target_outside_project(self):
+        response = self.post_range('frames_range_move', {'start': 1, 'end': 2, 'target': 5})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], 'invalid_target')
+        self.assertEqual(self.order(), self.ids)
+
+    def test_delete_range(self):
+        response = self.post_range('frames_range_delete', {'start': 2, 'end': 4})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['deleted_ids'], self.ids[1:4])
+        self.assertEqual(self.order(), [self.ids[0], self.ids[4]])
+
+    def test_delete_everything_keeps_one_frame(self):
+        response = self.post_range('frames_range_delete', {'start': 1, 'end': 5})
+        data = response.json()
+        self.assertEqual(data['total'], 1)
+        self.assertEqual(self.order(), [data['frame']['id']])
+        self.assertTrue(Layer.objects.filter(frame_id=data['frame']['id']).exists())
+
+    def test_invalid_range(self):
+        for payload in ({'start': 0, 'end': 2}, {'start': 3, 'end': 2}, {'start': 4, 'end': 9}):
+            response = self.post_range('frames_range_duplicate', payload)
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.order(), self.ids)
+
+    def test_rebalance_when_no_gap_left(self):
+        # соседние ключи подряд: между кадрами 2 и 3 нет свободного position
+        for rank, frame in enumerate(self.frames, start=1):
+            Frame.objects.filter(pk=frame.pk).update(position=rank)
+        revision = AnimationProject.objects.get(pk=self.project.pk).revision
+
+        response = self.post_range('frames_range_duplicate', {'start': 1, 'end': 2, 'target': 3})
+        self.assertEqual(response.status_code, 200)
+        copies = [frame['id'] for frame in response.json()['frames']]
+        self.assertEqual(self.order(), self.ids[:2] + copies + self.ids[2:])
+        self.assert_positions_unique()
+        # перебалансировка меняет position всех кадров — все они попадают в ленту
+        self.assertFalse(self.project.frames.filter(revision__lte=revision).exists())
+
+        response = self.post_range('frames_range_move', {'start': 6, 'end': 7, 'target': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.order(), self.ids[3:] + self.ids[:2] + copies + self.ids[2:3])
+        self.assert_positions_unique()
+
+
+class BlobRefcountTests(MediaTestCase):
+    """Счётчик ссылок блобов превью: общие байты — один блоб, ссылки считаются по кадрам."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('blobs', password='blobs')
+        self.client.force_login(self.user)
+        self.project = AnimationProject.objects.create(owner=self.user, title='blobs', width=8, height=6)
+        self.frames = create_frames(self.project, 3)
+        self.red = make_png((255, 0, 0, 255)).getvalue()
+        self.blue = make_png((0, 0, 255, 255)).getvalue()
+
+    def refcount(self, blob):
+        return Blob.objects.get(pk=blob.pk).refcount
+
+    def set_preview(self, frame, data):
+        changed = set_frame_preview(frame, data)
+        frame.save()
+        return changed
+
+    def test_same_bytes_share_blob(self):
+        first = store_blob(self.red)
+        second = store_blob(self.red)
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(Blob.objects.count(), 1)
+        self.assertEqual(self.refcount(first), 0)
+
+    def test_retain_and_release(self):
+        red = store_blob(self.red)
+        blue = store_blob(self.blue)
+        retain_blobs([red.pk, red.pk, blue.pk, None])
+        self.assertEqual((self.refcount(red), self.refcount(blue)), (2, 1))
+        release_blobs([red.pk, blue.pk])
+        self.assertEqual((self.refcount(red), self.refcount(blue)), (1, 0))
+        # снять больше ссылок, чем есть, нельзя: счётчик не уходит в минус
+        release_blobs([blue.pk])
+        release_blobs([red.pk, red.pk])
+        self.assertEqual((self.refcount(red), self.refcount(blue)), (1, 0))
+
+    def test_frame_previews(self):
+        first, second, _ = self.frames
+        self.assertTrue(self.set_preview(first, self.red))
+        self.assertTrue(self.set_preview(second, self.red))
+        red = first.preview_blob
+        self.assertEqual(second.preview_blob_id, red.pk)
+        self.assertEqual(self.refcount(red), 2)
+
+        # те же байты — превью не меняется и ссылка не прибавляется
+        self.assertFalse(self.set_preview(first, self.red))
+        self.assertEqual(self.refcount(red), 2)
+
+        self.assertTrue(self.set_preview(second, self.blue))
+        self.assertEqual(self.refcount(red), 1)
+        self.assertEqual(self.refcount(second.preview_blob), 1)
+
+    def test_duplicate_and_delete(self):
+        self.set_preview(self.frames[0], self.red)
+        red = self.frames[0].preview_blob
+        url = reverse('animation:frames_range_duplicate', args=[self.project.pk])
+        self.client.post(url, json.dumps({'start': 1, 'end': 1}), content_type='application/json')
+        self.assertEqual(self.refcount(red), 2)
+
+        self.client.post(reverse('animation:frame_delete', args=[self.project.pk, 1]))
+        self.assertEqual(self.refcount(red), 1)
+        url = reverse('animation:frames_range_delete', args=[self.project.pk])
+        self.client.post(url, json.dumps({'start': 1, 'end': 1}), content_type='application/json')
+        self.assertEqual(self.refcount(red), 0)
+        # файл блоба удаляет сборка мусора, а не удаление кадра
+        self.assertTrue(default_storage.exists(red.file.name))
+
+    def test_failed_save_keeps_refcounts(self):
+        self.set_preview(self.frames[0], self.red)
+        red = self.frames[0].preview_blob
+        url = reverse('animation:frame_save', args=[self.project.pk, 1])
+        with mock.patch('animation.views.record_frame_changes', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.client.post(url, {'image': make_png((0, 0, 255, 255))})
+        # замена превью откатилась вместе с кадром
+        self.assertEqual(Frame.objects.get(pk=self.frames[0].pk).preview_blob_id, red.pk)
+        self.assertEqual(self.refcount(red), 1)
+        self.assertFalse(Blob.objects.filter(refcount__gt=0).exclude(pk=red.pk).exists())
+
+    def test_blob_removed_by_gc_before_retain(self):
+        stale = store_blob(self.red)
+
+        def collected_store_blob(data, extension='png'):
+            # сборщик удаляет блоб без ссылок сразу после того, как его нашёл store_blob
+            blob = store_blob(data, extension)
+            if blob.pk == stale.pk:
+                Blob.objects.filter(pk=blob.pk, refcount=0).delete()
+            return blob
+
+        with mock.patch('animation.blobs.store_blob', side_effect=collected_store_blob):
+            self.assertTrue(self.set_preview(self.frames[0], self.red))
+        blob = Frame.objects.get(pk=self.frames[0].pk).preview_blob
+        self.assertNotEqual(blob.pk, stale.pk)
+        self.assertEqual((blob.sha256, blob.refcount), (stale.sha256, 1))
+
+
+class ConditionalSaveTests(MediaTestCase):
+    """Сохранение с If-None-Match: тот же хэш содержимого — 412 без записи в базу."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('conditional', password='conditional')
+        self.client.force_login(self.user)
+        self.project = AnimationProject.objects.create(owner=self.user, title='conditional', width=8, height=6)
+        self.frame, = create_frames(self.project, 1)
+        self.layer = self.frame.layers.get()
+
+    def save_layers(self, content_hash, **fields):
+        url = reverse('animation:layers_save', args=[self.project.pk, 1])
+        payload = {f'layer_{self.layer.pk}': make_png(), **fields}
+        return self.client.post(url, payload, HTTP_IF_NONE_MATCH=f'"{content_hash}"')
+
+    def test_unchanged_hash_returns_412(self):
+        content_hash = 'a' * 64
+        self.assertEqual(self.save_layers(content_hash).status_code, 200)
+        self.frame.refresh_from_db()
+        self.assertEqual(self.frame.content_hash, content_hash)
+        raster_version = Layer.objects.get(pk=self.layer.pk).raster_version
+
+        with CaptureQueriesContext(connection) as captured:
+            response = self.save_layers(content_hash)
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(response.json()['error'], 'unchanged')
+        self.assertEqual(response.json()['frame']['id'], self.frame.pk)
+        writes = [
+            query['sql'] for query in captured.captured_queries
+            if query['sql'].lstrip().upper().startswith(WRITE_SQL_PREFIXES)
+        ]
+        self.assertEqual(writes, [])
+        self.assertEqual(Layer.objects.get(pk=self.layer.pk).raster_version, raster_version)
+
+        # другое содержимое сохраняется как обычно
+        self.assertEqual(self.save_layers('b' * 64).status_code, 200)
+
+    def test_frame_save_unchanged_hash(self):
+        url = reverse('animation:frame_save', args=[self.project.pk, 1])
+        content_hash = 'c' * 64
+        response = self.client.post(url, {'image': make_png()}, HTTP_IF_NONE_MATCH=f'"{content_hash}"')
+        self.assertEqual(response.status_code, 200)
+        response = self.client.post(url, {'image': make_png()}, HTTP_IF_NONE_MATCH=f'W/"{content_hash}"')
+        self.assertEqual(response.status_code, 412)
+
+    def test_intermediate_batch_resets_hash(self):
+        content_hash = 'd' * 64
+        self.save_layers(content_hash)
+        # промежуточная пачка: кадр сохранён не целиком, хэш больше ничего не гарантирует
+        self.assertEqual(self.save_layers('e' * 64, compose_preview='0').status_code, 200)
+        self.frame.refresh_from_db()
+        self.assertEqual(self.frame.content_hash, '')
+        self.assertEqual(self.save_layers(content_hash).status_code, 200)
+
+    def test_unchanged_hash_is_checked_before_upload(self):
+        content_hash = '9' * 64
+        self.save_layers(content_hash)
+        # тело не разбирается: даже файл больше лимита получает 412, а не 413
+        oversized = io.BytesIO(b'\0' * (MAX_PREVIEW_IMAGE_BYTES + 1))
+        oversized.name = 'image.png'
+        url = reverse('animation:layers_save', args=[self.project.pk, 1])
+        response = self.client.post(
+            url, {f'layer_{self.layer.pk}': oversized}, HTTP_IF_NONE_MATCH=f'"{content_hash}"',
+        )
+        self.assertEqual(response.status_code, 412)
+
+    def test_invalid_hash_is_ignored(self):
+        self.save_layers('f' * 64)
+        url = reverse('animation:layers_save', args=[self.project.pk, 1])
+        response = self.client.post(url, {f'layer_{self.layer.pk}': make_png()}, HTTP_IF_NONE_MATCH='"not-a-hash"')
+        self.assertEqual(response.status_code, 200)
+
+
+class FramesFeedTests(MediaTestCase):
+    """Лента frames_list?since=: изменённые кадры и надгробия удалённых."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('feed', password='feed')
+        self.client.force_login(self.user)
+        self.project = AnimationProject.objects.create(owner=self.user, title='feed', width=8, height=6)
+        self.frames = create_frames(self.project, 4)
+
+    def url(self, name, *args):
+        return reverse(f'animation:{name}', args=[self.project.pk, *args])
+
+    def feed(self, since=None):
+        url = self.url('frames_list')
+        if since is not None:
+            url += f'?since={since}'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_changes_since_revision(self):
+        full = self.feed()
+        self.assertTrue(full['full'])
+        self.assertEqual([frame['id'] for frame in full['frames']], [frame.pk for frame in self.frames])
+        revision = full['revision']
+
+        unchanged = self.feed(revision)
+        self.assertFalse(unchanged['full'])
+        self.assertEqual(unchanged['frames'], [])
+        self.assertEqual(unchanged['deleted_ids'], [])
+        self.assertEqual(unchanged['total'], 4)
+
+        self.client.post(self.url('frame_save', 3), {'image': make_png()})
+        changes = self.feed(revision)
+        self.assertEqual([frame['id'] for frame in changes['frames']], [self.frames[2].pk])
+        self.assertGreater(changes['revision'], revision)
+
+    def test_deleted_frames_leave_tombstones(self):
+        revision = self.feed()['revision']
+        self.client.post(self.url('frame_delete', 2))
+        self.client.post(
+            self.url('frames_range_delete'), json.dumps({'start': 2, 'end': 3}), content_type='application/json',
+        )
+        deleted = [self.frames[1].pk, self.frames[2].pk, self.frames[3].pk]
+        self.assertEqual(
+            sorted(FrameTombstone.objects.filter(project=self.project).values_list('frame_id', flat=True)),
+            deleted,
+        )
+
+        changes = self.feed(revision)
+        self.assertEqual(sorted(changes['deleted_ids']), deleted)
+        self.assertEqual(changes['frames'], [])
+        self.assertEqual(changes['total'], 1)
+
+        # надгробия старше ревизии клиента в ленту не попадают
+        self.assertEqual(self.feed(changes['revision'])['deleted_ids'], [])
+
+    def test_since_from_future_returns_full_list(self):
+        revision = self.feed()['revision']
+        response = self.feed(revision + 100)
+        self.assertTrue(response['full'])
+        self.assertEqual(len(response['frames']), 4)
+
+    def test_pruned_tombstones_force_full_list(self):
+        revision = self.feed()['revision']
+        self.client.post(self.url('frame_delete', 4))
+        after_delete = self.feed(revision)['revision']
+        self.client.post(self.url('frame_delete', 1))
+        # первое удаление — старше срока хранения, второе — свежее
+        FrameTombstone.objects.filter(frame_id=self.frames[3].pk).update(
+            created_at=timezone.now() - timedelta(days=60),
+        )
+
+        report = collect_media_garbage(tombstone_retention=timedelta(days=30))
+        self.assertEqual(report['tombstones'], 1)
+        self.assertEqual(
+            list(FrameTombstone.objects.filter(project=self.project).values_list('frame_id', flat=True)),
+            [self.frames[0].pk],
+        )
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.tombstones_pruned_revision, after_delete)
+
+        # клиент не видел удалённого надгробия — только полный список
+        stale = self.feed(revision)
+        self.assertTrue(stale['full'])
+        self.assertEqual([frame['id'] for frame in stale['frames']], [self.frames[1].pk, self.frames[2].pk])
+
+        # а видевшему его хватает оставшихся надгробий
+        recent = self.feed(after_delete)
+        self.assertFalse(recent['full'])
+        self.assertEqual(recent['deleted_ids'], [self.frames[0].pk])
+
+    def test_invalid_since(self):
+        for since in ('abc', '-1'):
+            response = self.client.get(self.url('frames_list') + f'?since={since}')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()['error'], 'invalid_since')
+
+
+class ApiQueryBudgetTests(MediaTestCase):
+    """Число запросов каждого API-эндпоинта не должно расти с размером проекта."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('budget', password='budget')
+        self.client.force_login(self.user)
+        self.project = AnimationProject.objects.create(owner=self.user, title='budget', width=8, height=6)
+        frames = Frame.objects.bulk_create([
+            Frame(project=self.project, position=rank * FRAME_POSITION_STEP)
+            for rank in range(1, FRAMES_COUNT + 1)
+        ])
+        Layer.objects.bulk_create([
+            Layer(frame=frame, order=order, name=f'Слой {order}')
+            for frame in frames
+            for order in range(1, LAYERS_PER_FRAME + 1)
+        ])
+        # у кадров есть превью: выборка блоба на каждый кадр при сериализации вышла бы за бюджет
+        preview = make_png(size=(160, 120)).getvalue()
+        for frame in frames:
+            set_frame_preview(frame, preview)
+        Frame.objects.bulk_update(frames, ['preview_image', 'preview_blob'])
+        self.frames = frames
+
+    def url(self, name, *args):
+        return reverse(f'animation:{name}', args=[self.project.pk, *args])
+
+    def assert_budget(self, name, call, expected_status=200):
+        budget = API_QUERY_BUDGETS[name]
+        with CaptureQueriesContext(connection) as captured:
+            response = call()
+        self.assertEqual(response.status_code, expected_status, name)
+        queries = [query['sql'] for query in captured.captured_queries]
+        self.assertLessEqual(
+            len(queries),
+            budget,
+            f'{name}: {len(queries)} запросов при бюджете {budget}:\n' + '\n'.join(queries),
+        )
+        return response, queries
+
+    def assert_read_only(self, name, queries):
+        writes = [sql for sql in queries if sql.lstrip().upper().startswith(WRITE_SQL_PREFIXES)]
+        self.assertEqual(writes, [], f'{name} пишет в базу при чтении')
+
+    def test_read_endpoints(self):
+        for name, url in (
+            ('frames_list', self.url('frames_list')),
+            ('frame_detail', self.url('frame_detail', 3)),
+            ('frame_layers', self.url('frame_layers', 3)),
+        ):
+            response, queries = self.assert_budget(name, lambda: self.client.get(url))
+            self.assert_read_only(name, queries)
+            _, queries = self.assert_budget(
+                f'{name}_not_modified',
+                lambda: self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']),
+                expected_status=304,
+            )
+            self.assert_read_only(name, queries)
+
+        _, queries = self.assert_budget(
+            'frames_list_since',
+            lambda: self.client.get(self.url('frames_list'), {'since': 0}),
+        )
+        self.assert_read_only('frames_list_since', queries)
+
+    def test_project_bundle(self):
+        url = self.url('project_bundle')
+
+        def fetch(**headers):
+            # запросы потокового ответа идут при чтении тела — читаем внутри замера
+            response = self.client.get(url, **headers)
+            if response.streaming:
+                b''.join(response.streaming_content)
+            return response
+
+        response, queries = self.assert_budget('project_bundle', fetch)
+        self.assert_read_only('project_bundle', queries)
+        self.assert_budget(
+            'project_bundle_not_modified',
+            lambda: fetch(HTTP_IF_NONE_MATCH=response['ETag']),
+            expected_status=304,
+        )
+
+    def test_frame_endpoints(self):
+        self.assert_budget('frame_create', lambda: self.post_json(self.url('frame_create'), {}))
+        self.assert_budget(
+            'frame_reorder',
+            lambda: self.post_json(self.url('frame_reorder'), {'frame_id': self.frames[-1].pk, 'target_index': 2}),
+        )
+        self.assert_budget('frame_delete', lambda: self.post_json(self.url('frame_delete', 4), {}))
+        self.assert_budget(
+            'frames_range_duplicate',
+            lambda: self.post_json(self.url('frames_range_duplicate'), {'start': 2, 'end': 6}),
+        )
+        self.assert_budget(
+            'frames_range_move',
+            lambda: self.post_json(self.url('frames_range_move'), {'start': 2, 'end': 6, 'target': 8}),
+        )
+        self.assert_budget(
+            'frames_range_delete',
+            lambda: self.post_json(self.url('frames_range_delete'), {'start': 3, 'end': 7}),
+        )
+        frames = [{'index': index, 'content': {'strokes': []}} for index in range(1, FRAMES_COUNT + 3)]
+        self.assert_budget(
+            'project_save',
+            lambda: self.post_json(reverse('animation:project_save', args=[self.project.pk]), {'frames': frames}),
+        )
+
+    def test_save_endpoints(self):
+        self.assert_budget('frame_save', lambda: self.client.post(self.url('frame_save', 2), {'image': make_png()}))
+        layers = list(self.frames[1].layers.all())
+        payload = {f'layer_{layer.pk}': make_png() for layer in layers}
+        self.assert_budget('layers_save', lambda: self.client.post(self.url('layers_save', 2), payload))
+        self.assert_budget(
+            'layer_raster',
+            lambda: self.client.get(reverse('animation:layer_raster', args=[layers[0].pk])),
+        )
+
+    def test_layer_endpoints(self):
+        layers = list(self.frames[2].layers.all())
+        self.assert_budget('frame_layers_create', lambda: self.post_json(self.url('frame_layers', 3), {}))
+        self.assert_budget(
+            'layer_update',
+            lambda: self.post_json(self.url('layer_update', 3, layers[0].pk), {'visible': False, 'opacity': 40}),
+        )
+        self.assert_budget(
+            'layer_reorder',
+            lambda: self.post_json(
+                self.url('layer_reorder', 3),
+                {'ordered_ids': [layer.pk for layer in reversed(layers)]},
+            ),
+        )
+        self.assert_budget('layer_delete', lambda: self.post_json(self.url('layer_delete', 3, layers[0].pk), {}))
+
+    @override_settings(ANIMATION_EXPORT_WORKERS=1)
+    def test_job_endpoints(self):
+        response, _ = self.assert_budget(
+            'project_export',
+            lambda: self.post_json(self.url('project_export'), {'format': 'gif', 'width': 16}),
+            expected_status=202,
+        )
+        job_id = response.json()['job']['id']
+        self.assert_budget('project_jobs', lambda: self.client.get(self.url('project_jobs')))
+        call_command('run_jobs', once=True, stdout=io.StringIO())
+        self.assert_budget('job_detail', lambda: self.client.get(reverse('animation:job_detail', args=[job_id])))
+
+        queued = self.post_json(self.url('project_export'), {'format': 'webp'}).json()['job']
+        self.assert_budget(
+            'job_cancel',
+            lambda: self.post_json(reverse('animation:job_cancel', args=[queued['id']]), {}),
+        )
+
+    def test_preview_files(self):
+        url = self.client.get(self.url('frames_list')).json()['frames'][0]['preview_url']
+        response, _ = self.assert_budget('blob_file', lambda: self.client.get(url))
+        self.assert_budget(
+            'blob_file_not_modified',
+            lambda: self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']),
+            expected_status=304,
+        )
+
+
+class CompressedTextFieldTests(TestCase):
+    """Сжатие content_json: форматы raw/zlib/zstd и чтение через модель."""
+
+    text = json.dumps({'strokes': [{'points': list(range(200)), 'color': '#ff0000'}] * 5})
+
+    def test_zlib_round_trip(self):
+        packed = compress_text(self.text, FORMAT_ZLIB)
+        self.assertEqual(stored_format(packed), FORMAT_ZLIB)
+        self.assertLess(len(packed), len(self.text))
+        self.assertEqual(decompress_text(packed), self.text)
+        self.assertEqual(decompress_text(memoryview(packed)), self.text)
+
+    def test_zstd_round_trip(self):
+        if zstandard is None:
+            with self.assertRaises(ImproperlyConfigured):
+                compress_text(self.text, FORMAT_ZSTD)
+            return
+        packed = compress_text(self.text, FORMAT_ZSTD)
+        self.assertEqual(stored_format(packed), FORMAT_ZSTD)
+        self.assertEqual(decompress_text(packed), self.text)
+
+    def test_short_and_legacy_values(self):
+        self.assertEqual(compress_text(''), b'')
+        self.assertEqual(decompress_text(b''), '')
+        short = compress_text('{"a": 1}')
+        self.assertEqual(stored_format(short), FORMAT_RAW)
+        self.assertEqual(decompress_text(short), '{"a": 1}')
+        # текст, записанный до сжатия, читается как есть
+        self.assertEqual(decompress_text('{"legacy": true}'), '{"legacy": true}')
+        self.assertIsNone(decompress_text(None))
+        with self.assertRaises(ValueError):
+            decompress_text(bytes([99]) + b'data')
+
+    def test_model_round_trip(self):
+        user = User.objects.create_user('compressed', password='compressed')
+        project = AnimationProject.objects.create(owner=user, title='compressed', width=8, height=6)
+        frame, = create_frames(project, 1)
+        FrameContent.objects.create(frame=frame, content_json=self.text)
+
+        raw = self.stored_bytes(frame)
+        self.assertEqual(stored_format(raw), preferred_format())
+        self.assertLess(len(raw), len(self.text))
+        self.assertEqual(FrameContent.objects.get(frame=frame).content_json, self.text)
+        # пустая строка хранится пустыми байтами, поэтому фильтр по '' работает
+        FrameContent.objects.filter(frame=frame).update(content_json='')
+        self.assertTrue(FrameContent.objects.filter(frame=frame, content_json='').exists())
+
+    def stored_bytes(self, frame):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT content_json FROM animation_framecontent WHERE frame_id = %s', [frame.pk])
+            return bytes(cursor.fetchone()[0])
+
+    def test_recompress_command(self):
+        user = User.objects.create_user('recompress', password='recompress')
+        project = AnimationProject.objects.create(owner=user, title='recompress', width=8, height=6)
+        frame, = create_frames(project, 1)
+        FrameContent.objects.create(frame=frame, content_json='')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'UPDATE animation_framecontent SET content_json = %s WHERE frame_id = %s',
+                [compress_text(self.text, FORMAT_RAW), frame.pk],
+            )
+        self.assertEqual(stored_format(self.stored_bytes(frame)), FORMAT_RAW)
+
+        call_command('compress_frame_contents', dry_run=True, stdout=io.StringIO())
+        self.assertEqual(stored_format(self.stored_bytes(frame)), FORMAT_RAW)
+
+        call_command('compress_frame_contents', stdout=io.StringIO())
+        self.assertEqual(stored_format(self.stored_bytes(frame)), preferred_format())
+        self.assertEqual(FrameContent.objects.get(frame=frame).content_json, self.text)
+
+
+class ExportTests(MediaTestCase):
+    """Писатели экспорта и export_project: кадры, размер и длительности читаются обратно Pillow."""
+
+    colors = [(255, 0, 0, 255), (0, 255, 0, 255), (0, 0, 255, 255)]
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def write(self, writer_class, size=(8, 6), **options):
+        path = os.path.join(self.directory, 'export')
+        writer = writer_class(path, size, 12, len(self.colors), **options)
+        for color in self.colors:
+            writer.add_frame(render_frame(make_png(color, size).getvalue(), size, writer.frame_format))
+        writer.close()
+        return path
+
+    def read_animation(self, path):
+        """(формат, размер, [(длительность в мс, цвет пикселя (0, 0))] по кадрам)."""
+        with Image.open(path) as image:
+            frames = []
+            for index in range(image.n_frames):
+                image.seek(index)
+                image.load()
+                frames.append((round(image.info['duration']), image.convert('RGBA').getpixel((0, 0))))
+            return image.format, image.size, frames
+
+    def create_project(self):
+        user = User.objects.create_user('export', password='export')
+        project = AnimationProject.objects.create(owner=user, title='export', width=8, height=6, fps=12)
+        frames = create_frames(project, len(self.colors))
+        for frame, color in zip(frames, self.colors):
+            set_frame_preview(frame, make_png(color).getvalue())
+        Frame.objects.bulk_update(frames, ['preview_image', 'preview_blob'])
+        return user, project
+
+    def test_apng_writer(self):
+        # у APNG задержка — точная дробь 1/12 с
+        self.assertEqual(
+            self.read_animation(self.write(ApngWriter)),
+            ('PNG', (8, 6), [(83, color) for color in self.colors]),
+        )
+
+    def test_webp_writer(self):
+        # миллисекунды округляются по накопленному времени: за 3 кадра ровно 250 мс
+        self.assertEqual(
+            self.read_animation(self.write(WebpWriter)),
+            ('WEBP', (8, 6), list(zip([83, 84, 83], self.colors))),
+        )
+
+    def test_gif_writer(self):
+        self.assertEqual(
+            self.read_animation(self.write(GifWriter)),
+            ('GIF', (8, 6), list(zip([80, 90, 80], self.colors))),
+        )
+
+    def test_sprite_sheet_writer(self):
+        with zipfile.ZipFile(self.write(SpriteSheetWriter)) as archive:
+            self.assertEqual(sorted(archive.namelist()), sorted([SPRITE_SHEET_IMAGE, SPRITE_SHEET_ATLAS]))
+            atlas = json.loads(archive.read(SPRITE_SHEET_ATLAS))
+            with Image.open(io.BytesIO(archive.read(SPRITE_SHEET_IMAGE))) as sheet:
+                sheet = sheet.convert('RGBA')
+
+        # три кадра — сетка 2×2, последняя ячейка пустая
+        self.assertEqual(sheet.size, (16, 12))
+        self.assertEqual(atlas['meta']['size'], {'w': 16, 'h': 12})
+        self.assertEqual((atlas['meta']['columns'], atlas['meta']['rows']), (2, 2))
+        self.assertEqual(list(atlas['frames']), ['frame_0001', 'frame_0002', 'frame_0003'])
+        self.assertEqual([item['duration'] for item in atlas['frames'].values()], [83, 84, 83])
+        for item, color in zip(atlas['frames'].values(), self.colors):
+            rect = item['frame']
+            self.assertEqual((rect['w'], rect['h']), (8, 6))
+            self.assertEqual(sheet.getpixel((rect['x'], rect['y'])), color)
+        self.assertEqual(sheet.getpixel((8, 6)), (0, 0, 0, 0))
+
+    def test_sprite_sheet_limits(self):
+        path = os.path.join(self.directory, 'sprites.zip')
+        with self.assertRaises(ExportError):
+            SpriteSheetWriter(path, (8, 6), 12, SPRITE_SHEET_MAX_FRAMES + 1)
+        # 16 кадров 4096×4096 — лист 16384×16384, больше лимита площади
+        with self.assertRaises(ExportError):
+            SpriteSheetWriter(path, (4096, 4096), 12, 16)
+        self.assertFalse(os.path.exists(path))
+
+    @skipUnless(ffmpeg_binary(), 'нужен ffmpeg')
+    def test_mp4_writer(self):
+        # нечётные стороны добиваются до чётных внутри ffmpeg
+        path = self.write(Mp4Writer, size=(9, 7), ffmpeg=ffmpeg_binary())
+        with open(path, 'rb') as video:
+            self.assertEqual(video.read(12)[4:8], b'ftyp')
+
+    @skipUnless(ffmpeg_binary(), 'нужен ffmpeg')
+    def test_mp4_writer_reports_ffmpeg_errors(self):
+        path = os.path.join(self.directory, 'missing', 'export.mp4')
+        writer = Mp4Writer(path, (8, 6), 12, 1, ffmpeg=ffmpeg_binary())
+        writer.add_frame(render_frame(None, (8, 6), writer.frame_format))
+        with self.assertRaises(ExportError):
+            writer.close()
+
+    def test_mp4_requires_ffmpeg(self):
+        _, project = self.create_project()
+        with override_settings(FFMPEG_BINARY='/nonexistent/ffmpeg'):
+            self.assertNotIn('mp4', available_export_formats())
+            with self.assertRaises(ExportError):
+                export_project(project, 'mp4', os.path.join(self.directory, 'export.mp4'))
+
+    def test_export_project_formats(self):
+        _, project = self.create_project()
+        for export_format in available_export_formats():
+            with self.subTest(export_format):
+                path = os.path.join(self.directory, f'export-{export_format}')
+                self.assertEqual(export_project(project, export_format, path, width=16, workers=1), 3)
+                if export_format == 'sprites':
+                    with zipfile.ZipFile(path) as archive:
+                        atlas = json.loads(archive.read(SPRITE_SHEET_ATLAS))
+                    self.assertEqual(len(atlas['frames']), 3)
+                    self.assertEqual(atlas['meta']['size'], {'w': 32, 'h': 24})
+                elif export_format == 'mp4':
+                    self.assertGreater(os.path.getsize(path), 0)
+                else:
+                    _, size, frames = self.read_animation(path)
+                    self.assertEqual(size, (16, 12))
+                    self.assertEqual([color for _, color in frames], self.colors)
+
+    @override_settings(ANIMATION_EXPORT_WORKERS=1)
+    def test_export_job(self):
+        user, project = self.create_project()
+        self.client.force_login(user)
+        response = self.post_json(
+            reverse('animation:project_export', args=[project.pk]), {'format': 'gif', 'width': 16},
+        )
+        self.assertEqual(response.status_code, 202)
+        call_command('run_jobs', once=True, stdout=io.StringIO())
+
+        job = Job.objects.get(pk=response.json()['job']['id'])
+        self.assertEqual(job.status, Job.STATUS_SUCCEEDED, job.error)
+        self.assertEqual((job.result['format'], job.result['frames']), ('gif', 3))
+        with default_storage.open(job.result['file'], 'rb') as export_file:
+            self.assertEqual(len(export_file.read()), job.result['size'])
+            export_file.seek(0)
+            _, size, frames = self.read_animation(export_file)
+        self.assertEqual((size, len(frames)), ((16, 12), 3))
+
+
+@override_settings(ANIMATION_EXPORT_WORKERS=1)
+class JobQueueTests(MediaTestCase):
+    """Задачи через API: постановка, выполнение run_jobs, прогресс и отмена."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('jobs', password='jobs')
+        self.client.force_login(self.user)
+        self.project = AnimationProject.objects.create(owner=self.user, title='jobs', width=8, height=6)
+        create_frames(self.project, 3)
+
+    def url(self, name, *args):
+        return reverse(f'animation:{name}', args=[self.project.pk, *args])
+
+    def start_export(self, export_format='gif'):
+        response = self.post_json(self.url('project_export'), {'format': export_format})
+        self.assertEqual(response.status_code, 202)
+        return response.json()['job']
+
+    def get_job(self, job_id):
+        return self.client.get(reverse('animation:job_detail', args=[job_id])).json()['job']
+
+    def test_job_runs_with_progress(self):
+        job = self.start_export()
+        self.assertEqual(job['status'], Job.STATUS_QUEUED)
+        self.assertEqual([item['id'] for item in self.client.get(self.url('project_jobs')).json()['jobs']], [job['id']])
+
+        call_command('run_jobs', once=True, stdout=io.StringIO())
+        job = self.get_job(job['id'])
+        self.assertEqual(job['status'], Job.STATUS_SUCCEEDED, job['error'])
+        self.assertEqual(job['progress'], {'done': 3, 'total': 3})
+        self.assertTrue(job['download_url'])
+
+    def test_cancel(self):
+        queued = self.start_export()
+        response = self.post_json(reverse('animation:job_cancel', args=[queued['id']]), {})
+        self.assertEqual(response.json()['job']['status'], Job.STATUS_CANCELLED)
+        # отменённую задачу воркер не берёт
+        call_command('run_jobs', once=True, stdout=io.StringIO())
+        self.assertEqual(self.get_job(queued['id'])['status'], Job.STATUS_CANCELLED)
+
+        # готовую задачу отменить нельзя
+        finished = self.start_export()
+        call_command('run_jobs', once=True, stdout=io.StringIO())
+        response = self.post_json(reverse('animation:job_cancel', args=[finished['id']]), {})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['error'], 'job_finished')
+        self.assertEqual(self.get_job(finished['id'])['status'], Job.STATUS_SUCCEEDED)
+
+    def test_unknown_format(self):
+        response = self.post_json(self.url('project_export'), {'format': 'bmp'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Job.objects.exists())
+
+    def test_other_users_job_is_hidden(self):
+        job = self.start_export()
+        other = User.objects.create_user('other-jobs', password='other')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(reverse('animation:job_detail', args=[job['id']])).status_code, 404)
+        self.assertEqual(self.post_json(reverse('animation:job_cancel', args=[job['id']]), {}).status_code, 404)
+
+
+class ThumbnailTests(MediaTestCase):
+    """Миниатюры превью: задача thumbnails пишет их и публикует в ленте кадров."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('thumbs', password='thumbs')
+        self.client.force_login(self.user)
+        self.project = AnimationProject.objects.create(owner=self.user, title='thumbs', width=320, height=240)
+        self.frames = create_frames(self.project, 2)
+        preview = make_png(size=(320, 240)).getvalue()
+        for frame in self.frames:
+            set_frame_preview(frame, preview)
+        Frame.objects.bulk_update(self.frames, ['preview_image', 'preview_blob'])
+        self.blob = self.frames[0].preview_blob
+
+    def url(self, name, *args):
+        return reverse(f'animation:{name}', args=[self.project.pk, *args])
+
+    def test_thumbnails_job(self):
+        response = self.client.get(self.url('frames_list'))
+        revision = response.json()['revision']
+        self.assertEqual(response.json()['frames'][0]['thumbnails'], [])
+
+        # сохранение нового превью поставило задачу миниатюр; её выполняет run_jobs
+        self.assertTrue(Job.objects.filter(kind='thumbnails', params__blob_ids=[self.blob.pk]).exists())
+        call_command('run_jobs', once=True, stdout=io.StringIO())
+        self.blob.refresh_from_db()
+        # миниатюры крупнее самого превью не делаются
+        self.assertEqual(self.blob.thumbnail_sizes, [128, 256])
+        with default_storage.open(thumbnail_path(self.blob.sha256, 128)) as thumbnail_file:
+            with Image.open(thumbnail_file) as image:
+                self.assertEqual((image.format, image.size), ('WEBP', (128, 96)))
+
+        response = self.client.get(self.url('frames_list'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        thumbnails = response.json()['frames'][0]['thumbnails']
+        self.assertEqual([item['size'] for item in thumbnails], [128, 256])
+        self.assertEqual(self.client.get(thumbnails[0]['url']).status_code, 200)
+
+        # оба кадра с этим превью приходят в ленте изменений уже с миниатюрами
+        changes = self.client.get(self.url('frames_list'), {'since': revision}).json()
+        self.assertEqual(sorted(frame['id'] for frame in changes['frames']), [frame.pk for frame in self.frames])
+
+
+class BlobFileTests(MediaTestCase):
+    """Превью по адресу с хэшем: immutable-кэш, диапазоны, X-Accel-Redirect и доступ только владельцу."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('blobs', password='blobs')
+        self.client.force_login(self.user)
+        self.project = AnimationProject.objects.create(owner=self.user, title='blobs', width=8, height=6)
+        create_frames(self.project, 1)
+        response = self.client.post(
+            reverse('animation:frame_save', args=[self.project.pk, 1]), {'image': make_png(size=(320, 240))},
+        )
+        self.blob = Frame.objects.get(project=self.project).preview_blob
+        self.url = reverse('animation:blob_file', args=[self.blob.sha256, 'png'])
+        self.assertEqual(response.json()['frame']['preview_url'], self.url)
+
+    def test_preview_url_in_frames_list(self):
+        frame = self.client.get(reverse('animation:frames_list', args=[self.project.pk])).json()['frames'][0]
+        self.assertEqual(frame['preview_url'], self.url)
+
+    def test_immutable_cache_and_ranges(self):
+        response = self.client.get(self.url)
+        body = b''.join(response.streaming_content)
+        self.assertEqual(len(body), self.blob.size)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['ETag'], f'"{self.blob.sha256}"')
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), body[:10])
+        self.assertEqual(response['Content-Range'], f'bytes 0-9/{self.blob.size}')
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), body[-5:])
+        response = self.client.get(self.url, HTTP_RANGE=f'bytes={self.blob.size}-')
+        self.assertEqual(response.status_code, 416)
+        # If-Range со старым ETag: диапазон игнорируется, файл целиком
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_x_accel_redirect(self):
+        with override_settings(ANIMATION_MEDIA_SENDFILE='x-accel-redirect'):
+            response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected-media/{self.blob.file.name}')
+        self.assertEqual(response['Content-Type'], 'image/png')
+
+    def test_files_are_served_to_owner_only(self):
+        call_command('run_jobs', once=True, stdout=io.StringIO())
+        self.blob.refresh_from_db()
+        thumbnail_url = reverse('animation:thumbnail_file', args=[self.blob.sha256, self.blob.thumbnail_sizes[0]])
+        self.assertEqual(self.client.get(thumbnail_url).status_code, 200)
+
+        other = User.objects.create_user('other-blobs', password='other')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.assertEqual(self.client.get(thumbnail_url).status_code, 404)
+
+        # то же превью в своём проекте — и файл доступен
+        project = AnimationProject.objects.create(owner=other, title='other', width=8, height=6)
+        frame = create_frames(project, 1)[0]
+        set_frame_preview(frame, make_png(size=(320, 240)).getvalue())
+        frame.save()
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_legacy_preview_is_served_after_migration(self):
+        # блобы старых превью из 0006_blob переносятся туда, откуда их отдаёт blob_file
+        data = make_png((10, 20, 30)).getvalue()
+        digest = hashlib.sha256(data).hexdigest()
+        legacy_name = default_storage.save('frames/legacy.png', ContentFile(data))
+        blob = Blob.objects.create(sha256=digest, file=legacy_name, size=len(data), refcount=1)
+        frame = Frame.objects.create(
+            project=self.project, position=2 * FRAME_POSITION_STEP, preview_blob=blob, preview_image=legacy_name,
+        )
+        url = reverse('animation:blob_file', args=[digest, 'png'])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        migration = importlib.import_module('animation.migrations.0014_move_legacy_blob_files')
+        migration.move_legacy_blob_files(apps, None)
+
+        blob.refresh_from_db()
+        frame.refresh_from_db()
+        self.assertTrue(blob.file.name.startswith('blobs/'))
+        self.assertEqual(frame.preview_image.name, blob.file.name)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), data)
+
+
+class MediaGarbageCollectorTests(MediaTestCase):
+    """gc_media: файлы без ссылок и блобы без кадров удаляются, свежие и нужные остаются."""
+
+    def setUp(self):
+        user = User.objects.create_user('gc', password='gc')
+        project = AnimationProject.objects.create(owner=user, title='gc', width=8, height=6)
+        self.frame = create_frames(project, 1)[0]
+        set_frame_preview(self.frame, make_png().getvalue())
+        self.frame.save()
+
+    def test_collect_media_garbage(self):
+        def age(name):
+            stamp = time.time() - 2 * 3600
+            os.utime(default_storage.path(name), (stamp, stamp))
+
+        kept = self.frame.preview_blob
+        age(kept.file.name)
+        unused = store_blob(make_png(color=(1, 2, 3, 255)).getvalue())
+        Blob.objects.filter(pk=unused.pk).update(created_at=timezone.now() - timedelta(hours=2))
+        age(unused.file.name)
+        orphan = default_storage.save('layers/orphan.png', ContentFile(b'x' * 100))
+        age(orphan)
+        # свежий файл без ссылки может оказаться ещё не закоммиченной загрузкой
+        fresh = default_storage.save('tiles/fresh.png', ContentFile(b'y' * 10))
+
+        report = collect_media_garbage(dry_run=True)
+        self.assertEqual(report['blob_rows'], 1)
+        self.assertEqual(report['directories']['layers']['orphaned'], 1)
+        self.assertEqual(report['directories']['blobs']['orphaned'], 1)
+        self.assertEqual(report['directories']['tiles']['recent'], 1)
+        self.assertEqual(report['bytes'], 100 + unused.size)
+        self.assertTrue(default_storage.exists(orphan))
+        self.assertTrue(Blob.objects.filter(pk=unused.pk).exists())
+
+        call_command('gc_media', stdout=io.StringIO())
+        self.assertFalse(default_storage.exists(orphan))
+        self.assertFalse(default_storage.exists(unused.file.name))
+        self.assertFalse(Blob.objects.filter(pk=unused.pk).exists())
+        self.assertTrue(default_storage.exists(fresh))
+        self.assertTrue(default_storage.exists(kept.file.name))
+
+        call_command('gc_media', enqueue=True, every=24, stdout=io.StringIO())
+        call_command('run_jobs', once=True, stdout=io.StringIO())
+        finished = Job.objects.filter(kind='gc_media', status=Job.STATUS_SUCCEEDED).get()
+        self.assertEqual(finished.result['orphaned'], 0)
+        # следующий запуск уже стоит в очереди на завтра
+        scheduled = Job.objects.filter(kind='gc_media', status=Job.STATUS_QUEUED).get()
+        self.assertGreater(scheduled.run_after, timezone.now() + timedelta(hours=23))
+
+    def test_fix_refcounts(self):
+        blob = self.frame.preview_blob
+        Blob.objects.filter(pk=blob.pk).update(refcount=5)
+        self.assertEqual(collect_media_garbage(fix_refcounts=True)['refcounts_fixed'], 1)
+        blob.refresh_from_db()
+        self.assertEqual(blob.refcount, 1)
+        # в dry-run счётчики не трогаются
+        Blob.objects.filter(pk=blob.pk).update(refcount=0)
+        self.assertEqual(collect_media_garbage(dry_run=True, fix_refcounts=True)['refcounts_fixed'], 0)
+        self.assertTrue(Blob.objects.filter(pk=blob.pk).exists())
+
+
+class ProjectBundleTests(MediaTestCase):
+    """project_bundle: весь проект одним потоковым JSON — кадры по порядку со слоями."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('bundle', password='bundle')
+        self.client.force_login(self.user)
+        self.project = AnimationProject.objects.create(owner=self.user, title='bundle', width=8, height=6)
+        self.frames = create_frames(self.project, 3)
+        Layer.objects.create(frame=self.frames[0], order=2, name='Контур')
+        FrameContent.objects.create(frame=self.frames[1], content_json='{"layers": []}')
+        self.url = reverse('animation:project_bundle', args=[self.project.pk])
+
+    def fetch(self, **headers):
+        response = self.client.get(self.url, **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, json.loads(b''.join(response.streaming_content))
+
+    def test_bundle_payload(self):
+        _, payload = self.fetch()
+        self.assertEqual(payload['project']['id'], self.project.pk)
+        self.assertEqual([frame['id'] for frame in payload['frames']], [frame.pk for frame in self.frames])
+        self.assertEqual([frame['index'] for frame in payload['frames']], [1, 2, 3])
+        self.assertEqual([frame['has_content'] for frame in payload['frames']], [False, True, False])
+        # слои — те же, что отдаёт frame_layers
+        for index, frame in enumerate(payload['frames'], start=1):
+            layers = self.client.get(reverse('animation:frame_layers', args=[self.project.pk, index])).json()['layers']
+            self.assertEqual(frame['layers'], layers)
+        self.assertEqual([layer['name'] for layer in payload['frames'][0]['layers']], ['Фон', 'Контур'])
+
+    def test_bundle_etag_follows_changes(self):
+        response, _ = self.fetch()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.client.post(reverse('animation:frame_delete', args=[self.project.pk, 2]))
+        response, payload = self.fetch(HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual([frame['id'] for frame in payload['frames']], [self.frames[0].pk, self.frames[2].pk])
+
+    def test_other_users_project(self):
+        other = User.objects.create_user('other-bundle', password='other')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
@@ -0,0 +1,75 @@
+import io
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.urls import reverse
+from PIL import Image
+
+from .models import AnimationProject, Blob, Frame
+from .revisions import record_frame_changes
+
+# длинная сторона миниатюр: таймлайн (104x70 css px) берёт меньшую, что покрывает ячейку
+# при текущем devicePixelRatio; превью крупнее 512 px таймлайну не нужно
+THUMBNAIL_SIZES = (128, 256, 512)
+THUMBNAIL_QUALITY = 80
+
+
+def thumbnail_path(sha256, size):
+    # рядом с блобом по тому же хэшу: миниатюра одна на все кадры с этим превью
+    return f'thumbs/{sha256[:2]}/{sha256[2:4]}/{sha256}-{size}.webp'
+
+
+def thumbnail_urls(blob):
+    """[{size, url}] готовых миниатюр блоба по возрастанию размера; пусто, пока их не сделала задача."""
+    if blob is None:
+        return []
+    return [
+        {'size': size, 'url': reverse('animation:thumbnail_file', args=[blob.sha256, size])}
+        for size in sorted(blob.thumbnail_sizes or [])
+    ]
+
+
+def build_blob_thumbnails(blob):
+    """
+    Пишет миниатюры блоба всех размеров меньше самого превью и отмечает их в
+    blob.thumbnail_sizes. Каждая следующая (меньшая) считается из предыдущей.
+    Возвращает список размеров; пустой — если файла блоба нет.
+    """
+    try:
+        with blob.file.open('rb') as blob_file:
+            image = Image.open(blob_file)
+            image.load()
+    except (FileNotFoundError, OSError):
+        return []
+    image = image.convert('RGBA')
+
+    sizes = []
+    for size in sorted(THUMBNAIL_SIZES, reverse=True):
+        if max(image.size) <= size:
+            continue
+        image.thumbnail((size, size), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        buffer = io.BytesIO()
+        image.save(buffer, format='WEBP', quality=THUMBNAIL_QUALITY, method=4)
+        name = thumbnail_path(blob.sha256, size)
+        if default_storage.exists(name):
+            default_storage.delete(name)
+        default_storage.save(name, ContentFile(buffer.getvalue()))
+        sizes.append(size)
+
+    sizes.sort()
+    Blob.objects.filter(pk=blob.pk).update(thumbnail_sizes=sizes)
+    blob.thumbnail_sizes = sizes
+    return sizes
+
+
+def publish_blob_thumbnails(blob):
+    """
+    Сдвигает ревизию кадров с этим превью (revisions.record_frame_changes), чтобы
+    frames_list?since= отдал их заново — уже с миниатюрами — и ETag списка сменился.
+    """
+    projects = AnimationProject.objects.filter(frames__preview_blob=blob).distinct()
+    for project in projects:
+        with transaction.atomic():
+            frame_pks = Frame.objects.filter(project=project, preview_blob=blob).values_list('pk', flat=True)
+            record_frame_changes(project, list(frame_pks))
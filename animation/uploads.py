@@ -0,0 +1,33 @@
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+
+
+class MaxFileSizeUploadHandler(FileUploadHandler):
+    """
+    Считает байты каждого загружаемого файла прямо во время чтения тела запроса.
+
+    Ставится первым в цепочку request.upload_handlers: сам файл не собирает,
+    а передаёт куски дальше стандартным обработчикам (память / временный файл).
+    Как только файл превышает лимит, приём останавливается, а view по флагу
+    exceeded отвечает 413 — без буферизации всего тела в памяти.
+    """
+
+    def __init__(self, request=None, max_bytes=None):
+        super().__init__(request)
+        self.max_bytes = max_bytes
+        self.exceeded = False
+        self.received = 0
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.max_bytes is not None and self.received > self.max_bytes:
+            self.exceeded = True
+            # дочитываем остаток тела, чтобы клиент получил нормальный ответ, а не обрыв соединения
+            raise StopUpload(connection_reset=False)
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
@@ -1,4 +1,4 @@
-from django.urls import path
+from django.urls import path, re_path
 from . import views
 
 app_name = 'animation'
@@ -10,14 +10,26 @@ urlpatterns = [
     path('project/<int:pk>/rename/', views.project_rename, name='project_rename'),
     path('project/<int:pk>/delete/', views.project_delete, name='project_delete'),
     path('project/<int:pk>/save/', views.project_save, name='project_save'),
+    path('api/project/<int:pk>/bundle/', views.project_bundle, name='project_bundle'),
     path('api/project/<int:pk>/frames/', views.frames_list, name='frames_list'),
     path('api/project/<int:pk>/frames/create/', views.frame_create, name='frame_create'),
     path('api/project/<int:pk>/frames/reorder/', views.frame_reorder, name='frame_reorder'),
+    path('api/project/<int:pk>/frames/range/duplicate/', views.frames_range_duplicate, name='frames_range_duplicate'),
+    path('api/project/<int:pk>/frames/range/delete/', views.frames_range_delete, name='frames_range_delete'),
+    path('api/project/<int:pk>/frames/range/move/', views.frames_range_move, name='frames_range_move'),
     path('api/project/<int:pk>/frame/<int:index>/', views.frame_detail, name='frame_detail'),
     path('api/project/<int:pk>/frame/<int:index>/delete/', views.frame_delete, name='frame_delete'),
     path('api/project/<int:pk>/frame/<int:index>/save/', views.frame_save, name='frame_save'),
     path('api/project/<int:pk>/frame/<int:index>/layers/', views.frame_layers, name='frame_layers'),
     path('api/project/<int:pk>/frame/<int:index>/layers/reorder/', views.layer_reorder, name='layer_reorder'),
+    path('api/project/<int:pk>/frame/<int:index>/layers/save/', views.layers_save, name='layers_save'),
+    path('api/project/<int:pk>/export/', views.project_export, name='project_export'),
+    path('api/project/<int:pk>/jobs/', views.project_jobs, name='project_jobs'),
+    path('api/job/<int:job_id>/', views.job_detail, name='job_detail'),
+    path('api/job/<int:job_id>/cancel/', views.job_cancel, name='job_cancel'),
+    re_path(r'^files/blob/(?P<sha256>[0-9a-f]{64})\.(?P<extension>[a-z0-9]+)$', views.blob_file, name='blob_file'),
+    re_path(r'^files/thumb/(?P<sha256>[0-9a-f]{64})-(?P<size>[0-9]+)\.webp$', views.thumbnail_file, name='thumbnail_file'),
+    path('api/layer/<int:layer_id>/raster/', views.layer_raster, name='layer_raster'),
     path(
         'api/project/<int:pk>/frame/<int:index>/layers/<int:layer_id>/update/',
         views.layer_update,
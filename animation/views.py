@@ -1,19 +1,63 @@
 import base64
 import json
+import re
 from binascii import Error as BinasciiError
 
 from django.contrib import messages
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.db import transaction
-from django.db.models import Max
-from django.http import JsonResponse
+from django.db.models import Exists, F, Max, OuterRef, Prefetch
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.http import require_POST, require_http_methods
-from .models import AnimationProject, Frame, Layer
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from django.views.decorators.http import require_GET, require_POST, require_http_methods
+from .models import FRAME_POSITION_STEP, AnimationProject, Frame, FrameContent, Job, Layer, LayerTile
+from .blobs import blob_path, release_frame_previews, retain_blobs, set_frame_preview
+from .exports import ExportError, available_export_formats, export_size
+from .jobs import cancel_job, enqueue_job
+from .media import IMMUTABLE_CACHE_CONTROL, blob_url, serve_media_file
+from .rasters import (
+    RASTER_TILE_SIZE,
+    encode_png,
+    open_layer_image,
+    schedule_frame_rasters,
+    tile_grid_size,
+)
+from .revisions import next_project_revision, record_frame_changes
+from .thumbnails import THUMBNAIL_SIZES, thumbnail_path, thumbnail_urls
+from .uploads import MaxFileSizeUploadHandler
 
 MAX_PREVIEW_IMAGE_BYTES = 5 * 1024 * 1024
+# project_bundle читает кадры пачками: на пачку — запрос кадров и запрос их слоёв
+PROJECT_BUNDLE_CHUNK_SIZE = 200
+
+
+def get_file_url(file_field):
+    if not file_field:
+        return ''
+    try:
+        return file_field.url
+    except Exception:
+        return ''
+
+
+def get_preview_url(frame):
+    """Превью по адресу с хэшем содержимого (blob_file); у кадра без блоба — обычный URL файла."""
+    if frame.preview_blob_id:
+        return blob_url(frame.preview_blob)
+    return get_file_url(frame.preview_image)
+
+
+def get_layer_raster_url(layer):
+    if not layer.raster_version:
+        return ''
+    return reverse('animation:layer_raster', args=[layer.pk]) + f'?v={layer.raster_version}'
 
 
 def serialize_layer(layer):
@@ -23,35 +67,72 @@ def serialize_layer(layer):
         'name': layer.name,
         'visible': layer.visible,
         'opacity': layer.opacity,
+        'raster_url': get_layer_raster_url(layer),
     }
 
 
-def serialize_frame(frame):
-    preview_url = ''
-    if frame.preview_image:
-        try:
-            preview_url = frame.preview_image.url
-        except Exception:
-            preview_url = ''
+def serialize_frame_change(frame):
+    """
+    Кадр для ленты изменений frames_list?since=: без номера, но с position —
+    номер клиент выводит сам, расставляя кадры по position.
+    """
+    preview_url = get_preview_url(frame)
     return {
         'id': frame.pk,
-        'index': frame.index,
+        'position': frame.position,
         'preview_url': preview_url,
         'updated_at': frame.updated_at.isoformat() if frame.updated_at else '',
         'has_preview': bool(preview_url),
+        # выборки кадров для ответов берут preview_blob через select_related — без запроса на кадр
+        'thumbnails': thumbnail_urls(frame.preview_blob) if frame.preview_blob_id else [],
     }
 
 
+def serialize_frame(frame):
+    return {
+        **serialize_frame_change(frame),
+        'index': frame.index,
+    }
+
+
+def get_frame_content_json(frame):
+    """content_json кадра отдельным запросом: в строке Frame его больше нет."""
+    content_json = FrameContent.objects.filter(frame=frame).values_list('content_json', flat=True).first()
+    return content_json or ''
+
+
+def save_frame_contents(contents):
+    """
+    Записывает {frame_id: content_json} одним upsert на пачку:
+    отсутствующие строки FrameContent вставляются, существующие перезаписываются.
+    """
+    FrameContent.objects.bulk_create(
+        [FrameContent(frame_id=frame_id, content_json=content_json) for frame_id, content_json in contents.items()],
+        batch_size=FRAME_SAVE_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['frame'],
+        update_fields=['content_json'],
+    )
+
+
+def default_layer(frame):
+    return Layer(frame=frame, order=1, name='Фон', visible=True, opacity=100)
+
+
+def create_default_layers(frames):
+    """
+    Слой «Фон» для только что созданных кадров, одним INSERT.
+    Кадр без слоёв бывает только между этими двумя запросами,
+    поэтому читающие эндпоинты слои не проверяют и не создают.
+    """
+    Layer.objects.bulk_create([default_layer(frame) for frame in frames])
+
+
 def ensure_default_layer(frame):
+    """Возвращает фон кадру, у которого удалили последний слой."""
     if frame.layers.exists():
         return
-    Layer.objects.create(
-        frame=frame,
-        order=1,
-        name='Фон',
-        visible=True,
-        opacity=100,
-    )
+    default_layer(frame).save()
 
 
 def reorder_layers(frame, ordered_ids=None):
@@ -82,72 +163,201 @@ def reorder_layers(frame, ordered_ids=None):
     return ordered_layers
 
 
-def renumber_frames(project):
-    frames = list(project.frames.order_by('index', 'id'))
+def get_frame_or_404(project, index):
+    """
+    Кадр проекта по публичному номеру 1..N: номер — это ранг по position,
+    поэтому кадр берётся одним запросом с OFFSET, без хранения индекса.
+    """
+    if index < 1:
+        raise Http404('Кадр не найден.')
+    frames = list(project.frames.select_related('preview_blob').order_by('position')[index - 1:index])
     if not frames:
-        return frames
-
-    # уникальность (project, index) — чтобы не словить конфликты при смене индексов,
-    # сначала уводим индексы во временную область, затем выставляем 1..N.
-    temp_base = 1_000_000
-    temp_updates = []
-    for position, frame in enumerate(frames, start=1):
-        temp_index = temp_base + position
-        if frame.index != temp_index:
-            frame.index = temp_index
-            temp_updates.append(frame)
-    if temp_updates:
-        Frame.objects.bulk_update(temp_updates, ['index'])
-
-    final_updates = []
-    for position, frame in enumerate(frames, start=1):
-        if frame.index != position:
-            frame.index = position
-            final_updates.append(frame)
-    if final_updates:
-        Frame.objects.bulk_update(final_updates, ['index'])
-
-    # возвращаем уже в правильном порядке
-    return list(project.frames.order_by('index', 'id'))
-
-
-def reorder_frames(project, ordered_ids=None):
-    frames = list(project.frames.order_by('index', 'id'))
+        raise Http404('Кадр не найден.')
+    frame = frames[0]
+    frame.index = index
+    return frame
+
+
+def get_owned_frame_or_404(user, pk, index):
+    """
+    То же, что get_frame_or_404, но одним запросом: владелец проверяется
+    JOIN-ом по проекту, без отдельной выборки AnimationProject.
+    """
+    if index < 1:
+        raise Http404('Кадр не найден.')
+    frames = list(
+        Frame.objects.select_related('project', 'preview_blob')
+        .filter(project_id=pk, project__owner=user)
+        .order_by('position')[index - 1:index]
+    )
     if not frames:
-        return frames
-
-    if ordered_ids is None:
-        ordered_frames = frames
+        raise Http404('Кадр не найден.')
+    frame = frames[0]
+    frame.index = index
+    return frame
+
+
+def touch_frame(frame):
+    """
+    Слои кадра изменились: сдвигаем updated_at кадра и ревизию проекта,
+    чтобы сменились ETag у frame_detail, frame_layers и frames_list.
+    """
+    now = timezone.now()
+    revision = next_project_revision(frame.project)
+    Frame.objects.filter(pk=frame.pk).update(updated_at=now, revision=revision)
+    frame.updated_at = now
+
+
+def conditional_json_response(request, etag, updated_at, build_payload):
+    """
+    Условный GET: если If-None-Match / If-Modified-Since совпали с валидаторами,
+    отвечаем 304 без сериализации и тела. build_payload вызывается только при 200.
+    """
+    last_modified = int(updated_at.timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = JsonResponse(build_payload())
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # хранить можно, но перед использованием — всегда переспросить сервер
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def project_frames_etag(project, since=None):
+    suffix = '' if since is None else f'-since-{since}'
+    return f'W/"frames-{project.pk}-{project.updated_at.timestamp():.6f}{suffix}"'
+
+
+def frame_etag(kind, frame):
+    # номер входит в ETag: после переноса по тому же URL отдаётся другой кадр или номер
+    return f'W/"{kind}-{frame.pk}-{frame.index}-{frame.updated_at.timestamp():.6f}"'
+
+
+def next_frame_position(project):
+    last_position = project.frames.aggregate(max_position=Max('position')).get('max_position')
+    return (last_position or 0) + FRAME_POSITION_STEP
+
+
+def rebalance_frame_positions(project, reserve_at=None, reserve_count=0, exclude_pks=()):
+    """
+    Заново раздаёт position кадрам проекта с шагом FRAME_POSITION_STEP.
+    Нужно редко: только когда между соседними кадрами не осталось свободного ключа.
+    reserve_at / reserve_count оставляют перед кадром с этим номером дыру
+    на reserve_count кадров; кадры exclude_pks (их сейчас переставляют) не раздаются.
+    """
+    frames = list(
+        project.frames.exclude(pk__in=exclude_pks).order_by('position').only('id', 'project_id', 'position')
+    )
+    # уникальность (project, position) — сначала уводим ключи в отрицательные, затем раздаём заново;
+    # position меняется у всех кадров, поэтому все они попадают в ленту изменений
+    project.frames.update(position=-F('position'), revision=next_project_revision(project))
+    for rank, frame in enumerate(frames, start=1):
+        slot = rank
+        if reserve_at is not None and rank >= reserve_at:
+            slot += reserve_count
+        frame.position = slot * FRAME_POSITION_STEP
+    Frame.objects.bulk_update(frames, ['position'], batch_size=FRAME_SAVE_BATCH_SIZE)
+
+
+def free_positions(project, target_index, count, exclude_pks=()):
+    """
+    count возрастающих ключей position, с которыми кадры встанут подряд, начиная
+    с номера target_index среди остальных кадров (кроме exclude_pks).
+    Возвращает None, если между соседями не хватает свободных ключей.
+    """
+    others = project.frames.order_by('position')
+    if exclude_pks:
+        others = others.exclude(pk__in=exclude_pks)
+    target_index = max(1, target_index)
+    neighbours = list(others.values_list('position', flat=True)[max(0, target_index - 2):target_index])
+    if target_index == 1:
+        before, after = None, (neighbours[0] if neighbours else None)
     else:
-        id_to_frame = {frame.pk: frame for frame in frames}
-        ordered_frames = []
-        for frame_id in ordered_ids:
-            frame = id_to_frame.get(frame_id)
-            if frame is not None:
-                ordered_frames.append(frame)
-        for frame in frames:
-            if frame not in ordered_frames:
-                ordered_frames.append(frame)
-
-    temp_base = 1_000_000
-    temp_updates = []
-    for position, frame in enumerate(ordered_frames, start=1):
-        temp_index = temp_base + position
-        if frame.index != temp_index:
-            frame.index = temp_index
-            temp_updates.append(frame)
-    if temp_updates:
-        Frame.objects.bulk_update(temp_updates, ['index'])
-
-    final_updates = []
-    for position, frame in enumerate(ordered_frames, start=1):
-        if frame.index != position:
-            frame.index = position
-            final_updates.append(frame)
-    if final_updates:
-        Frame.objects.bulk_update(final_updates, ['index'])
-
-    return list(project.frames.order_by('index', 'id'))
+        before = neighbours[0] if neighbours else None
+        after = neighbours[1] if len(neighbours) > 1 else None
+
+    if after is None:
+        # в конец (номер больше числа кадров тоже означает конец)
+        if before is None:
+            before = others.aggregate(max_position=Max('position')).get('max_position') or 0
+        return [before + FRAME_POSITION_STEP * step for step in range(1, count + 1)]
+    if before is None:
+        before = 0
+    gap = (after - before) // (count + 1)
+    if gap < 1:
+        return None
+    return [before + gap * step for step in range(1, count + 1)]
+
+
+def allocate_positions(project, target_index, count, exclude_pks=()):
+    """free_positions, а если места нет — перебалансировка с дырой нужного размера."""
+    positions = free_positions(project, target_index, count, exclude_pks)
+    if positions is None:
+        rebalance_frame_positions(project, reserve_at=target_index, reserve_count=count, exclude_pks=exclude_pks)
+        positions = free_positions(project, target_index, count, exclude_pks)
+    return positions
+
+
+def place_frames_at(project, frames, target_index):
+    """
+    Переносит кадры (подряд, в порядке списка) на номера начиная с target_index.
+    Меняются только их строки, кроме редкой перебалансировки.
+    """
+    positions = allocate_positions(project, target_index, len(frames), [frame.pk for frame in frames])
+    for frame, position in zip(frames, positions):
+        frame.position = position
+    Frame.objects.bulk_update(frames, ['position'])
+
+
+def duplicate_frames(project, sources, positions):
+    """
+    Копирует кадры sources на ключи positions. Кадры, содержимое, слои и плитки
+    создаются по одному bulk_create на таблицу; файлы превью и растров не копируются:
+    копия ссылается на тот же блоб превью (refcount +1) и те же PNG слоёв.
+    """
+    new_frames = Frame.objects.bulk_create([
+        Frame(
+            project=project,
+            position=position,
+            preview_image=source.preview_image.name if source.preview_image else None,
+            preview_blob=source.preview_blob,
+            content_hash=source.content_hash,
+        ) for source, position in zip(sources, positions)
+    ])
+    retain_blobs(source.preview_blob_id for source in sources)
+    frame_map = {source.pk: new_frame.pk for source, new_frame in zip(sources, new_frames)}
+
+    FrameContent.objects.bulk_create([
+        FrameContent(frame_id=frame_map[item.frame_id], content_json=item.content_json)
+        for item in FrameContent.objects.filter(frame_id__in=list(frame_map))
+    ])
+
+    source_layers = list(Layer.objects.filter(frame_id__in=list(frame_map)).order_by('frame_id', 'order', 'id'))
+    new_layers = Layer.objects.bulk_create([
+        Layer(
+            frame_id=frame_map[item.frame_id],
+            order=item.order,
+            name=item.name,
+            visible=item.visible,
+            opacity=item.opacity,
+            raster=item.raster.name if item.raster else None,
+            raster_version=item.raster_version,
+        ) for item in source_layers
+    ])
+    layer_map = {old.pk: new.pk for old, new in zip(source_layers, new_layers)}
+    LayerTile.objects.bulk_create([
+        LayerTile(layer_id=layer_map[tile.layer_id], col=tile.col, row=tile.row, image=tile.image.name)
+        for tile in LayerTile.objects.filter(layer_id__in=list(layer_map))
+    ])
+
+    # у кадра без слоёв копия получает слой «Фон», как любой новый кадр
+    frames_with_layers = {item.frame_id for item in source_layers}
+    create_default_layers([
+        new_frame for source, new_frame in zip(sources, new_frames)
+        if source.pk not in frames_with_layers
+    ])
+    return new_frames
 
 
 @login_required
@@ -184,8 +394,8 @@ def project_create(request):
         )
 
         # сразу создаём первый пустой кадр и фон
-        frame = Frame.objects.create(project=project, index=1)
-        ensure_default_layer(frame)
+        frame = Frame.objects.create(project=project, position=FRAME_POSITION_STEP)
+        create_default_layers([frame])
 
         if is_ajax:
             return JsonResponse({
@@ -210,20 +420,23 @@ def project_create(request):
 @login_required
 def project_editor(request, pk):
     project = get_object_or_404(AnimationProject, pk=pk, owner=request.user)
-    first_frame = project.frames.order_by('index').first()
-    current_frame_index = first_frame.index if first_frame else 1
+    first_frame = project.frames.select_related('preview_blob').order_by('position').first()
+    current_frame_index = 1
     current_frame_preview_url = ''
     current_frame_updated_at = ''
     if first_frame:
-        if first_frame.preview_image:
-            current_frame_preview_url = first_frame.preview_image.url
-        if first_frame.preview_image or first_frame.content_json:
+        current_frame_preview_url = get_preview_url(first_frame)
+        has_content = bool(first_frame.preview_image) or (
+            FrameContent.objects.filter(frame=first_frame).exclude(content_json='').exists()
+        )
+        if has_content:
             current_frame_updated_at = first_frame.updated_at.isoformat()
     return render(request, 'animation/editor.html', {
         'project': project,
         'current_frame_index': current_frame_index,
         'current_frame_preview_url': current_frame_preview_url,
         'current_frame_updated_at': current_frame_updated_at,
+        'raster_tile_size': RASTER_TILE_SIZE,
     })
 
 
@@ -269,7 +482,9 @@ def project_delete(request, pk):
     project = get_object_or_404(AnimationProject, pk=pk, owner=request.user)
     is_ajax = request.headers.get('x-requested-with') == 'XMLHttpRequest'
     project_title = project.title
-    project.delete()
+    with transaction.atomic():
+        release_frame_previews(project.frames.all())
+        project.delete()
     if is_ajax:
         return JsonResponse({
             'ok': True,
@@ -280,79 +495,260 @@ def project_delete(request, pk):
     return redirect('animation:project_list')
 
 
-@login_required
-@require_POST
-def project_save(request, pk):
-    project = get_object_or_404(AnimationProject, pk=pk, owner=request.user)
-
-    try:
-        payload = json.loads(request.body.decode('utf-8'))
-    except json.JSONDecodeError:
-        return JsonResponse({'ok': False, 'error': 'invalid_json'}, status=400)
+FRAME_SAVE_BATCH_SIZE = 500
+MAX_FRAME_CONTENT_BYTES = 1024 * 1024
 
-    frames = payload.get('frames')
-    if not isinstance(frames, list) or not frames:
-        return JsonResponse({'ok': False, 'error': 'no_frames'}, status=400)
 
-    saved_indices = []
-    for frame_data in frames:
+def parse_frame_payloads(frames):
+    """
+    Проверяет кадры из тела project_save: номер, содержимое-JSON и его размер.
+    Возвращает {index: content_json} и список ошибок по позициям в присланном массиве.
+    При повторе номера кадра побеждает последний.
+    """
+    contents = {}
+    errors = []
+    for position, frame_data in enumerate(frames):
         if not isinstance(frame_data, dict):
+            errors.append({'position': position, 'error': 'invalid_frame'})
             continue
 
         try:
             index = int(frame_data.get('index'))
         except (TypeError, ValueError):
+            errors.append({'position': position, 'error': 'invalid_index'})
+            continue
+        if index < 1:
+            errors.append({'position': position, 'index': index, 'error': 'invalid_index'})
             continue
 
         content = frame_data.get('content')
         if content is None:
+            errors.append({'position': position, 'index': index, 'error': 'no_content'})
             continue
 
         if isinstance(content, str):
+            try:
+                json.loads(content)
+            except json.JSONDecodeError:
+                errors.append({'position': position, 'index': index, 'error': 'invalid_content'})
+                continue
             content_json = content
         else:
             content_json = json.dumps(content, ensure_ascii=False)
+        if len(content_json.encode('utf-8')) > MAX_FRAME_CONTENT_BYTES:
+            errors.append({'position': position, 'index': index, 'error': 'content_too_large'})
+            continue
+        contents[index] = content_json
+    return contents, errors
+
+
+def save_project_frames(project, frames):
+    """
+    Массово сохраняет content_json кадров проекта: один запрос на чтение
+    существующих кадров, пачки bulk_create для новых и upsert содержимого вместо
+    update_or_create на каждый кадр. Вызывать внутри transaction.atomic().
+    Всё или ничего: если хоть один кадр не прошёл проверку, не сохраняется ни один.
+    Возвращает номера сохранённых кадров (новые кадры дописываются в конец) и ошибки.
+    """
+    contents, errors = parse_frame_payloads(frames)
+    if errors or not contents:
+        return [], errors
+
+    # блокируем проект, чтобы два параллельных сохранения не вставили один и тот же кадр
+    AnimationProject.objects.select_for_update().filter(pk=project.pk).first()
+
+    # номер кадра — ранг по position: нужный отрезок кадров берётся одним запросом с OFFSET
+    first_index = min(contents)
+    last_index = max(contents)
+    existing = list(
+        project.frames.order_by('position').only('id', 'project_id', 'position')[first_index - 1:last_index]
+    )
+    now = timezone.now()
+    revision = next_project_revision(project)
+    to_create = []
+    to_update = []
+    # (кадр, content_json): у новых кадров pk появится только после bulk_create
+    saved_contents = []
+    saved_indices = []
+    next_position = None
+    total = None
+    for index in sorted(contents):
+        content_json = contents[index]
+        offset = index - first_index
+        if offset < len(existing):
+            frame = existing[offset]
+            to_update.append(frame)
+            saved_contents.append((frame, content_json))
+            saved_indices.append(index)
+            continue
 
-        Frame.objects.update_or_create(
-            project=project,
-            index=index,
-            defaults={'content_json': content_json},
-        )
-        saved_indices.append(index)
+        # номеров с пропусками не бывает: кадры за концом проекта дописываются подряд
+        if next_position is None:
+            next_position = next_frame_position(project)
+            total = project.frames.count()
+        frame = Frame(project=project, position=next_position, revision=revision)
+        to_create.append(frame)
+        saved_contents.append((frame, content_json))
+        next_position += FRAME_POSITION_STEP
+        total += 1
+        saved_indices.append(total)
+
+    if to_create:
+        Frame.objects.bulk_create(to_create, batch_size=FRAME_SAVE_BATCH_SIZE)
+        create_default_layers(to_create)
+    save_frame_contents({frame.pk: content_json for frame, content_json in saved_contents})
+    if to_update:
+        # содержимое лежит в FrameContent; у самих кадров меняются только время и ревизия
+        for start in range(0, len(to_update), FRAME_SAVE_BATCH_SIZE):
+            batch = to_update[start:start + FRAME_SAVE_BATCH_SIZE]
+            Frame.objects.filter(pk__in=[frame.pk for frame in batch]).update(updated_at=now, revision=revision)
+    return saved_indices, errors
+
+
+@login_required
+@require_POST
+def project_save(request, pk):
+    project = get_object_or_404(AnimationProject, pk=pk, owner=request.user)
 
-    if not saved_indices:
-        return JsonResponse({'ok': False, 'error': 'no_valid_frames'}, status=400)
+    try:
+        payload = json.loads(request.body.decode('utf-8'))
+    except json.JSONDecodeError:
+        return JsonResponse({'ok': False, 'error': 'invalid_json'}, status=400)
+
+    frames = payload.get('frames')
+    if not isinstance(frames, list) or not frames:
+        return JsonResponse({'ok': False, 'error': 'no_frames'}, status=400)
+
+    with transaction.atomic():
+        saved_indices, errors = save_project_frames(project, frames)
+
+    if errors:
+        return JsonResponse({'ok': False, 'error': 'invalid_frames', 'errors': errors}, status=400)
 
-    project.save(update_fields=['updated_at'])
     return JsonResponse({'ok': True, 'saved_frames': saved_indices})
 
 
 @login_required
 @require_http_methods(["GET"])
 def frames_list(request, pk):
+    """
+    Список кадров с ETag по updated_at проекта: его сдвигает любое изменение
+    кадров, так что неизменный таймлайн стоит одного запроса и ответа 304.
+    С ?since=<ревизия> отдаёт только кадры, изменённые после неё, и id удалённых;
+    если ревизия клиента из будущего (база пересоздана) или старше надгробий,
+    которые уже удалил сборщик (gc_media), — снова полный список.
+    """
     project = get_object_or_404(AnimationProject, pk=pk, owner=request.user)
-    frames = project.frames.order_by('index', 'id')
-    return JsonResponse({
-        'ok': True,
-        'frames': [serialize_frame(frame) for frame in frames],
-    })
+
+    since = request.GET.get('since')
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            return JsonResponse({'ok': False, 'error': 'invalid_since'}, status=400)
+        if since < 0:
+            return JsonResponse({'ok': False, 'error': 'invalid_since'}, status=400)
+
+    def build_payload():
+        if since is None or since > project.revision or since < project.tombstones_pruned_revision:
+            frames = project.frames.with_index().select_related('preview_blob')
+            return {
+                'ok': True,
+                'full': True,
+                'revision': project.revision,
+                'frames': [serialize_frame(frame) for frame in frames],
+            }
+
+        changed = project.frames.filter(revision__gt=since).select_related('preview_blob').order_by('position')
+        deleted_ids = project.frame_tombstones.filter(revision__gt=since).values_list('frame_id', flat=True)
+        return {
+            'ok': True,
+            'full': False,
+            'revision': project.revision,
+            'frames': [serialize_frame_change(frame) for frame in changed],
+            'deleted_ids': list(deleted_ids),
+            'total': project.frames.count(),
+        }
+
+    etag = project_frames_etag(project, since)
+    return conditional_json_response(request, etag, project.updated_at, build_payload)
+
+
+def serialize_project(project):
+    return {
+        'id': project.pk,
+        'title': project.title,
+        'width': project.width,
+        'height': project.height,
+        'fps': project.fps,
+    }
+
+
+def iter_project_bundle(project):
+    """
+    Тело project_bundle по частям: сначала проект, потом кадры со слоями по одному.
+    Ревизия берётся до чтения кадров: если кадры меняются во время отдачи,
+    эти изменения придут клиенту в следующей ленте frames_list?since=.
+    """
+    has_content = FrameContent.objects.filter(frame=OuterRef('pk')).exclude(content_json='')
+    frames = (
+        project.frames.with_index()
+        .select_related('preview_blob')
+        .annotate(has_content=Exists(has_content))
+        .prefetch_related(Prefetch('layers', queryset=Layer.objects.order_by('order', 'id')))
+    )
+    head = json.dumps({'ok': True, 'project': serialize_project(project), 'revision': project.revision})
+    yield head[:-1] + ', "frames": ['
+    separator = ''
+    for frame in frames.iterator(chunk_size=PROJECT_BUNDLE_CHUNK_SIZE):
+        yield separator + json.dumps({
+            **serialize_frame(frame),
+            'has_content': frame.has_content,
+            'layers': [serialize_layer(layer) for layer in frame.layers.all()],
+        })
+        separator = ', '
+    yield ']}'
 
 
 @login_required
 @require_http_methods(["GET"])
-def frame_detail(request, pk, index):
+def project_bundle(request, pk):
+    """
+    Весь проект одним ответом: метаданные, кадры (как в frames_list) и слои каждого
+    кадра (как в frame_layers). Редактор открывается одним запросом и переключает
+    кадры без запросов за слоями. Ответ потоковый — проект любой длины не собирается
+    в памяти целиком. content_json кадров не отдаётся, только флаг has_content.
+    ETag, как у frames_list, идёт от updated_at проекта — его сдвигает и правка слоёв.
+    """
     project = get_object_or_404(AnimationProject, pk=pk, owner=request.user)
-    frame = get_object_or_404(Frame, project=project, index=index)
-    ensure_default_layer(frame)
-    layers = frame.layers.order_by('order', 'id')
-    return JsonResponse({
-        'ok': True,
-        'frame': {
-            **serialize_frame(frame),
-            'content_json': frame.content_json or '',
-        },
-        'layers': [serialize_layer(layer) for layer in layers],
-    })
+    etag = f'W/"bundle-{project.pk}-{project.updated_at.timestamp():.6f}"'
+    last_modified = int(project.updated_at.timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = StreamingHttpResponse(iter_project_bundle(project), content_type='application/json')
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@login_required
+@require_http_methods(["GET"])
+def frame_detail(request, pk, index):
+    frame = get_owned_frame_or_404(request.user, pk, index)
+
+    def build_payload():
+        layers = frame.layers.order_by('order', 'id')
+        return {
+            'ok': True,
+            'frame': {
+                **serialize_frame(frame),
+                'content_json': get_frame_content_json(frame),
+            },
+            'layers': [serialize_layer(layer) for layer in layers],
+        }
+
+    return conditional_json_response(request, frame_etag('frame', frame), frame.updated_at, build_payload)
 
 
 @login_required
@@ -372,65 +768,30 @@ def frame_create(request, pk):
         duplicate_from_index = None
 
     with transaction.atomic():
-        last_index = project.frames.aggregate(max_index=Max('index')).get('max_index') or 0
-        next_index = last_index + 1
-
-        new_frame = Frame.objects.create(project=project, index=next_index)
-
+        source = None
         if duplicate_from_index is not None:
             try:
-                source = Frame.objects.select_related('project').get(project=project, index=duplicate_from_index)
-            except Frame.DoesNotExist:
+                source = get_frame_or_404(project, duplicate_from_index)
+            except Http404:
                 source = None
 
-            if source is not None:
-                new_frame.content_json = source.content_json or ''
-
-                # копируем превью (файл) если оно есть
-                if source.preview_image:
-                    try:
-                        source.preview_image.open('rb')
-                        data = source.preview_image.read()
-                        if data:
-                            filename = f'project_{project.pk}_frame_{new_frame.index}.png'
-                            new_frame.preview_image.save(filename, ContentFile(data), save=False)
-                    except Exception:
-                        pass
-                    finally:
-                        try:
-                            source.preview_image.close()
-                        except Exception:
-                            pass
-
-                new_frame.save()
-
-                # копируем слои (метаданные)
-                source_layers = list(source.layers.order_by('order', 'id'))
-                if source_layers:
-                    Layer.objects.bulk_create([
-                        Layer(
-                            frame=new_frame,
-                            order=item.order,
-                            name=item.name,
-                            visible=item.visible,
-                            opacity=item.opacity,
-                        ) for item in source_layers
-                    ])
-                else:
-                    ensure_default_layer(new_frame)
-            else:
-                ensure_default_layer(new_frame)
+        if source is not None:
+            new_frame = duplicate_frames(project, [source], [next_frame_position(project)])[0]
         else:
-            ensure_default_layer(new_frame)
+            new_frame = Frame.objects.create(project=project, position=next_frame_position(project))
+            create_default_layers([new_frame])
 
-        project.save(update_fields=['updated_at'])
+        revision = record_frame_changes(project, [new_frame.pk])
+        # новый кадр всегда последний
+        total = project.frames.count()
+        new_frame.index = total
 
-    frames = project.frames.order_by('index', 'id')
     return JsonResponse({
         'ok': True,
         'active_index': new_frame.index,
         'frame': serialize_frame(new_frame),
-        'frames': [serialize_frame(frame) for frame in frames],
+        'total': total,
+        'revision': revision,
     })
 
 
@@ -438,34 +799,47 @@ def frame_create(request, pk):
 @require_POST
 def frame_delete(request, pk, index):
     project = get_object_or_404(AnimationProject, pk=pk, owner=request.user)
-    frame = get_object_or_404(Frame, project=project, index=index)
+    frame = get_frame_or_404(project, index)
 
+    deleted_id = frame.pk
+    created_frame = None
     with transaction.atomic():
+        release_frame_previews(project.frames.filter(pk=frame.pk))
         frame.delete()
 
         # если это был последний кадр — создаём новый пустой, чтобы проект не остался без кадров
-        if project.frames.count() == 0:
-            new_frame = Frame.objects.create(project=project, index=1)
-            ensure_default_layer(new_frame)
-            frames = [new_frame]
-        else:
-            frames = renumber_frames(project)
-        project.save(update_fields=['updated_at'])
-
-    # ближайший кадр: по позиции (после перенумерации)
-    next_total = len(frames)
-    next_active_index = min(max(1, index), next_total) if next_total else 1
+        total = project.frames.count()
+        if total == 0:
+            created_frame = Frame.objects.create(project=project, position=FRAME_POSITION_STEP)
+            created_frame.index = 1
+            create_default_layers([created_frame])
+            total = 1
+        revision = record_frame_changes(
+            project,
+            changed_pks=[created_frame.pk] if created_frame else [],
+            deleted_pks=[deleted_id],
+        )
 
+    # соседние кадры не перенумеровываются в базе: номера после удалённого
+    # просто сдвигаются на единицу, клиент делает это у себя
     return JsonResponse({
         'ok': True,
-        'active_index': next_active_index,
-        'frames': [serialize_frame(item) for item in frames],
+        'active_index': min(index, total),
+        'deleted_id': deleted_id,
+        'deleted_index': index,
+        'total': total,
+        'frame': serialize_frame(created_frame) if created_frame else None,
+        'revision': revision,
     })
 
 
 @login_required
 @require_POST
 def frame_reorder(request, pk):
+    """
+    Переносит один кадр (frame_id) на номер target_index.
+    Меняется только его position; в ответе — перенесённый кадр и старый/новый номер.
+    """
     project = get_object_or_404(AnimationProject, pk=pk, owner=request.user)
 
     try:
@@ -473,129 +847,369 @@ def frame_reorder(request, pk):
     except json.JSONDecodeError:
         return JsonResponse({'ok': False, 'error': 'invalid_json'}, status=400)
 
-    ordered_ids = payload.get('ordered_ids')
-    if not isinstance(ordered_ids, list):
+    try:
+        frame_id = int(payload.get('frame_id'))
+        target_index = int(payload.get('target_index'))
+    except (TypeError, ValueError):
+        return JsonResponse({'ok': False, 'error': 'invalid_order'}, status=400)
+    if target_index < 1:
         return JsonResponse({'ok': False, 'error': 'invalid_order'}, status=400)
 
-    normalized_ids = []
-    for item in ordered_ids:
-        try:
-            normalized_ids.append(int(item))
-        except (TypeError, ValueError):
-            continue
+    with transaction.atomic():
+        frame = get_object_or_404(Frame.objects.select_related('preview_blob'), project=project, pk=frame_id)
+        from_index = Frame.objects.index_of(frame)
+        total = project.frames.count()
+        target_index = min(target_index, total)
+        if target_index != from_index:
+            place_frames_at(project, [frame], target_index)
+            record_frame_changes(project, [frame.pk])
+        frame.index = target_index
+
+    return JsonResponse({
+        'ok': True,
+        'frame': serialize_frame(frame),
+        'from_index': from_index,
+        'to_index': target_index,
+        'revision': project.revision,
+    })
+
+
+def parse_frame_range(request):
+    """
+    Читает из JSON-тела start и end (номера кадров, включительно) и необязательный target.
+    Возвращает (start, end, target) или JsonResponse с ошибкой.
+    """
+    try:
+        payload = json.loads(request.body.decode('utf-8')) if request.body else {}
+    except json.JSONDecodeError:
+        return JsonResponse({'ok': False, 'error': 'invalid_json'}, status=400)
+
+    try:
+        start = int(payload.get('start'))
+        end = int(payload.get('end'))
+        target = payload.get('target')
+        target = int(target) if target is not None else None
+    except (TypeError, ValueError):
+        return JsonResponse({'ok': False, 'error': 'invalid_range'}, status=400)
+    if start < 1 or end < start:
+        return JsonResponse({'ok': False, 'error': 'invalid_range'}, status=400)
+    return start, end, target
+
+
+def get_frame_range(project, start, end):
+    """Кадры с номерами start..end одним запросом; None, если диапазон выходит за проект."""
+    frames = list(project.frames.select_related('preview_blob').order_by('position')[start - 1:end])
+    if len(frames) != end - start + 1:
+        return None
+    for index, frame in enumerate(frames, start=start):
+        frame.index = index
+    return frames
+
+
+@login_required
+@require_POST
+def frames_range_duplicate(request, pk):
+    """
+    Дублирует кадры start..end и вставляет копии подряд с номера target
+    (по умолчанию — сразу после end). Одна транзакция, копирование пачками.
+    """
+    project = get_object_or_404(AnimationProject, pk=pk, owner=request.user)
+    parsed = parse_frame_range(request)
+    if isinstance(parsed, JsonResponse):
+        return parsed
+    start, end, target = parsed
+    if target is None:
+        target = end + 1
 
     with transaction.atomic():
-        frames = reorder_frames(project, normalized_ids)
-        project.save(update_fields=['updated_at'])
+        sources = get_frame_range(project, start, end)
+        if sources is None:
+            return JsonResponse({'ok': False, 'error': 'invalid_range'}, status=400)
+        total = project.frames.count()
+        if not 1 <= target <= total + 1:
+            return JsonResponse({'ok': False, 'error': 'invalid_target'}, status=400)
+
+        positions = allocate_positions(project, target, len(sources))
+        new_frames = duplicate_frames(project, sources, positions)
+        for index, frame in enumerate(new_frames, start=target):
+            frame.index = index
+        revision = record_frame_changes(project, [frame.pk for frame in new_frames])
 
     return JsonResponse({
         'ok': True,
-        'frames': [serialize_frame(item) for item in frames],
+        'active_index': target,
+        'frames': [serialize_frame(frame) for frame in new_frames],
+        'total': total + len(new_frames),
+        'revision': revision,
     })
 
 
 @login_required
 @require_POST
-def frame_save(request, pk, index):
+def frames_range_delete(request, pk):
+    """Удаляет кадры start..end одним запросом; номера остальных в базе не меняются."""
     project = get_object_or_404(AnimationProject, pk=pk, owner=request.user)
-    frame = get_object_or_404(Frame, project=project, index=index)
+    parsed = parse_frame_range(request)
+    if isinstance(parsed, JsonResponse):
+        return parsed
+    start, end, _ = parsed
+
+    created_frame = None
+    with transaction.atomic():
+        frames = get_frame_range(project, start, end)
+        if frames is None:
+            return JsonResponse({'ok': False, 'error': 'invalid_range'}, status=400)
+        deleted_ids = [frame.pk for frame in frames]
+        release_frame_previews(Frame.objects.filter(pk__in=deleted_ids))
+        Frame.objects.filter(pk__in=deleted_ids).delete()
+
+        # если удалили всё — создаём новый пустой кадр, чтобы проект не остался без кадров
+        total = project.frames.count()
+        if total == 0:
+            created_frame = Frame.objects.create(project=project, position=FRAME_POSITION_STEP)
+            created_frame.index = 1
+            create_default_layers([created_frame])
+            total = 1
+        revision = record_frame_changes(
+            project,
+            changed_pks=[created_frame.pk] if created_frame else [],
+            deleted_pks=deleted_ids,
+        )
+
+    return JsonResponse({
+        'ok': True,
+        'active_index': min(start, total),
+        'deleted_ids': deleted_ids,
+        'total': total,
+        'frame': serialize_frame(created_frame) if created_frame else None,
+        'revision': revision,
+    })
 
-    try:
-        payload = json.loads(request.body.decode('utf-8'))
-    except json.JSONDecodeError:
-        return JsonResponse({'ok': False, 'error': 'Некорректный JSON.'}, status=400)
 
-    if not isinstance(payload, dict):
-        return JsonResponse({'ok': False, 'error': 'Некорректный формат данных.'}, status=400)
+@login_required
+@require_POST
+def frames_range_move(request, pk):
+    """
+    Переносит кадры start..end так, чтобы первый из них получил номер target.
+    Меняются только строки переносимых кадров.
+    """
+    project = get_object_or_404(AnimationProject, pk=pk, owner=request.user)
+    parsed = parse_frame_range(request)
+    if isinstance(parsed, JsonResponse):
+        return parsed
+    start, end, target = parsed
 
-    image_data = payload.get('image_data')
-    content_json = payload.get('content_json')
+    with transaction.atomic():
+        frames = get_frame_range(project, start, end)
+        if frames is None:
+            return JsonResponse({'ok': False, 'error': 'invalid_range'}, status=400)
+        total = project.frames.count()
+        if target is None or not 1 <= target <= total - len(frames) + 1:
+            return JsonResponse({'ok': False, 'error': 'invalid_target'}, status=400)
+
+        if target != start:
+            place_frames_at(project, frames, target)
+            record_frame_changes(project, [frame.pk for frame in frames])
+        for index, frame in enumerate(frames, start=target):
+            frame.index = index
 
-    if isinstance(image_data, str):
-        image_data = image_data.strip()
-        if not image_data:
-            image_data = None
+    return JsonResponse({
+        'ok': True,
+        'frames': [serialize_frame(frame) for frame in frames],
+        'from_index': start,
+        'to_index': target,
+        'revision': project.revision,
+    })
 
-    if image_data is None and content_json is None:
-        return JsonResponse({'ok': False, 'error': 'Нет данных для сохранения.'}, status=400)
 
-    if image_data is not None:
-        if not isinstance(image_data, str):
-            return JsonResponse({'ok': False, 'error': 'Некорректные данные изображения.'}, status=400)
+IMAGE_MIME_EXTENSIONS = {
+    'image/png': 'png',
+    'image/jpeg': 'jpg',
+    'image/webp': 'webp',
+}
 
-        header = ''
-        encoded = image_data
-        if image_data.startswith('data:'):
-            try:
-                header, encoded = image_data.split(',', 1)
-            except ValueError:
-                return JsonResponse({'ok': False, 'error': 'Некорректные данные изображения.'}, status=400)
-            encoded = encoded.strip()
 
+def too_large_image_response():
+    max_mb = MAX_PREVIEW_IMAGE_BYTES // (1024 * 1024)
+    return JsonResponse({
+        'ok': False,
+        'error': f'Изображение слишком большое. Максимум {max_mb} МБ.',
+    }, status=413)
+
+
+def decode_data_url_image(image_data):
+    """
+    Разбирает data URL / base64 из старого JSON-формата сохранения.
+    Возвращает (bytes, extension) либо JsonResponse с ошибкой.
+    """
+    if not isinstance(image_data, str):
+        return JsonResponse({'ok': False, 'error': 'Некорректные данные изображения.'}, status=400)
+
+    header = ''
+    encoded = image_data
+    if image_data.startswith('data:'):
         try:
-            decoded = base64.b64decode(encoded, validate=True)
-        except (BinasciiError, ValueError):
+            header, encoded = image_data.split(',', 1)
+        except ValueError:
             return JsonResponse({'ok': False, 'error': 'Некорректные данные изображения.'}, status=400)
+        encoded = encoded.strip()
 
-        if not decoded:
-            return JsonResponse({'ok': False, 'error': 'Пустое изображение.'}, status=400)
+    try:
+        decoded = base64.b64decode(encoded, validate=True)
+    except (BinasciiError, ValueError):
+        return JsonResponse({'ok': False, 'error': 'Некорректные данные изображения.'}, status=400)
 
-        if len(decoded) > MAX_PREVIEW_IMAGE_BYTES:
-            max_mb = MAX_PREVIEW_IMAGE_BYTES // (1024 * 1024)
-            return JsonResponse({
-                'ok': False,
-                'error': f'Изображение слишком большое. Максимум {max_mb} МБ.',
-            }, status=413)
-
-        extension = 'png'
-        if header.startswith('data:'):
-            mime_type = header.split(';', 1)[0][5:]
-            if mime_type == 'image/jpeg':
-                extension = 'jpg'
-            elif mime_type == 'image/webp':
-                extension = 'webp'
-            elif mime_type == 'image/png':
-                extension = 'png'
-
-        filename = f'project_{project.pk}_frame_{frame.index}.{extension}'
-        frame.preview_image.save(filename, ContentFile(decoded), save=False)
-
-    if content_json is not None:
-        if isinstance(content_json, str):
-            frame.content_json = content_json
-        else:
-            try:
-                frame.content_json = json.dumps(content_json, ensure_ascii=False)
-            except (TypeError, ValueError):
-                return JsonResponse({'ok': False, 'error': 'Некорректные данные JSON.'}, status=400)
+    if not decoded:
+        return JsonResponse({'ok': False, 'error': 'Пустое изображение.'}, status=400)
 
-    frame.save()
-    project.save(update_fields=['updated_at'])
+    if len(decoded) > MAX_PREVIEW_IMAGE_BYTES:
+        return too_large_image_response()
+
+    extension = 'png'
+    if header.startswith('data:'):
+        mime_type = header.split(';', 1)[0][5:]
+        extension = IMAGE_MIME_EXTENSIONS.get(mime_type, 'png')
+    return decoded, extension
+
+
+CONTENT_HASH_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def get_request_content_hash(request):
+    """SHA-256 содержимого кадра из заголовка If-None-Match ("<hex>"), иначе ''."""
+    value = request.headers.get('If-None-Match', '').strip()
+    if value.startswith('W/'):
+        value = value[2:]
+    value = value.strip('"').lower()
+    return value if CONTENT_HASH_RE.match(value) else ''
+
+
+def unchanged_frame_response(request, pk, index):
+    """
+    Условная запись: если у кадра уже сохранено содержимое с хэшем из If-None-Match,
+    отвечаем 412 до разбора тела запроса — без загрузки файлов и записи в базу.
+    Ничего не меняет, поэтому вызывается до проверки CSRF.
+    """
+    content_hash = get_request_content_hash(request)
+    if not content_hash:
+        return None
+    frame = get_owned_frame_or_404(request.user, pk, index)
+    if frame.content_hash != content_hash:
+        return None
+    return JsonResponse({'ok': False, 'error': 'unchanged', 'frame': serialize_frame(frame)}, status=412)
+
+
+@csrf_exempt
+@login_required
+@require_POST
+def frame_save(request, pk, index):
+    unchanged = unchanged_frame_response(request, pk, index)
+    if unchanged is not None:
+        return unchanged
+
+    # Для multipart обработчик загрузки нужно поставить до первого обращения к request.POST,
+    # поэтому CSRF проверяется уже внутри _frame_save (см. документацию Django по upload handlers).
+    upload_handler = None
+    if request.content_type == 'multipart/form-data':
+        upload_handler = MaxFileSizeUploadHandler(request, max_bytes=MAX_PREVIEW_IMAGE_BYTES)
+        request.upload_handlers.insert(0, upload_handler)
+    return _frame_save(request, pk, index, upload_handler)
+
+
+@csrf_protect
+def _frame_save(request, pk, index, upload_handler=None):
+    frame = get_owned_frame_or_404(request.user, pk, index)
+    project = frame.project
+
+    image_file = None
+    extension = 'png'
+
+    if upload_handler is not None:
+        # бинарный путь: файл из toBlob() уже лежит в памяти/временном файле, без base64.
+        # Тело разбирается при первом обращении к request.FILES — флаг exceeded известен только после него
+        image_file = request.FILES.get('image')
+        if upload_handler.exceeded:
+            return too_large_image_response()
+        content_json = request.POST.get('content_json')
+        if image_file is not None:
+            if not image_file.size:
+                return JsonResponse({'ok': False, 'error': 'Пустое изображение.'}, status=400)
+            extension = IMAGE_MIME_EXTENSIONS.get(image_file.content_type, 'png')
+    else:
+        try:
+            payload = json.loads(request.body.decode('utf-8'))
+        except json.JSONDecodeError:
+            return JsonResponse({'ok': False, 'error': 'Некорректный JSON.'}, status=400)
+
+        if not isinstance(payload, dict):
+            return JsonResponse({'ok': False, 'error': 'Некорректный формат данных.'}, status=400)
+
+        image_data = payload.get('image_data')
+        content_json = payload.get('content_json')
+
+        if isinstance(image_data, str):
+            image_data = image_data.strip()
+            if not image_data:
+                image_data = None
+
+        if image_data is not None:
+            decoded = decode_data_url_image(image_data)
+            if isinstance(decoded, JsonResponse):
+                return decoded
+            data, extension = decoded
+            image_file = ContentFile(data)
+
+    if image_file is None and content_json is None:
+        return JsonResponse({'ok': False, 'error': 'Нет данных для сохранения.'}, status=400)
+
+    if content_json is not None and not isinstance(content_json, str):
+        try:
+            content_json = json.dumps(content_json, ensure_ascii=False)
+        except (TypeError, ValueError):
+            return JsonResponse({'ok': False, 'error': 'Некорректные данные JSON.'}, status=400)
+
+    with transaction.atomic():
+        if image_file is not None:
+            # превью меняется вместе с кадром: при ошибке сохранения ссылки блобов откатываются.
+            # Строка кадра блокируется и старое превью перечитывается — параллельное
+            # сохранение не снимет ссылку с одного и того же блоба дважды
+            frame.preview_blob_id = (
+                Frame.objects.select_for_update().values_list('preview_blob_id', flat=True).get(pk=frame.pk)
+            )
+            # одинаковые байты (пустой кадр, повторное автосохранение) — только ссылка на готовый блоб
+            set_frame_preview(frame, image_file.read(), extension)
+            frame.content_hash = get_request_content_hash(request)
+        if content_json is not None:
+            save_frame_contents({frame.pk: content_json})
+        frame.save()
+        revision = record_frame_changes(project, [frame.pk])
 
     return JsonResponse({
         'ok': True,
         'frame': {
             'id': frame.pk,
             'index': frame.index,
-            'preview_url': frame.preview_image.url if frame.preview_image else '',
+            'preview_url': get_preview_url(frame),
             'updated_at': frame.updated_at.isoformat() if frame.updated_at else '',
         },
+        'revision': revision,
     })
 
 
 @login_required
 @require_http_methods(["GET", "POST"])
 def frame_layers(request, pk, index):
-    project = get_object_or_404(AnimationProject, pk=pk, owner=request.user)
-    frame = get_object_or_404(Frame, project=project, index=index)
-    ensure_default_layer(frame)
+    frame = get_owned_frame_or_404(request.user, pk, index)
 
     if request.method == 'GET':
-        layers = frame.layers.order_by('order', 'id')
-        return JsonResponse({
-            'ok': True,
-            'layers': [serialize_layer(layer) for layer in layers],
-        })
+        def build_payload():
+            layers = frame.layers.order_by('order', 'id')
+            return {
+                'ok': True,
+                'layers': [serialize_layer(layer) for layer in layers],
+            }
+
+        return conditional_json_response(request, frame_etag('layers', frame), frame.updated_at, build_payload)
 
     try:
         payload = json.loads(request.body.decode('utf-8')) if request.body else {}
@@ -615,17 +1229,201 @@ def frame_layers(request, pk, index):
         visible=True,
         opacity=100,
     )
+    touch_frame(frame)
     return JsonResponse({
         'ok': True,
         'layer': serialize_layer(layer),
     })
 
 
+@csrf_exempt
+@login_required
+@require_POST
+def layers_save(request, pk, index):
+    unchanged = unchanged_frame_response(request, pk, index)
+    if unchanged is not None:
+        return unchanged
+
+    upload_handler = MaxFileSizeUploadHandler(request, max_bytes=MAX_PREVIEW_IMAGE_BYTES)
+    request.upload_handlers.insert(0, upload_handler)
+    return _layers_save(request, pk, index, upload_handler)
+
+
+@csrf_protect
+def _layers_save(request, pk, index, upload_handler):
+    """
+    Сохраняет пиксели только изменённых слоёв; плоское превью кадра после последней
+    пачки пересобирает rasters.schedule_frame_rasters (воркером или сразу после коммита).
+
+    В multipart принимаются поля:
+    - tile_<layerId>_<col>_<row> — PNG плитки RASTER_TILE_SIZE x RASTER_TILE_SIZE,
+      заменяет соответствующий квадрат слоя;
+    - layer_<id> — PNG слоя целиком, заменяет растр и сбрасывает его плитки;
+    - compose_preview=0 — не ставить пересборку превью (промежуточная пачка плиток).
+    """
+    frame = get_owned_frame_or_404(request.user, pk, index)
+    project = frame.project
+
+    # обращение к request.FILES разбирает тело; только после него известно, превышен ли лимит
+    uploaded_files = request.FILES
+    if upload_handler.exceeded:
+        return too_large_image_response()
+
+    layers = list(frame.layers.order_by('order', 'id'))
+    id_to_layer = {layer.pk: layer for layer in layers}
+    grid_cols, grid_rows = tile_grid_size(project.width, project.height)
+
+    updated_layers = []
+    uploaded_tiles = {}
+    for field_name, uploaded in uploaded_files.items():
+        if field_name.startswith('layer_'):
+            try:
+                layer_id = int(field_name[len('layer_'):])
+            except ValueError:
+                return JsonResponse({'ok': False, 'error': 'invalid_layer'}, status=400)
+            layer = id_to_layer.get(layer_id)
+            if layer is None:
+                return JsonResponse({'ok': False, 'error': 'invalid_layer'}, status=400)
+            if not uploaded.size:
+                return JsonResponse({'ok': False, 'error': 'Пустое изображение.'}, status=400)
+            updated_layers.append((layer, uploaded))
+        elif field_name.startswith('tile_'):
+            try:
+                layer_id, col, row = (int(part) for part in field_name[len('tile_'):].split('_'))
+            except ValueError:
+                return JsonResponse({'ok': False, 'error': 'invalid_tile'}, status=400)
+            layer = id_to_layer.get(layer_id)
+            if layer is None:
+                return JsonResponse({'ok': False, 'error': 'invalid_layer'}, status=400)
+            if not (0 <= col < grid_cols and 0 <= row < grid_rows):
+                return JsonResponse({'ok': False, 'error': 'invalid_tile'}, status=400)
+            if not uploaded.size:
+                return JsonResponse({'ok': False, 'error': 'Пустое изображение.'}, status=400)
+            uploaded_tiles[(layer.pk, col, row)] = uploaded
+
+    # целиком заменённый слой делает его плитки из этого же запроса лишними
+    replaced_ids = {layer.pk for layer, _ in updated_layers}
+    uploaded_tiles = {key: value for key, value in uploaded_tiles.items() if key[0] not in replaced_ids}
+
+    with transaction.atomic():
+        # та же блокировка, что у задачи frame_rasters: сборка плиток не перезапишет этот запрос
+        Frame.objects.select_for_update().filter(pk=frame.pk).first()
+        for layer, uploaded in updated_layers:
+            filename = f'project_{project.pk}_layer_{layer.pk}.png'
+            layer.raster.save(filename, uploaded, save=False)
+        if replaced_ids:
+            LayerTile.objects.filter(layer_id__in=replaced_ids).delete()
+
+        if uploaded_tiles:
+            tile_layer_ids = {layer_id for layer_id, _, _ in uploaded_tiles}
+            existing = {
+                (tile.layer_id, tile.col, tile.row): tile
+                for tile in LayerTile.objects.filter(layer_id__in=tile_layer_ids)
+            }
+            to_create = []
+            to_update = []
+            for (layer_id, col, row), uploaded in uploaded_tiles.items():
+                tile = existing.get((layer_id, col, row))
+                if tile is None:
+                    tile = LayerTile(layer_id=layer_id, col=col, row=row)
+                    to_create.append(tile)
+                else:
+                    to_update.append(tile)
+                filename = f'project_{project.pk}_layer_{layer_id}_tile_{col}_{row}.png'
+                tile.image.save(filename, uploaded, save=False)
+            if to_create:
+                LayerTile.objects.bulk_create(to_create)
+            if to_update:
+                LayerTile.objects.bulk_update(to_update, ['image'])
+
+        touched_ids = replaced_ids | {layer_id for layer_id, _, _ in uploaded_tiles}
+        touched_layers = [id_to_layer[layer_id] for layer_id in touched_ids]
+        for layer in touched_layers:
+            layer.raster_version += 1
+        if touched_layers:
+            Layer.objects.bulk_update(touched_layers, ['raster', 'raster_version'])
+
+        if request.POST.get('compose_preview') != '0':
+            # превью сводит и плитки вклеивает задача frame_rasters, а без воркера —
+            # rebuild_frame_rasters сразу после коммита; новое превью придёт в frames_list?since=
+            schedule_frame_rasters(frame)
+            frame.content_hash = get_request_content_hash(request)
+        else:
+            # промежуточная пачка: кадр сохранён не целиком
+            frame.content_hash = ''
+        frame.save()
+        revision = record_frame_changes(project, [frame.pk])
+
+    return JsonResponse({
+        'ok': True,
+        'frame': serialize_frame(frame),
+        'layers': [serialize_layer(layer) for layer in layers],
+        'saved_layer_ids': sorted(touched_ids),
+        'revision': revision,
+    })
+
+
+@login_required
+@require_GET
+def layer_raster(request, layer_id):
+    """
+    Отдаёт пиксели слоя одним PNG. Только читает: плитки, которые задача frame_rasters
+    ещё не вклеила в базовый растр, накладываются в памяти.
+    URL содержит ?v=<raster_version>, поэтому ответ можно долго кэшировать.
+    """
+    layer = get_object_or_404(
+        Layer.objects.select_related('frame__project'),
+        pk=layer_id,
+        frame__project__owner=request.user,
+    )
+    project = layer.frame.project
+    tiles = list(layer.tiles.all())
+    if tiles:
+        image = open_layer_image(layer, (project.width, project.height), tiles=tiles)
+        response = HttpResponse(encode_png(image), content_type='image/png')
+    elif layer.raster:
+        response = FileResponse(layer.raster.open('rb'), content_type='image/png')
+    else:
+        raise Http404('У слоя нет сохранённых пикселей.')
+    response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+
+def user_has_blob(user, sha256):
+    """
+    Блоб — превью кадра одного из проектов пользователя. Одинаковые превью разных
+    пользователей — один блоб, так что по хэшу его получит любой из владельцев.
+    """
+    return Frame.objects.filter(preview_blob__sha256=sha256, project__owner=user).exists()
+
+
+@login_required
+@require_http_methods(["GET", "HEAD"])
+def blob_file(request, sha256, extension):
+    """
+    Файл блоба (превью кадра) по хэшу содержимого. Адрес меняется вместе с байтами,
+    поэтому браузер хранит ответ год и не перепроверяет его (immutable).
+    Отдаётся только владельцу проекта, кадр которого ссылается на блоб.
+    """
+    content_type = next((mime for mime, known in IMAGE_MIME_EXTENSIONS.items() if known == extension), None)
+    if content_type is None or not user_has_blob(request.user, sha256):
+        raise Http404('Файл не найден.')
+    return serve_media_file(request, blob_path(sha256, extension), content_type, f'"{sha256}"')
+
+
+@login_required
+@require_http_methods(["GET", "HEAD"])
+def thumbnail_file(request, sha256, size):
+    size = int(size)
+    if size not in THUMBNAIL_SIZES or not user_has_blob(request.user, sha256):
+        raise Http404('Файл не найден.')
+    return serve_media_file(request, thumbnail_path(sha256, size), 'image/webp', f'"{sha256}-{size}"')
+
+
 @login_required
 @require_POST
 def layer_update(request, pk, index, layer_id):
-    project = get_object_or_404(AnimationProject, pk=pk, owner=request.user)
-    frame = get_object_or_404(Frame, project=project, index=index)
+    frame = get_owned_frame_or_404(request.user, pk, index)
     layer = get_object_or_404(Layer, frame=frame, pk=layer_id)
 
     try:
@@ -656,6 +1454,7 @@ def layer_update(request, pk, index, layer_id):
 
     if update_fields:
         layer.save(update_fields=update_fields)
+        touch_frame(frame)
 
     return JsonResponse({
         'ok': True,
@@ -666,12 +1465,12 @@ def layer_update(request, pk, index, layer_id):
 @login_required
 @require_POST
 def layer_delete(request, pk, index, layer_id):
-    project = get_object_or_404(AnimationProject, pk=pk, owner=request.user)
-    frame = get_object_or_404(Frame, project=project, index=index)
+    frame = get_owned_frame_or_404(request.user, pk, index)
     layer = get_object_or_404(Layer, frame=frame, pk=layer_id)
     layer.delete()
     ensure_default_layer(frame)
     reorder_layers(frame)
+    touch_frame(frame)
     layers = frame.layers.order_by('order', 'id')
     return JsonResponse({
         'ok': True,
@@ -682,9 +1481,7 @@ def layer_delete(request, pk, index, layer_id):
 @login_required
 @require_POST
 def layer_reorder(request, pk, index):
-    project = get_object_or_404(AnimationProject, pk=pk, owner=request.user)
-    frame = get_object_or_404(Frame, project=project, index=index)
-    ensure_default_layer(frame)
+    frame = get_owned_frame_or_404(request.user, pk, index)
 
     try:
         payload = json.loads(request.body.decode('utf-8')) if request.body else {}
@@ -703,8 +1500,104 @@ def layer_reorder(request, pk, index):
             continue
 
     reorder_layers(frame, normalized_ids)
+    touch_frame(frame)
     layers = frame.layers.order_by('order', 'id')
     return JsonResponse({
         'ok': True,
         'layers': [serialize_layer(layer) for layer in layers],
     })
+
+
+JOBS_LIST_LIMIT = 20
+
+
+def serialize_job(job):
+    result = job.result or {}
+    download_url = ''
+    if job.status == Job.STATUS_SUCCEEDED and result.get('file'):
+        try:
+            download_url = default_storage.url(result['file'])
+        except Exception:
+            download_url = ''
+    return {
+        'id': job.pk,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': {'done': job.progress_done, 'total': job.progress_total},
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'cancel_requested': job.cancel_requested,
+        'error': job.error if job.status == Job.STATUS_FAILED else '',
+        'result': result,
+        'download_url': download_url,
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def job_json_response(job, status=200):
+    response = JsonResponse({'ok': True, 'job': serialize_job(job)}, status=status)
+    # статус опрашивают, пока задача идёт — ответ не должен оседать в кэшах
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+@login_required
+@require_POST
+def project_export(request, pk):
+    """
+    Ставит экспорт проекта в очередь фоновых задач (run_jobs) и сразу отвечает 202
+    с задачей; дальше клиент опрашивает job_detail до готовности.
+    """
+    project = get_object_or_404(AnimationProject, pk=pk, owner=request.user)
+
+    try:
+        payload = json.loads(request.body.decode('utf-8')) if request.body else {}
+    except json.JSONDecodeError:
+        return JsonResponse({'ok': False, 'error': 'invalid_json'}, status=400)
+
+    export_format = payload.get('format')
+    if export_format not in available_export_formats():
+        return JsonResponse({'ok': False, 'error': 'unsupported_format'}, status=400)
+
+    params = {'format': export_format}
+    for side in ('width', 'height'):
+        if payload.get(side) is None:
+            continue
+        try:
+            params[side] = int(payload[side])
+        except (TypeError, ValueError):
+            return JsonResponse({'ok': False, 'error': 'invalid_size'}, status=400)
+    try:
+        export_size(project, params.get('width'), params.get('height'))
+    except ExportError:
+        return JsonResponse({'ok': False, 'error': 'invalid_size'}, status=400)
+
+    job = enqueue_job('export', params, project=project, owner=request.user)
+    return job_json_response(job, status=202)
+
+
+@login_required
+@require_GET
+def project_jobs(request, pk):
+    project = get_object_or_404(AnimationProject, pk=pk, owner=request.user)
+    jobs = project.jobs.order_by('-created_at', '-pk')[:JOBS_LIST_LIMIT]
+    response = JsonResponse({'ok': True, 'jobs': [serialize_job(job) for job in jobs]})
+    response['Cache-Control'] = 'no-store'
+    return response
+
+
+@login_required
+@require_GET
+def job_detail(request, job_id):
+    job = get_object_or_404(Job, pk=job_id, owner=request.user)
+    return job_json_response(job)
+
+
+@login_required
+@require_POST
+def job_cancel(request, job_id):
+    job = get_object_or_404(Job, pk=job_id, owner=request.user)
+    if job.status in Job.FINISHED_STATUSES:
+        return JsonResponse({'ok': False, 'error': 'job_finished', 'job': serialize_job(job)}, status=409)
+    return job_json_response(cancel_job(job))